@@ -0,0 +1,147 @@
+"""Import time budget of the package's entry paths, measured with ``python -X importtime``.
+
+Each path imports a set of modules in a fresh interpreter, `repeats` times. The cost of a path is the minimum over the
+repeats of the cumulative import time of everything it loads, modules the bare interpreter loads at startup excluded.
+A path fails when its cost is over its budget or when it loads a module it must not depend on, e.g. the library path
+loading numpy or spade, or when its import fails. Exit code is 1 if any path fails. Paths whose third-party
+dependencies are not installed are skipped.
+
+Usage: python -m benchmarks.bench_import [-k FILTER] [-r REPEATS] [--budget PATH=MS ...] [--top N]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (modules imported, budget in ms, modules that must not be loaded)
+PATHS = {
+    "cli": (["industry2.__main__"], 50, ["numpy", "spade", "PyQt5", "dataclasses_json", "asyncio"]),
+    "library": (["industry2.layout", "industry2.order_queue", "industry2.trace", "industry2.metrics",
+                 "industry2.spatial", "industry2.determinism"], 250, ["numpy", "spade", "PyQt5"]),
+    "headless": (["industry2.agents", "industry2.stream"], 1500, ["PyQt5"]),
+    "viewer": (["industry2.factory_gui"], 1500, ["spade"]),
+}
+
+MISSING_EXIT_CODE = 3  # exit code of a child missing a third-party dependency
+
+# Imports in the child, a missing third-party module exits with `MISSING_EXIT_CODE`, any other error fails
+CHILD_CODE = """import sys
+try:
+    {imports}
+except ModuleNotFoundError as e:
+    if not e.name or e.name.split(".")[0] == "industry2":
+        raise
+    sys.stderr.write(f"missing dependency {{e.name}}\\n")
+    sys.exit({exit_code})
+"""
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def parse_importtime(stderr: str) -> list:
+    """Parses ``-X importtime`` output.
+
+    :return: (module, self us, cumulative us, depth) of each import, in output order
+    """
+    imports = []
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if match is not None:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return imports
+
+
+def run_importtime(modules: list) -> list:
+    """Imports `modules` in a fresh interpreter, see `parse_importtime`.
+
+    :raise ModuleNotFoundError: if a third-party dependency is missing
+    :raise RuntimeError: if the import failed otherwise
+    """
+    imports = "; ".join(f"import {module}" for module in modules) or "pass"
+    code = CHILD_CODE.format(imports=imports, exit_code=MISSING_EXIT_CODE)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                            cwd=ROOT)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        error = errors[-1] if errors else f"exit code {result.returncode}"
+        if result.returncode == MISSING_EXIT_CODE:
+            raise ModuleNotFoundError(error)
+        raise RuntimeError(error)
+    return parse_importtime(result.stderr)
+
+
+def measure(modules: list, startup: set, repeats: int) -> dict:
+    """Measures a path, see module docs.
+
+    :param startup: Modules loaded by the bare interpreter.
+    :return: dict with ``ms`` (cost), ``modules`` (loaded by the path) and ``roots`` (top-level package -> ms)
+    """
+    best = None
+    for _ in range(repeats):
+        imports = [entry for entry in run_importtime(modules) if entry[0] not in startup]
+        total = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+        if best is None or total < best[0]:
+            best = total, imports
+    total, imports = best
+    roots = {}
+    for module, self_us, _, _ in imports:
+        root = module.split(".")[0]
+        roots[root] = roots.get(root, 0) + self_us / 1e3
+    return {"ms": total / 1e3, "modules": [module for module, _, _, _ in imports], "roots": roots}
+
+
+def forbidden_loaded(loaded: list, forbidden: list) -> list:
+    return sorted({root for root in forbidden for module in loaded if module == root or module.startswith(root + ".")})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks import time budgets of the package's entry paths.")
+    parser.add_argument('-k', '--filter', default="", help="measure paths whose name contains this")
+    parser.add_argument('-r', '--repeats', type=int, default=5)
+    parser.add_argument('--budget', nargs='+', default=[], metavar="PATH=MS", help="override budgets")
+    parser.add_argument('--top', type=int, default=5, help="heaviest top-level packages shown per path")
+    args = parser.parse_args()
+
+    budgets = {name: budget for name, (_, budget, _) in PATHS.items()}
+    for override in args.budget:
+        name, _, ms = override.partition("=")
+        if name not in PATHS:
+            parser.error(f"unknown path {name!r}, one of {', '.join(PATHS)}")
+        budgets[name] = float(ms)
+
+    startup = {module for module, _, _, _ in run_importtime([])}
+    failed = []
+    print(f"{'path':<10} {'ms':>8} {'budget':>8}  heaviest packages (self ms)")
+    for name, (modules, _, forbidden) in PATHS.items():
+        if args.filter not in name:
+            continue
+        try:
+            result = measure(modules, startup, args.repeats)
+        except ModuleNotFoundError as e:
+            print(f"{name:<10} skipped: {e}")
+            continue
+        except RuntimeError as e:
+            print(f"{name:<10} error: {e}")
+            failed.append(f"{name}: import failed")
+            continue
+        heaviest = sorted(result["roots"].items(), key=lambda item: -item[1])[:args.top]
+        print(f"{name:<10} {result['ms']:8.1f} {budgets[name]:8.0f}  "
+              + ", ".join(f"{root} {ms:.1f}" for root, ms in heaviest))
+        if result["ms"] > budgets[name]:
+            failed.append(f"{name}: {result['ms']:.1f} ms over budget of {budgets[name]:.0f} ms")
+        loaded = forbidden_loaded(result["modules"], forbidden)
+        if loaded:
+            failed.append(f"{name}: loads {', '.join(loaded)}")
+
+    for failure in failed:
+        print(f"FAILED {failure}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Memory footprint of orders and robots, measured with `tracemalloc`.
+
+Reports bytes allocated per queued order (`Order` in an `OrderQueue`, as kept by `Manager`), per order in progress
+(`ActiveOrder`), per `GoMOrder` and `Point`, and per `TransportRobotAgent` (skipped if spade can't be imported).
+A case fails when it allocates more than its budget per item, e.g. when a class loses its ``__slots__``. Exit code is 1
+if any case fails.
+
+Usage: python -m benchmarks.bench_memory [-n ORDERS] [--trs N]
+"""
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+
+from industry2.common import GoMOrder, Order, Point
+from industry2.enums import Operation
+from industry2.order_queue import OrderQueue
+
+# case -> upper bound of bytes per item, cases missing aren't checked
+BUDGETS = {
+    "queued Order": 640,
+    "GoMOrder": 128,
+    "Point": 128,
+}
+
+
+def bytes_per_item(build, n: int) -> float:
+    """Returns bytes allocated by `build(n)` and still alive, per item."""
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    kept = build(n)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return (current - start) / n
+
+
+def make_specs(n: int):
+    rng = random.Random(0)
+    op_list = list(Operation)
+    return [(rng.randint(0, 3), [rng.choice(op_list) for _ in range(rng.randint(3, 10))]) for _ in range(n)]
+
+
+def queued_orders(specs):
+    def build(n):
+        queue = OrderQueue()
+        for i, (priority, operations) in enumerate(specs[:n]):
+            queue.push(Order.create(priority, i, operations, [3] * len(operations)))
+        return queue
+    return build
+
+
+def active_orders(specs):
+    from industry2.agents import ActiveOrder
+
+    def build(n):
+        return {str(i): ActiveOrder(Order.create(priority, i, operations, [3] * len(operations)), "")
+                for i, (priority, operations) in enumerate(specs[:n])}
+    return build
+
+
+def gom_orders(specs):
+    orders = [Order.create(priority, i, operations, [3] * len(operations))
+              for i, (priority, operations) in enumerate(specs)]
+
+    def build(n):
+        return [GoMOrder.create(order, "gom-1@localhost") for order in orders[:n]]
+    return build
+
+
+def points(n):
+    return [Point(float(i), float(-i)) for i in range(n)]
+
+
+def robots(n):
+    import industry2.settings as settings
+    from industry2.agents import TransportRobotAgent
+
+    jids = [f"tr-{i}@localhost" for i in range(1, n + 1)]
+    tr_goms = {jid: f"gom-{i}@localhost" for i, jid in enumerate(jids, start=1)}
+    return [TransportRobotAgent(position=Point(0., 0.), gom_jid=tr_goms[jid], factory_jid="factory@localhost",
+                                factory_map={}, tr_jids=jids, jid=jid, password=settings.PASSWORD)
+            for jid in jids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports memory footprint of orders and robots.")
+    parser.add_argument('-n', '--orders', type=int, default=100000)
+    parser.add_argument('--trs', type=int, default=1000)
+    args = parser.parse_args()
+
+    specs = make_specs(args.orders)
+    cases = [
+        ("queued Order", lambda: bytes_per_item(queued_orders(specs), args.orders)),
+        ("ActiveOrder", lambda: bytes_per_item(active_orders(specs), args.orders)),
+        ("GoMOrder", lambda: bytes_per_item(gom_orders(specs), args.orders)),
+        ("Point", lambda: bytes_per_item(points, args.orders)),
+        ("TransportRobotAgent", lambda: bytes_per_item(robots, args.trs)),
+    ]
+    failed = []
+    try:
+        for name, measure in cases:
+            try:
+                per_item = measure()
+            except ImportError as e:
+                print(f"{name:<20} skipped: {e!r}")
+                continue
+            budget = BUDGETS.get(name)
+            print(f"{name:<20} {per_item:10.1f} B" + (f"  (budget {budget} B)" if budget is not None else ""))
+            if budget is not None and per_item > budget:
+                failed.append(f"{name}: {per_item:.1f} B over budget of {budget} B")
+    finally:
+        if "spade" in sys.modules:
+            # Robots start spade's container thread, which keeps the process alive
+            from spade import quit_spade
+            quit_spade()
+
+    for failure in failed:
+        print(f"FAILED {failure}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Microbenchmark of `OrderQueue` against the plain `heapq` of `Orders` previously used by `Manager`.
+
+Usage: python -m benchmarks.bench_order_queue [-n ORDERS] [-r REPEATS]
+"""
+import argparse
+import copy
+import heapq
+import random
+import timeit
+
+from industry2.common import Order
+from industry2.enums import Operation
+from industry2.order_queue import OrderQueue
+
+
+def make_orders(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    op_list = list(Operation)
+    orders = []
+    for i in range(n):
+        ops_num = rng.randint(3, 10)
+        orders.append(Order.create(priority=rng.randint(0, 3), order_id=i, tr_counts=[3] * ops_num,
+                                   operations=[rng.choice(op_list) for _ in range(ops_num)]))
+    return orders
+
+
+def heapq_push_pop(orders):
+    heap = []
+    for order in orders:
+        heapq.heappush(heap, order)
+    while heap:
+        heapq.heappop(heap)
+
+
+def queue_push_pop(orders):
+    queue = OrderQueue()
+    for order in orders:
+        queue.push(order)
+    while queue:
+        queue.pop()
+
+
+def heapq_filled(orders):
+    heap = list(orders)
+    heapq.heapify(heap)
+    return heap
+
+
+def heapq_reprioritize(heap, targets):
+    """Priority change without an index: linear search and a full heapify."""
+    for oid in targets:
+        for order in heap:
+            if order.order_id == oid:
+                order.priority = 0
+                break
+        heapq.heapify(heap)
+
+
+def queue_filled(orders):
+    queue = OrderQueue()
+    for order in orders:
+        queue.push(order)
+    return queue
+
+
+def queue_reprioritize(queue, targets):
+    for oid in targets:
+        queue.update_priority(oid, 0)
+
+
+def best_of(prepare, run, repeats: int) -> float:
+    """Returns the best time of `run(prepare())` over `repeats`, `prepare` runs in the untimed setup."""
+    state = {}
+
+    def setup():
+        state["value"] = prepare()
+
+    timer = timeit.Timer(lambda: run(state["value"]), setup=setup)
+    return min(timer.repeat(repeat=repeats, number=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--orders', type=int, default=10000)
+    parser.add_argument('-r', '--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders)
+    targets = random.Random(1).sample(range(args.orders), min(100, args.orders))
+
+    def copies():
+        return [copy.copy(order) for order in orders]  # reprioritizing changes orders
+
+    cases = [
+        ('heapq push/pop', copies, heapq_push_pop),
+        ('OrderQueue push/pop', copies, queue_push_pop),
+        ('heapq reprioritize x100', lambda: heapq_filled(copies()), lambda heap: heapq_reprioritize(heap, targets)),
+        ('OrderQueue reprioritize x100', lambda: queue_filled(copies()),
+         lambda queue: queue_reprioritize(queue, targets)),
+    ]
+    print(f"{args.orders} orders, best of {args.repeats}, orders and filled queues are built untimed")
+    for name, prepare, run in cases:
+        print(f"{name:<30} {best_of(prepare, run, args.repeats) * 1e3:9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Microbenchmarks of primitives running thousands of times per second.
+
+Each primitive is timed in `repeats` samples of an auto-calibrated number of calls (at least 0.2 s per sample). Reported
+are the median time per call and its 95 % confidence interval, from order statistics, so no distribution is assumed.
+
+Results are appended to a history file per primitive (``HISTORY_DIR/<primitive>.jsonl``). A primitive is flagged as
+slower when its median grew by more than ``--threshold`` and the confidence intervals of the last and the current run
+don't overlap. With ``--check`` the exit code is 1 if any primitive is slower.
+
+Primitives whose dependencies are missing (e.g. PyQt5 for ``canvas_draw_scene``) are skipped.
+
+Usage: python -m benchmarks.bench_primitives [-k FILTER] [-r REPEATS] [--trs N] [--goms N] [--history HISTORY_DIR]
+                                             [--no-save] [--threshold SHARE] [--check]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from types import SimpleNamespace
+
+from industry2.common import GoMOrder, Order, Point
+from industry2.enums import Operation
+
+HISTORY_DIR = os.path.join(os.path.dirname(__file__), "history")
+
+
+def make_order(ops_num: int = 10) -> Order:
+    operations = [list(Operation)[i % len(Operation)] for i in range(ops_num)]
+    return Order.create(priority=1, order_id=123456, operations=operations, tr_counts=[3] * ops_num,
+                        current_operation=2)
+
+
+def tr_jids(n: int):
+    return [f"tr-{i}@localhost" for i in range(1, n + 1)]
+
+
+def _drive(coro) -> None:
+    """Runs a coroutine that never suspends."""
+    try:
+        coro.send(None)
+    except StopIteration:
+        pass
+    else:
+        raise RuntimeError("coroutine suspended")
+
+
+# Setup functions, each returns the callable to time
+
+
+def order_to_json(args):
+    order = make_order()
+    return order.to_json
+
+
+def order_from_json(args):
+    payload = make_order().to_json()
+    return lambda: Order.from_json(payload)
+
+
+def gom_order_create(args):
+    order = make_order()
+    return lambda: GoMOrder.create(order, "gom-1@localhost")
+
+
+def gom_order_from_json(args):
+    payload = GoMOrder.create(make_order(), "gom-1@localhost").to_json()
+    return lambda: GoMOrder.from_json(payload)
+
+
+def template_match_tr_chain(args):
+    """`tr_template` chain of all TRs matched by a message from the last one, the worst case."""
+    from spade.message import Message
+
+    from industry2.agents import TransportRobotAgent
+
+    jids = tr_jids(args.trs)
+    template = TransportRobotAgent.tr_template(SimpleNamespace(tr_jids=jids), metadata={'performative': 'request'})
+    msg = Message(to=jids[0], sender=jids[-1], body=make_order().to_json(), metadata={'performative': 'request'})
+    return lambda: template.match(msg)
+
+
+def move_tick(args):
+    """One `MoveBehaviour.run`, without sending the position."""
+    import industry2.settings as settings
+    from industry2.agents import TransportRobotAgent
+
+    behaviour = TransportRobotAgent.MoveBehaviour(Point(1e9, 1e9), period=settings.TR_TICK_DURATION)
+    behaviour.agent = SimpleNamespace(position=Point(0., 0.))
+
+    async def after_tick():
+        pass
+
+    behaviour.after_tick = after_tick
+    return lambda: _drive(behaviour.run())
+
+
+def tr_list_patch(args):
+    """`TRListUpdater`: collecting state changes of all TRs, one of them changed."""
+    import industry2.settings as settings
+    from industry2.agents import FactoryAgent, TransportRobotAgent
+
+    jids = tr_jids(args.trs)
+    tr_goms = {jid: f"gom-{i}@localhost" for i, jid in enumerate(jids, start=1)}
+    tr_list = {jid: TransportRobotAgent(position=Point(0., 0.), gom_jid=tr_goms[jid], factory_jid="factory@localhost",
+                                        factory_map={}, tr_jids=jids, jid=jid,
+                                        password=settings.PASSWORD)
+               for jid in jids}
+    factory = SimpleNamespace(tr_list=tr_list, tr_states={})
+    FactoryAgent.tr_list_patch(factory)
+    tr = tr_list[jids[0]]
+
+    def patch():
+        tr.idle = not tr.idle
+        FactoryAgent.tr_list_patch(factory)
+    return patch
+
+
+def position_publish_read(args):
+    """`PositionUpdater` publishing positions of all TRs and the GUI reading them."""
+    from industry2.positions import PositionStore
+
+    store = PositionStore({jid: Point(0., 0.) for jid in tr_jids(args.trs)})
+    out = store.read()[1]
+
+    def publish_read():
+        store.publish()
+        store.read(out)
+    return publish_read
+
+
+def canvas_draw_scene(args):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+
+    from industry2 import layout
+    from industry2.factory_gui import Canvas, ViewModel
+
+    canvas_draw_scene.app = QApplication.instance() or QApplication([])
+    view_model = ViewModel(lambda text: None)
+    factory_layout = layout.generate_layout(args.goms)
+    factory_map = {w.name: w.position for w in factory_layout.warehouses}
+    tr_map, tr_list = {}, {}
+    for i, gom in enumerate(factory_layout.goms(), start=1):
+        factory_map[f"{gom.name}@localhost"] = gom.position
+        tr_map[f"tr-{i}@localhost"] = Point(gom.position.x - 8, gom.position.y)
+        tr_list[f"tr-{i}@localhost"] = {"helpers": []}
+    view_model.update(tr_list, tr_map, factory_map)
+    canvas = Canvas(view_model)
+    canvas.resize(1280, 800)
+    return canvas.draw_scene
+
+
+PRIMITIVES = [order_to_json, order_from_json, gom_order_create, gom_order_from_json, template_match_tr_chain,
+              move_tick, tr_list_patch, position_publish_read, canvas_draw_scene]
+
+
+def measure(fn, repeats: int) -> dict:
+    """Times `fn`, see module docs.
+
+    :return: dict with ``median``, ``ci`` (95 % confidence interval of the median) and ``min``, all in seconds per
+        call, and ``number`` of calls per sample
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, number)
+    samples = sorted(t / number for t in timer.repeat(repeat=repeats, number=number))
+    n = len(samples)
+    # Ranks of the median's confidence interval, normal approximation of the binomial distribution
+    half_width = 1.96 * math.sqrt(n) / 2
+    low = max(0, math.floor(n / 2 - half_width))
+    high = min(n - 1, math.ceil(n / 2 + half_width) - 1)
+    median = samples[n // 2] if n % 2 else (samples[n // 2 - 1] + samples[n // 2]) / 2
+    return {"median": median, "ci": [samples[low], samples[high]], "min": samples[0], "number": number,
+            "repeats": n}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def last_entry(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def is_slower(previous: dict, current: dict, threshold: float) -> bool:
+    return (current["median"] > previous["median"] * (1 + threshold)
+            and current["ci"][0] > previous["ci"][1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of hot primitives.")
+    parser.add_argument('-k', '--filter', default="", help="run primitives whose name contains this")
+    parser.add_argument('-r', '--repeats', type=int, default=15)
+    parser.add_argument('--trs', type=int, default=100, help="TR count for template and TR list primitives")
+    parser.add_argument('--goms', type=int, default=100, help="GoM count for drawing")
+    parser.add_argument('--history', default=HISTORY_DIR, help="directory of history files")
+    parser.add_argument('--no-save', action='store_true', help="don't append results to history")
+    parser.add_argument('--threshold', type=float, default=0.1, help="tolerated relative slowdown")
+    parser.add_argument('--check', action='store_true', help="exit with 1 if any primitive is slower")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    slower = []
+    try:
+        print(f"{'primitive':<26} {'median':>10} {'95 % CI':>23} {'calls':>9}  vs last")
+        for setup in PRIMITIVES:
+            name = setup.__name__
+            if args.filter not in name:
+                continue
+            try:
+                fn = setup(args)
+            except ImportError as e:
+                print(f"{name:<26} skipped: {e!r}")
+                continue
+            result = measure(fn, args.repeats)
+
+            path = os.path.join(args.history, f"{name}.jsonl")
+            previous = last_entry(path)
+            comparison = ""
+            if previous is not None:
+                comparison = f"{100 * (result['median'] / previous['median'] - 1):+.1f} %"
+                if is_slower(previous, result, args.threshold):
+                    comparison += " SLOWER"
+                    slower.append(name)
+            low, high = result["ci"]
+            print(f"{name:<26} {result['median'] * 1e6:8.2f}us [{low * 1e6:9.2f}, {high * 1e6:9.2f}]us "
+                  f"{result['number']:>9}  {comparison}")
+
+            if not args.no_save:
+                os.makedirs(args.history, exist_ok=True)
+                with open(path, "a") as f:
+                    f.write(json.dumps({"time": time.time(), "commit": commit, "python": platform.python_version(),
+                                        **result}) + "\n")
+    finally:
+        if "spade" in sys.modules:
+            # TR primitives start spade's container thread, which keeps the process alive
+            from spade import quit_spade
+            quit_spade()
+
+    if args.check and slower:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
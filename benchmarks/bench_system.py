@@ -0,0 +1,209 @@
+"""End-to-end benchmark: runs the whole agent system headless at increasing sizes.
+
+Every configuration runs in its own process for a fixed duration. The simulation runs in real time, so simulated
+seconds are wall clock seconds. Recorded per run: completed orders per hour, p50/p99 order completion time, messages
+per completed order, peak RSS, startup time (imports until all agents are started) and CPU seconds per
+simulated second. Like the GUI, runs need the XMPP server configured in `settings`.
+
+Results are written as JSON. With ``--compare BASELINE`` metrics are compared to a stored result file and the exit code
+is 1 if any of them is worse than ``--threshold``.
+
+With ``--pool N ...`` robots form a shared pool of N robots instead of belonging to GoMs, see `industry2.robot_pool`,
+0 runs with robots belonging to GoMs.
+
+Usage: python -m benchmarks.bench_system [--goms N ...] [--robots N ...] [--pool N ...] [--order-periods S ...]
+                                         [--duration S] [-o RESULTS] [--compare BASELINE] [--threshold SHARE]
+                                         [--input RESULTS]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULT_PREFIX = "RESULT "  # marks the child's result line among its log output
+
+# metric -> True if higher is better
+METRICS = {
+    "orders_per_hour": True,
+    "latency_p50": False,
+    "latency_p99": False,
+    "messages_per_order": False,
+    "peak_rss_mb": False,
+    "startup_s": False,
+    "cpu_per_sim_second": False,
+}
+
+
+class _Signal:
+    """Stands in for the GUI's Qt signals."""
+
+    def emit(self, *args):
+        pass
+
+
+def run_one(config: dict) -> dict:
+    """Runs one configuration in this process and returns its metrics."""
+    started_at = time.perf_counter()
+
+    import industry2.settings as settings
+    settings.ORDER_PERIOD = config["order_period"]
+    settings.ARRIVAL_PROCESS = config["arrivals"]
+    settings.SEED = config["seed"]
+    settings.ROBOT_POOL = bool(config.get("pool"))
+    settings.POOL_ROBOTS = config.get("pool") or None
+    settings.LOG_LEVEL = 'WARNING'
+    settings.LOG_LEVELS = {}
+
+    from spade import quit_spade
+
+    from industry2 import determinism, layout, message_flow, metrics
+    from industry2.agents import FactoryAgent
+
+    factory_layout = layout.generate_layout(config["goms"], per_col=None, robots_per_gom=config["robots"],
+                                            seed=config["seed"])
+    agent = FactoryAgent(f"{settings.AGENT_NAMES['factory']}@{settings.HOST}", settings.PASSWORD,
+                         layout=factory_layout)
+    agent.set_update_callbacks(_Signal(), _Signal())
+    agent.start().result()
+    while not agent.start_behaviour.is_done():
+        time.sleep(0.01)
+    startup = time.perf_counter() - started_at
+
+    cpu_start = time.process_time()
+    time.sleep(config["duration"])
+    cpu = time.process_time() - cpu_start
+    total = metrics.lifecycle.histogram("total")
+    flow = message_flow.flow.to_dict()
+
+    agent.stop().result()
+    quit_spade()
+    determinism.shutdown()
+
+    return {
+        "orders": total.count,
+        "orders_per_hour": total.count / config["duration"] * 60 * 60,
+        "latency_p50": total.percentile(50),
+        "latency_p99": total.percentile(99),
+        "messages_per_order": flow["messages_per_order"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+        "startup_s": startup,
+        "cpu_per_sim_second": cpu / config["duration"],
+    }
+
+
+def run(config: dict) -> dict:
+    """Runs one configuration in a child process."""
+    result = {"config": config}
+    try:
+        process = subprocess.run([sys.executable, "-m", "benchmarks.bench_system", "--child", json.dumps(config)],
+                                 capture_output=True, text=True, timeout=config["duration"] * 3 + 600)
+        if process.returncode != 0:
+            result["error"] = process.stderr.strip().splitlines()[-1:] or [f"exit code {process.returncode}"]
+        else:
+            line = next(line for line in process.stdout.splitlines() if line.startswith(RESULT_PREFIX))
+            result["metrics"] = json.loads(line[len(RESULT_PREFIX):])
+    except subprocess.TimeoutExpired:
+        result["error"] = ["timeout"]
+    return result
+
+
+def config_key(config: dict) -> tuple:
+    return (config["goms"], config["robots"], config.get("pool", 0), config["order_period"], config["arrivals"],
+            config["duration"])
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """Returns regressions of `results` against `baseline`, as strings.
+
+    :param results: Current results.
+    :param baseline: Baseline results, configurations missing from either side are skipped.
+    :param threshold: Relative change tolerated, e.g. 0.1 for 10 %.
+    """
+    base = {config_key(r["config"]): r.get("metrics") for r in baseline}
+    regressions = []
+    for result in results:
+        old, new = base.get(config_key(result["config"])), result.get("metrics")
+        if not old or not new:
+            continue
+        for name, higher_is_better in METRICS.items():
+            if old.get(name) is None or new.get(name) is None or old[name] == 0:
+                continue
+            change = (new[name] - old[name]) / abs(old[name])
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{config_key(result['config'])} {name}: {old[name]:.4g} -> {new[name]:.4g} "
+                                   f"({100 * change:+.1f} %)")
+    return regressions
+
+
+def print_results(results: list) -> None:
+    header = ("goms", "robots", "pool", "period", "orders/h", "p50 s", "p99 s", "msgs/ord", "rss MB", "start s", "cpu/s")
+    print(("{:>8} " * len(header)).format(*header))
+    for result in results:
+        config = result["config"]
+        row = [config["goms"], config["robots"], config.get("pool", 0), config["order_period"]]
+        if "metrics" not in result:
+            print(("{:>8} " * 4).format(*row) + f" error: {' '.join(result['error'])}")
+            continue
+        m = result["metrics"]
+        row += [f"{m[name]:.3g}" if m[name] is not None else "-" for name in METRICS]
+        print(("{:>8} " * len(header)).format(*row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the agent system headless at increasing sizes.")
+    parser.add_argument('--goms', type=int, nargs='+', default=[4, 16, 64, 256, 1000])
+    parser.add_argument('--robots', type=int, nargs='+', default=[1], help="TRs per GoM")
+    parser.add_argument('--pool', type=int, nargs='+', default=[0], help="robots in a shared pool, 0 - no pool")
+    parser.add_argument('--order-periods', type=float, nargs='+', default=[8.0], help="mean time between orders (s)")
+    parser.add_argument('--arrivals', default='poisson', help="arrival process, see settings.ARRIVAL_PROCESS")
+    parser.add_argument('--duration', type=float, default=60, help="simulated seconds per run")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', help="write results to a JSON file")
+    parser.add_argument('--input', help="read results from a JSON file instead of running")
+    parser.add_argument('--compare', help="baseline results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="tolerated relative change")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(RESULT_PREFIX + json.dumps(run_one(json.loads(args.child))), flush=True)
+        return
+
+    if args.input is not None:
+        with open(args.input) as f:
+            results = json.load(f)["results"]
+    else:
+        results = []
+        for goms in args.goms:
+            for robots in args.robots:
+                for pool in args.pool:
+                    for period in args.order_periods:
+                        config = {"goms": goms, "robots": robots, "pool": pool, "order_period": period,
+                                  "arrivals": args.arrivals, "duration": args.duration, "seed": args.seed}
+                        print(f"Running {config} ...", file=sys.stderr)
+                        results.append(run(config))
+    print_results(results)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(), "time": time.time(),
+                       "results": results}, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
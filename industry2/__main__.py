@@ -1,18 +1,72 @@
-import asyncio
+"""Runs the simulation with the GUI, headless, or a GUI viewer attached to a headless simulation.
+
+Usage: python -m industry2 [--headless] [--stream PATH] [--attach PATH]
+"""
+import argparse
 import sys
 
-from PyQt5.QtWidgets import QApplication
 
-from industry2.factory_gui import MainWindow
+def run_gui(stream_path=None):
+    from PyQt5.QtWidgets import QApplication
 
+    from industry2.factory_gui import MainWindow
 
-if __name__ == '__main__':
-    # fix needed for asyncio on Windows [https://github.com/tornadoweb/tornado/issues/2608#issuecomment-550180288]
-    if sys.platform == 'win32':
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     app = QApplication([])
-    window = MainWindow()
+    window = MainWindow(stream_path=stream_path)
 
     # app.exec()  # TODO
     app.exec_()
     # sys.exit(app.exec_())
+
+
+def run_headless(stream_path=None):
+    """Runs the simulation until interrupted, streaming it to `stream_path` if given."""
+    from spade import quit_spade
+
+    import industry2.settings as settings
+    from industry2 import determinism, log, message_flow, profiling, trace
+    from industry2.agents import FactoryAgent
+    from industry2.stream import Signal, StreamServer
+
+    agent = FactoryAgent(f"{settings.AGENT_NAMES['factory']}@{settings.HOST}", settings.PASSWORD)
+    server = StreamServer(stream_path, agent.positions, settings.STREAM_FPS) if stream_path is not None else None
+    agent.set_update_callbacks(Signal(), Signal(server.update_view_model if server is not None else None))
+    agent.start().result()
+    if server is not None:
+        server.start(agent.loop)
+
+    try:
+        agent.stopped.wait()
+    except KeyboardInterrupt:
+        agent.stop().result()
+
+    if server is not None:
+        server.stop(agent.loop)
+    quit_spade()
+    trace.stop()
+    determinism.shutdown()
+    profiling.stop()
+    message_flow.dump(settings.MESSAGE_FLOW_FILE)
+    log.shutdown()
+
+
+if __name__ == '__main__':
+    # fix needed for asyncio on Windows [https://github.com/tornadoweb/tornado/issues/2608#issuecomment-550180288]
+    if sys.platform == 'win32':
+        import asyncio
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    parser = argparse.ArgumentParser(prog="python -m industry2", description="Runs the factory simulation.")
+    parser.add_argument('--headless', action='store_true', help="run without the GUI")
+    parser.add_argument('--stream', metavar="PATH", help="stream the headless simulation to viewers on a Unix socket")
+    parser.add_argument('--attach', metavar="PATH", help="only view a simulation streamed to a Unix socket")
+    args = parser.parse_args()
+    if args.stream is not None and not args.headless:
+        parser.error("--stream requires --headless")
+    if args.attach is not None and args.headless:
+        parser.error("--attach can't be used with --headless")
+
+    if args.headless:
+        run_headless(args.stream)
+    else:
+        run_gui(args.attach)
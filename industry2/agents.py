@@ -1,38 +1,46 @@
 import asyncio
 import datetime
-import random
+import logging
+import math
+import threading
+import time
 from asyncio import sleep
 from collections import defaultdict
-from copy import deepcopy
 from dataclasses import dataclass
-from heapq import heappop, heappush
 from typing import Dict, List
 
-import numpy as np
 from spade.agent import Agent
 from spade.behaviour import OneShotBehaviour, CyclicBehaviour, PeriodicBehaviour, FSMBehaviour, State
 from spade.message import Message
 from spade.template import Template
 
 import industry2.settings as settings  # TODO: Bad?
-from industry2.common import GoMOrder, Order, Point
+from industry2.common import GoMOrder, ManagerStatus, Order, Point
 from industry2.enums import Operation
+from industry2.order_queue import OrderQueue
+from industry2.positions import PositionStore
+from industry2.robot_pool import RobotPool
+from industry2.utilization import ROBOT_STATES, UtilizationMonitor
+from industry2 import determinism, layout as factory_layout, log, message_flow, metrics, profiling, trace, workload
 
 
 @dataclass
 class Machine:
+    __slots__ = ('operation', 'working')
     operation: Operation
-    working: bool = True
+    working: bool
 
 
 @dataclass(order=True)
 class GoMInfo:
+    __slots__ = ('jid', 'machines')
     jid: str
     machines: List[Machine]
 
 
 @dataclass
 class ActiveOrder:
+    __slots__ = ('order', 'location')
     order: Order
     location: str  # "" - warehouse, "address@host" - gom_jid
 
@@ -41,18 +49,60 @@ class ActiveOrder:
         self.location = loc
 
 
-def def_print(str: str, **kwargs):
-    pass
-    # print(str, **kwargs)
+logger = log.get_logger("agents")
+msg_logger = log.get_logger("messages")
+metrics_logger = log.get_logger("metrics")
+
+
+def order_id_of(message: Message) -> int:
+    """Returns order ID sent in `thread`, -1 if there is none."""
+    thread = message.thread
+    return int(thread) if thread and thread.isdigit() else -1
 
 
 async def send(behav: CyclicBehaviour, message: Message):
-    print(datetime.datetime.now())
-    print(message)
-    print()
+    msg_logger.debug("%s", message)
+    recorder = trace.recorder
+    if recorder is not None:
+        recorder.record(trace.MSG_SENT, recorder.intern(behav.agent.jid), recorder.intern(message.to),
+                        recorder.intern(message.get_metadata("performative")), order_id_of(message))
     await behav.send(message)
 
 
+class BaseAgent(Agent):
+    """Base agent, instruments message delivery and, when profiling, behaviours."""
+
+    role = "other"  # used in message flow accounting
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        message_flow.flow.register(str(self.jid), self.role)
+
+    def add_behaviour(self, behaviour, template=None):
+        if profiling.profiler is not None:
+            profiling.profiler.instrument(self, behaviour)
+        super().add_behaviour(behaviour, template)
+
+    def dispatch(self, msg):
+        recorder = trace.recorder
+        if recorder is not None:
+            recorder.record(trace.MSG_RECEIVED, recorder.intern(self.jid), recorder.intern(msg.sender),
+                            recorder.intern(msg.get_metadata("performative")), order_id_of(msg))
+        message_flow.flow.record(msg.sender, self.role, msg.get_metadata("performative"), msg.body)
+        return super().dispatch(msg)
+
+
+class TracedFSMBehaviour(FSMBehaviour):
+    """FSM behaviour recording its state transitions."""
+
+    async def _run(self):
+        state = self.current_state
+        await super()._run()
+        recorder = trace.recorder
+        if recorder is not None and self.current_state != state:
+            recorder.record(trace.STATE, recorder.intern(self.agent.jid), label=recorder.intern(self.current_state))
+
+
 class RecvBehaviour(CyclicBehaviour):
     """Base receive handler behaviour.
 
@@ -71,21 +121,35 @@ class RecvBehaviour(CyclicBehaviour):
 
 
 class OrderFactory:
-    """Creates `Orders`."""
+    """Creates `Orders` arriving according to a workload.
 
-    def __init__(self):
+    :param orders: Iterable of order specs (see `industry2.workload`), workload from `settings` if None.
+    """
+
+    def __init__(self, orders=None):
         self.unused_id = 1
-        self.op_list = list(Operation)
+        if orders is None:
+            orders = determinism.replay.orders() if determinism.replay is not None else workload.from_settings()
+        self.orders = iter(orders)
+
+    def next_arrival(self) -> tuple:
+        """Returns next order spec, its first element is arrival time (s since start of generation).
+
+        :raises StopIteration: when the workload is exhausted
+        """
+        return next(self.orders)
 
-    def create(self) -> Order:
-        ops_num = random.randint(3, 10)
-        ops = [random.choice(self.op_list) for i in range(ops_num)]
-        order = Order(
-            priority=1,
+    def create(self, spec: tuple) -> Order:
+        """Creates an order from an order spec, assigning it the next ID.
+
+        :param spec: order spec returned by `next_arrival`
+        """
+        _, priority, ops, tr_counts = spec
+        order = Order.create(
+            priority=priority,
             order_id=self.unused_id,
-            current_operation=0,
-            tr_counts=[3] * ops_num,
-            operations=ops
+            operations=ops,
+            tr_counts=tr_counts,
         )
 
         self.unused_id += 1
@@ -93,34 +157,41 @@ class OrderFactory:
         return order
 
 
-class FactoryAgent(Agent):
+class FactoryAgent(BaseAgent):
+    role = "factory"
+
     class StartAgents(OneShotBehaviour):
         """Starts all other agents."""
 
         async def run(self):
             gom_infos = []
-            for i, (gom_jid, tr_jid) in enumerate(self.agent.jids, start=1):
-                # Create and start GoM agent
-                gom_operations = list(Operation)
+            pool = self.agent.robot_pool
+            # TRs reserved for express orders, the last ones that take no transport requests, so regular orders never
+            # get their time
+            if pool is None:
+                helper_jids = [tr_jid for _, _, gom_tr_jids in self.agent.goms for tr_jid in gom_tr_jids[1:]]
+            else:
+                helper_jids = list(self.agent.pool_tr_jids)
+            express_trs = min(math.ceil(settings.EXPRESS_RESERVED_TR_SHARE * len(self.agent.tr_map)), len(helper_jids))
+            self.express_tr_jids = set(helper_jids[len(helper_jids) - express_trs:])
+            for gom_jid, gom_operations, gom_tr_jids in self.agent.goms:
+                # Create and start GoM agent. Its first TR takes transport requests, other ones only help. Pooled,
+                # it takes a robot from the pool for every transport instead.
                 gom_infos.append((gom_jid, gom_operations))
-                gom = GroupOfMachinesAgent(manager_jid=self.agent.manager_jid, tr_jid=tr_jid,
-                                           machines=gom_operations, jid=gom_jid, password=settings.PASSWORD)
+                gom = GroupOfMachinesAgent(manager_jid=self.agent.manager_jid,
+                                           tr_jid=gom_tr_jids[0] if pool is None else None,
+                                           machines=gom_operations, pool=pool, jid=gom_jid,
+                                           password=settings.PASSWORD)
+                self.agent.gom_list[gom_jid] = gom
                 await gom.start()
-                def_print(f'gom started gom_jid={gom_jid}')
+                logger.debug('gom started gom_jid=%s', gom_jid)
                 # Wait around 100ms for registration to complete
                 await asyncio.sleep(settings.AGENT_CREATION_SLEEP)
 
-                # Create and start TR agent
-                tr_jids = [tr for (_, tr) in self.agent.jids if tr != tr_jid]
-                tr = TransportRobotAgent(position=self.agent.tr_map[tr_jid], gom_jid=gom_jid,
-                                         factory_jid=str(self.agent.jid), factory_map=self.agent.factory_map,
-                                         tr_jids=tr_jids, jid=tr_jid, password=settings.PASSWORD)
-                self.agent.tr_list[tr_jid] = tr
-
-                await tr.start()
-                def_print(f'tr started tr_jid={tr_jid}')
-                # Wait around 100ms for registration to complete
-                await asyncio.sleep(settings.AGENT_CREATION_SLEEP)
+                for tr_jid in gom_tr_jids:
+                    await self.start_tr(tr_jid, gom_jid)
+            for tr_jid in self.agent.pool_tr_jids:
+                await self.start_tr(tr_jid, None)
 
             # Send data to worker
             self.agent.perform_view_model_update()
@@ -129,19 +200,72 @@ class FactoryAgent(Agent):
             self.agent.add_behaviour(self.agent.tr_list_updater)
 
             # Create and start Manager agent
-            manager = Manager(factory_jid=str(self.agent.jid), gom_infos=gom_infos, jid=self.agent.manager_jid,
-                              password=settings.PASSWORD)
+            manager = Manager(factory_jid=str(self.agent.jid), gom_infos=gom_infos,
+                              warehouses=[warehouse.name for warehouse in self.agent.layout.warehouses],
+                              jid=self.agent.manager_jid, password=settings.PASSWORD)
+            self.agent.manager = manager
             await manager.start()
 
-    class OrderBehav(PeriodicBehaviour):
-        """Cyclically generates orders and sends them to Manager Agent."""
+            floor = self.agent.layout.floor
+            self.agent.utilization = UtilizationMonitor(
+                list(self.agent.gom_list), (-floor.width / 2, -floor.height / 2, floor.width / 2, floor.height / 2),
+                settings.UTILIZATION_HISTORY, settings.UTILIZATION_WINDOW, settings.HEATMAP_CELL_SIZE,
+                settings.HEATMAP_HALF_LIFE)
+            self.agent.add_behaviour(self.agent.UtilizationSampler(settings.UTILIZATION_SAMPLE_PERIOD))
+
+        async def start_tr(self, tr_jid, gom_jid):
+            """Creates and starts a TR agent, belonging to `gom_jid` or, if None, to the shared pool."""
+            tr_jids = [tr for tr in self.agent.tr_map if tr != tr_jid]
+            tr = TransportRobotAgent(position=self.agent.tr_map[tr_jid], gom_jid=gom_jid,
+                                     factory_jid=str(self.agent.jid), factory_map=self.agent.factory_map,
+                                     tr_jids=tr_jids, express_only=tr_jid in self.express_tr_jids,
+                                     pool=self.agent.robot_pool,
+                                     jid=tr_jid, password=settings.PASSWORD)
+            self.agent.tr_list[tr_jid] = tr
+
+            await tr.start()
+            logger.debug('tr started tr_jid=%s', tr_jid)
+            # Wait around 100ms for registration to complete
+            await asyncio.sleep(settings.AGENT_CREATION_SLEEP)
+
+    class OrderBehav(CyclicBehaviour):
+        """Generates orders at their arrival times and sends them to Manager Agent, unless admission control holds them
+        back.
+
+        :param start_at: Time of generation start (arrival time 0).
+        """
+
+        def __init__(self, start_at: datetime.datetime):
+            super().__init__()
+            self.start_at = start_at
 
         async def run(self):
             await self.agent.start_behaviour.join()
-            # def_print(f"Running {type(self).__name__}...")
+            # logger.debug("Running %s...", type(self).__name__)
+
+            try:
+                spec = self.agent.order_factory.next_arrival()
+            except StopIteration:
+                logger.info("Workload exhausted.")
+                self.kill()
+                return
+
+            arrival_time = spec[0]
+            arrival_at = self.start_at + datetime.timedelta(seconds=arrival_time)
+            delay = (arrival_at - datetime.datetime.now()).total_seconds()
+            if delay > 0:
+                await sleep(delay)
 
-            order = self.agent.order_factory.create()
+            if not self.agent.admit_order():
+                self.agent.shed_orders += 1
+                determinism.record("shed", time=arrival_time)
+                return
+
+            order = self.agent.order_factory.create(spec)
+            determinism.record("order", order_id=order.order_id, time=arrival_time, priority=order.priority,
+                               operations=[op.name for op in order.operation_list()], tr_counts=list(order.tr_counts))
             self.agent.orders[order.order_id] = order
+            self.agent.order_created_at[order.order_id] = time.monotonic()
 
             # Send request
             msg = Message(to=self.agent.manager_jid)
@@ -149,15 +273,27 @@ class FactoryAgent(Agent):
             msg.body = order.to_json()  # Set the message content
 
             await send(self, msg)
-            def_print(f"Message sent!\n{msg}")
+            logger.debug("Message sent!\n%s", msg)
 
     class OrderAgreeHandler(CyclicBehaviour):
-        """On `agree` message from `Manager`."""
+        """On `agree` message from `Manager`. Manager's status is sent in body as `ManagerStatus`."""
+
+        async def run(self):
+            msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
+            if msg is not None:
+                logger.debug("%s", msg)
+                self.agent.manager_status = ManagerStatus.from_json(msg.body)
+
+    class OrderRefuseHandler(CyclicBehaviour):
+        """On `refuse` message from `Manager`, sent when its queue is full. Order ID is sent in `thread`."""
 
         async def run(self):
             msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
             if msg is not None:
-                def_print(msg)
+                logger.debug("%s", msg)
+                self.agent.manager_status = ManagerStatus.from_json(msg.body)
+                self.agent.evict_order(int(msg.thread))
+                self.agent.shed_orders += 1
 
     class OrderFailureHandler(CyclicBehaviour):
         """On `failure` message from `Manager`."""
@@ -165,15 +301,62 @@ class FactoryAgent(Agent):
         async def run(self):
             msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
             if msg is not None:
-                def_print(msg)
+                logger.debug("%s", msg)
 
     class OrderDoneHandler(CyclicBehaviour):
-        """On `inform` message from `Manager`."""
+        """On `inform` message from `Manager`. Order ID is sent in `thread`."""
+
+        async def run(self):
+            msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
+            if msg is not None:
+                logger.debug("%s", msg)
+                if msg.body:
+                    self.agent.manager_status = ManagerStatus.from_json(msg.body)
+                order_id = int(msg.thread)
+                created_at = self.agent.order_created_at.get(order_id)
+                order = self.agent.evict_order(order_id)
+                if created_at is not None and order is not None:
+                    metrics.record("total", order.priority, time.monotonic() - created_at)
+                    message_flow.flow.order_completed()
+
+    class OrderCancelReplyHandler(CyclicBehaviour):
+        """On `confirm` message from `Manager`, a cancel was accepted. Order ID is sent in `thread`."""
+
+        async def run(self):
+            msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
+            if msg is not None:
+                logger.debug("%s", msg)
+                order_id = order_id_of(msg)
+                if self.agent.evict_order(order_id) is not None:
+                    logger.info("Order %s cancelled", order_id)
+
+    class OrderPriorityReplyHandler(CyclicBehaviour):
+        """On `agree` or `refuse` message from `Manager` with `priority` ontology, a reply to a priority change. Order
+        ID is sent in `thread`, new priority in body."""
 
         async def run(self):
             msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
             if msg is not None:
-                def_print(msg)
+                logger.debug("%s", msg)
+                order_id = order_id_of(msg)
+                order = self.agent.orders.get(order_id)
+                if msg.get_metadata("performative") == "agree" and order is not None:
+                    order.priority = int(msg.body)
+                    logger.info("Order %s priority changed to %s", order_id, order.priority)
+
+    class LatencyReporter(PeriodicBehaviour):
+        """Periodically logs order lifecycle summary."""
+
+        async def run(self):
+            if metrics_logger.isEnabledFor(logging.INFO):
+                metrics_logger.info("%s", self.agent.latency_report())
+
+    class ProfileReporter(PeriodicBehaviour):
+        """Periodically logs behaviour profile, see `industry2.profiling`."""
+
+        async def run(self):
+            if profiling.profiler is not None:
+                profiling.logger.info("%s", profiling.profiler.summary())
 
     class PositionHandler(CyclicBehaviour):
         """ On `inform` message from `TR` signifying position change. Position is sent in body as `Point`."""
@@ -183,68 +366,104 @@ class FactoryAgent(Agent):
             if msg is not None:
                 tr_jid = str(msg.sender)
                 pos = Point.from_json(msg.body)
-                self.agent.tr_map[tr_jid] = pos
-                # Note: Positions are updated in bulk by PositionUpdater behaviour.
-                # self.agent.update_tr_position.emit(tr_jid, pos)
+                # Note: Positions are published in bulk by PositionUpdater behaviour.
+                self.agent.positions.set(tr_jid, pos.x, pos.y)
 
     class PositionUpdater(PeriodicBehaviour):
-        """Periodically updates TR positions."""
+        """Periodically publishes TR positions to `positions` readers, i.e. the GUI."""
+
+        async def run(self):
+            self.agent.positions.publish()
+
+    class UtilizationSampler(PeriodicBehaviour):
+        """Periodically samples GoM and TR utilization, queue length and throughput."""
+
+        positions = None  # buffer TR positions are read to
 
         async def run(self):
-            tr_map_copy = deepcopy(self.agent.tr_map)
-            self.agent.update_view_model.emit(None, tr_map_copy, None)
+            agent = self.agent
+            now = time.monotonic()
+            robot_counts = dict.fromkeys(ROBOT_STATES, 0)
+            for tr in agent.tr_list.values():
+                robot_counts[tr.activity()] += 1
+            _, self.positions = agent.positions.read(self.positions)
+            agent.utilization.sample(now, [gom.busy(now) for gom in agent.gom_list.values()],
+                                     [robot_counts[state] for state in ROBOT_STATES], len(agent.manager.orders),
+                                     message_flow.flow.completed_orders, self.positions)
 
     class TRListUpdater(PeriodicBehaviour):
-        """Periodically updates TR list."""
+        """Periodically sends changes of TR states."""
 
         async def run(self):
-            # Filter TR data before copying
-            tr_list_tmp = {k: TransportRobotAgent.filter(
-                v.__dict__) for k, v in self.agent.tr_list.items()}
-            tr_list_copy = deepcopy(tr_list_tmp)
-            self.agent.update_view_model.emit(tr_list_copy, None, None)
+            patch = self.agent.tr_list_patch()
+            if patch:
+                self.agent.update_view_model.emit(patch, None, None)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, layout=None, **kwargs):
         super().__init__(*args, **kwargs)
+        # Seeds and journal, before anything random happens
+        log.setup()
+        determinism.setup()
+        if settings.TRACE_FILE is not None:
+            trace.start(settings.TRACE_FILE)
+        if settings.PROFILE:
+            profiling.start()
+
         # Orders
         self.unused_id = 1  # Currently unused Order ID
         self.orders = {}
         self.order_factory = OrderFactory()
+        self.order_created_at = {}  # order ID -> time.monotonic()
+        self.manager_status = ManagerStatus()  # as last reported by Manager
+        self.admission_credit = 0.  # fraction of an order admitted while throttled
+        self.shed_orders = 0
         self.order_behav = None
 
         # Callbacks used for updating GUI.
         self.update_tr_position = None
         self.update_view_model = None
+        self.stopped = threading.Event()  # set once the agent stopped, other threads can wait for it
 
-        # GoM IDs start with 1, so that 0 can be used as set-aside's ID
-        self.gom_count = settings.GOM_COUNT
+        # Factory layout, validated on load
+        self.layout = layout if layout is not None else factory_layout.from_settings()
 
-        # Maps JID to Point
-        self.factory_map = {
-            '': Point(x=-128.0, y=0.0)
-        }
-        self.tr_map = {}
+        # Maps JID (or warehouse name) to Point
+        self.factory_map = {}
+        self.tr_map = {}  # initial positions, current ones are in `positions`
         self.tr_list = {}
+        self.gom_list = {}  # GoM JID -> GroupOfMachinesAgent
+        self.manager = None
+        self.utilization = None  # UtilizationMonitor, once all agents are started
+        self.tr_states = {}  # TR JID -> (state_version, state) last sent to the GUI
+        self.tr_goms = {}  # Maps TR JID to JID of GoM it belongs to
+        self.pool_tr_jids = []  # TRs belonging to no GoM, with `settings.ROBOT_POOL`
+        self.robot_pool = RobotPool(self.factory_map, settings.SPATIAL_CELL_SIZE) if settings.ROBOT_POOL else None
 
         # JIDs
         self.manager_jid = f"{settings.AGENT_NAMES['manager']}@{settings.HOST}"
-        self.jids = self.prepare()
+        self.goms = self.prepare()
+        self.positions = PositionStore(self.tr_map)  # read by the GUI
 
         # Behaviours
         start_at = datetime.datetime.now() + datetime.timedelta(seconds=5)
         self.start_behaviour = self.StartAgents()
-        self.order_behav = self.OrderBehav(8.0, start_at)
+        self.order_behav = self.OrderBehav(start_at)
         self.agr_handler = self.OrderAgreeHandler()
+        self.ref_handler = self.OrderRefuseHandler()
         self.fail_handler = self.OrderFailureHandler()
         self.done_handler = self.OrderDoneHandler()
+        self.cancel_reply_handler = self.OrderCancelReplyHandler()
+        self.priority_reply_handler = self.OrderPriorityReplyHandler()
         self.position_handler = self.PositionHandler()
         self.position_updater = self.PositionUpdater(
             settings.TR_POSITION_UPDATE_PERIOD)
         self.tr_list_updater = self.TRListUpdater(
             settings.TR_LIST_UPDATE_PERIOD)
+        self.latency_reporter = self.LatencyReporter(
+            settings.LATENCY_REPORT_PERIOD, start_at)
 
     async def setup(self):
-        def_print(f"TickerAgent started at {datetime.datetime.now().time()}")
+        logger.debug("TickerAgent started at %s", datetime.datetime.now().time())
         if self.update_tr_position is None:
             raise Exception("update_tr_position not set")
         if self.update_view_model is None:
@@ -254,11 +473,25 @@ class FactoryAgent(Agent):
         self.add_behaviour(self.start_behaviour)
 
         self.add_behaviour(self.order_behav)
+        self.add_behaviour(self.latency_reporter)
+        if profiling.profiler is not None:
+            asyncio.ensure_future(profiling.profiler.probe_lag())
+            self.add_behaviour(self.ProfileReporter(settings.PROFILE_REPORT_PERIOD))
+
+        priority_temp = Template()
+        priority_temp.sender = self.manager_jid
+        priority_temp.metadata = {"ontology": "priority"}
+        self.add_behaviour(self.priority_reply_handler, priority_temp)
 
         agr_temp = Template()
         agr_temp.sender = self.manager_jid
         agr_temp.metadata = {"performative": "agree"}
-        self.add_behaviour(self.agr_handler, agr_temp)
+        self.add_behaviour(self.agr_handler, agr_temp & ~priority_temp)
+
+        ref_temp = Template()
+        ref_temp.sender = self.manager_jid
+        ref_temp.metadata = {"performative": "refuse"}
+        self.add_behaviour(self.ref_handler, ref_temp & ~priority_temp)
 
         fail_temp = Template()
         fail_temp.sender = self.manager_jid
@@ -270,6 +503,11 @@ class FactoryAgent(Agent):
         done_temp.metadata = {"performative": "inform"}
         self.add_behaviour(self.done_handler, done_temp)
 
+        cancel_temp = Template()
+        cancel_temp.sender = self.manager_jid
+        cancel_temp.metadata = {"performative": "confirm"}
+        self.add_behaviour(self.cancel_reply_handler, cancel_temp)
+
         inf_temp = Template()
         inf_temp.metadata = {"performative": "inform"}
         manager_temp = Template()
@@ -279,6 +517,12 @@ class FactoryAgent(Agent):
 
         self.add_behaviour(self.StartAgents())
 
+    async def _async_stop(self):
+        try:
+            await super()._async_stop()
+        finally:
+            self.stopped.set()  # also if disconnecting failed, waiters would hang otherwise
+
     def set_update_callbacks(self, update_tr_pos_callback, update_view_model_callback) -> None:
         """Sets callbacks used for updating GUI.
 
@@ -290,73 +534,151 @@ class FactoryAgent(Agent):
         self.update_view_model = update_view_model_callback
 
     def prepare(self):
-        """Generates positions and JIDs for GoMs and TRs
+        """Generates positions and JIDs for GoMs and TRs from layout. TRs are scattered around their GoMs. With
+        `settings.ROBOT_POOL` TRs belong to no GoM, they are listed in `pool_tr_jids` and scattered around GoMs in turn.
 
-        :return:
+        :return: list of (gom_jid, operations, tr_jids) tuples
         """
-        per_col = 5
         spray_diameter = 10
-        jids = []
-        for i in range(self.gom_count):
-            # Create JIDs
-            gom_jid = f"{settings.AGENT_NAMES['gom_base']}{i + 1}@{settings.HOST}"
-            tr_jid = f"{settings.AGENT_NAMES['tr_base']}{i + 1}@{settings.HOST}"
-            jids.append((gom_jid, tr_jid))
-
-            # Create GoM and TR positions
-            y = (i % per_col) * 48 - 96
-            x = int(i / per_col) * 64 - 32
-            xo = random.gauss(0, spray_diameter)
-            yo = random.gauss(0, spray_diameter)
+        rng = determinism.rng("prepare")
+        for warehouse in self.layout.warehouses:
+            self.factory_map[warehouse.name] = warehouse.position
+
+        def place_tr(near: Point) -> str:
+            tr_jid = f"{settings.AGENT_NAMES['tr_base']}{len(self.tr_map) + 1}@{settings.HOST}"
+            xo = rng.gauss(0, spray_diameter)
+            yo = rng.gauss(0, spray_diameter)
+            self.tr_map[tr_jid] = Point(x=near.x + xo, y=near.y + yo)
+            return tr_jid
+
+        goms = []
+        layout_robots = 0
+        for gom in self.layout.goms():
+            gom_jid = f"{gom.name}@{settings.HOST}"
+            self.factory_map[gom_jid] = gom.position
+            layout_robots += gom.robots
+
+            tr_jids = []
+            for _ in range(0 if settings.ROBOT_POOL else gom.robots):
+                tr_jid = place_tr(gom.position)
+                self.tr_goms[tr_jid] = gom_jid
+                tr_jids.append(tr_jid)
+
+            goms.append((gom_jid, gom.operations, tr_jids))
+
+        if settings.ROBOT_POOL:
+            robots = settings.POOL_ROBOTS if settings.POOL_ROBOTS is not None else layout_robots
+            for i in range(robots):
+                self.pool_tr_jids.append(place_tr(self.factory_map[goms[i % len(goms)][0]]))
+
+        recorder = trace.recorder
+        if recorder is not None:
+            for name, position in self.factory_map.items():
+                kind = recorder.intern("gom" if "@" in name else "warehouse")
+                recorder.record(trace.PLACE, recorder.intern(name), label=kind, x=position.x, y=position.y)
+            for tr_jid, position in self.tr_map.items():
+                recorder.record(trace.PLACE, recorder.intern(tr_jid), label=recorder.intern("tr"),
+                                x=position.x, y=position.y)
+
+        return goms
+
+    def admit_order(self) -> bool:
+        """Admission control for generated orders, based on last `ManagerStatus`. Above the high watermark (or
+        maximum wait) orders are shed, between watermarks generation rate drops linearly to zero.
+
+        :return: whether to generate an order now
+        """
+        if determinism.replay is not None:
+            return True  # journal holds admitted orders only
+        status = self.manager_status
+        low, high = settings.ADMISSION_LOW_WATERMARK, settings.ADMISSION_HIGH_WATERMARK
+        if status.queue_depth >= high or status.estimated_wait > settings.ADMISSION_MAX_WAIT:
+            return False
+        if status.queue_depth <= low:
+            return True
+        self.admission_credit += (high - status.queue_depth) / (high - low)
+        if self.admission_credit >= 1.:
+            self.admission_credit -= 1.
+            return True
+        return False
+
+    def evict_order(self, order_id: int):
+        """Forgets a finished or refused order.
+
+        :param order_id: order ID
+        :return: evicted order or None
+        """
+        self.order_created_at.pop(order_id, None)
+        return self.orders.pop(order_id, None)
 
-            self.factory_map[gom_jid] = Point(x=float(x), y=float(y))
-            self.tr_map[tr_jid] = Point(x=float(x + xo), y=float(y + yo))
+    def latency_report(self) -> str:
+        """Returns summary of order lifecycle stage durations, per priority class. See `industry2.metrics`."""
+        return metrics.lifecycle.summary()
 
-        return jids
+    def tr_list_patch(self) -> dict:
+        """Returns changes of TR states since the last call: TR JID -> changed fields of `TransportRobotAgent.state`.
+        States are taken only from TRs whose `state_version` changed. The first patch holds all fields of every TR.
+        """
+        patch = {}
+        for jid, tr in self.tr_list.items():
+            sent = self.tr_states.get(jid)
+            if sent is not None and sent[0] == tr.state_version:
+                continue
+            state = tr.state()
+            old = sent[1] if sent is not None else {}
+            fields = {k: v for k, v in state.items() if k not in old or old[k] != v}
+            self.tr_states[jid] = (tr.state_version, state)
+            if fields:
+                patch[jid] = fields
+        return patch
 
     def perform_view_model_update(self):
-        # Filter TR data before copying
-        tr_list_tmp = {k: TransportRobotAgent.filter(
-            v.__dict__) for k, v in self.tr_list.items()}
-        tr_list_copy = deepcopy(tr_list_tmp)
-
-        tr_map_copy = deepcopy(self.tr_map)
-        factory_map_copy = deepcopy(self.factory_map)
+        # Points and TR states are immutable, copying the dicts is enough
+        tr_map_copy = self.positions.points()
+        factory_map_copy = dict(self.factory_map)
 
         # Note that each param can be None. In that case it won't be updated.
         self.update_view_model.emit(
-            tr_list_copy, tr_map_copy, factory_map_copy)
+            self.tr_list_patch(), tr_map_copy, factory_map_copy)
+
 
+class Manager(BaseAgent):
+    role = "manager"
 
-class Manager(Agent):
     class MainLoop(CyclicBehaviour):
         """Main agent loop. Takes an order from queue, if available, updates its state and sends a request to a GoM."""
 
         async def on_start(self):
-            def_print("Starting main loop . . .")
+            logger.debug("Starting main loop . . .")
 
         async def run(self):
-            while not self.agent.orders or not self.agent.free_goms:  # service an order if possible
+            # service an order if possible
+            dispatch = self.agent.next_dispatch()
+            while dispatch is None:
                 await sleep(settings.MANAGER_LOOP_TIMEOUT)
-            # select a free gom to pass an order to
-            gom: GoMInfo = random.choice(list(self.agent.free_goms.values()))
-            self.agent.free_goms.pop(gom.jid)
+                dispatch = self.agent.next_dispatch()
+            order, gom = dispatch
+            determinism.record("dispatch", order_id=order.order_id, stage=order.current_operation, gom=gom.jid)
 
-            order: Order = heappop(self.agent.orders)
             oid = str(order.order_id)
+            queued_at = self.agent.queued_at.pop(oid, None)
+            if queued_at is not None:
+                metrics.record("queue", order.priority, time.monotonic() - queued_at)
             if oid not in self.agent.active_orders:
-                self.agent.active_orders[oid] = ActiveOrder(order, '')
+                warehouse = self.agent.warehouses[order.order_id % len(self.agent.warehouses)]
+                self.agent.active_orders[oid] = ActiveOrder(order, warehouse)
             payload = GoMOrder.create(
                 order, self.agent.active_orders[oid].location)
             msg = Message(to=gom.jid)
             msg.set_metadata("performative", "request")
             msg.body = payload.to_json()
             msg.thread = oid
-            def_print(f'Manager sent: {msg}')
+            self.agent.dispatched_at[oid] = time.monotonic()
+            logger.debug('Manager sent: %s', msg)
             await send(self, msg)
 
         async def on_end(self):
-            def_print(f"{self.agent} finished main loop with exit code {self.exit_code}.")
+            logger.debug("%s finished main loop with exit code %s.", self.agent, self.exit_code)
 
     class OrderRequestHandler(CyclicBehaviour):
         """Request from factory."""
@@ -366,9 +688,14 @@ class Manager(Agent):
             if msg is None:
                 return
             order = Order.from_json(msg.body)
-            heappush(self.agent.orders, order)
             reply = Message(self.agent.factory_jid)
-            reply.set_metadata("performative", "agree")
+            reply.thread = str(order.order_id)
+            if len(self.agent.orders) < settings.MANAGER_QUEUE_LIMIT and self.agent.supports(order):
+                self.agent.enqueue(order)
+                reply.set_metadata("performative", "agree")
+            else:
+                reply.set_metadata("performative", "refuse")
+            reply.body = self.agent.status().to_json()
             await send(self, reply)
 
     class OrderRefuseHandler(CyclicBehaviour):
@@ -381,8 +708,8 @@ class Manager(Agent):
             gom: GoMInfo = self.agent.gom_infos[str(msg.sender)]
             oid = msg.thread
             active_order: ActiveOrder = self.agent.active_orders[oid]
-            heappush(self.agent.orders, active_order.order)
-            def_print(f'{gom.jid} refused to process order{oid}.')
+            self.agent.enqueue(active_order.order)
+            logger.warning('%s refused to process order%s.', gom.jid, oid)
             raise UserWarning
 
     class OrderAgreeHandler(CyclicBehaviour):
@@ -393,7 +720,7 @@ class Manager(Agent):
             if msg is None:
                 return
             gom: GoMInfo = self.agent.gom_infos[str(msg.sender)]
-            def_print(f'Agree received for order {msg.thread} from {msg.sender}.')
+            logger.debug('Agree received for order %s from %s.', msg.thread, msg.sender)
 
     class OrderDoneHandler(CyclicBehaviour):
         """Inform from GoM."""
@@ -403,20 +730,26 @@ class Manager(Agent):
             if msg is None:
                 return
             gom: GoMInfo = self.agent.gom_infos[str(msg.sender)]
-            self.agent.free_goms[gom.jid] = gom
+            self.agent.release_gom(gom)
 
             oid = msg.thread
+            self.agent.update_stage_time(oid)
             active_order: ActiveOrder = self.agent.active_orders[oid]
             active_order.advance(gom.jid)
-            def_print(f'{msg.sender} has completed a stage of order{oid}.')
-            if not active_order.order.is_done():
-                heappush(self.agent.orders, active_order.order)
+            logger.debug('%s has completed a stage of order%s.', msg.sender, oid)
+            if oid in self.agent.cancelled_orders:
+                self.agent.cancelled_orders.discard(oid)
+                self.agent.active_orders.pop(oid)
+                logger.info('Order %s was cancelled, dropping it.', oid)
+            elif not active_order.order.is_done():
+                self.agent.enqueue(active_order.order)
             else:
                 self.agent.active_orders.pop(oid)
                 report = Message(self.agent.factory_jid)
                 report.set_metadata("performative", "inform")
                 report.thread = oid
-                def_print('It was the final stage.')
+                report.body = self.agent.status().to_json()
+                logger.debug('It was the final stage.')
                 await send(self, report)
 
     class MalfunctionHandler(CyclicBehaviour):
@@ -428,25 +761,76 @@ class Manager(Agent):
                 return
             key = str(msg.sender)
             if key == self.agent.factory_jid:
-                def_print('Failure notice received from the factory.')
+                logger.warning('Failure notice received from the factory.')
                 raise UserWarning
             gom: GoMInfo = self.agent.gom_infos[key]
-            def_print('Received malfunction notice:')
-            def_print(msg)
+            logger.warning('Received malfunction notice:')
+            logger.debug("%s", msg)
+
+    class OrderCancelHandler(CyclicBehaviour):
+        """Cancel from factory. Order ID is sent in `thread`. Replies with `confirm`, or `failure` if the order is
+        unknown."""
+
+        async def run(self):
+            msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
+            if msg is None:
+                return
+            reply = msg.make_reply()
+            order_id = order_id_of(msg)
+            if order_id >= 0 and self.agent.cancel_order(order_id):
+                reply.set_metadata("performative", "confirm")
+            else:
+                reply.set_metadata("performative", "failure")
+            await send(self, reply)
+
+    class OrderPriorityHandler(CyclicBehaviour):
+        """Priority change request from factory, with `priority` ontology. Order ID is sent in `thread`, new priority
+        in body. Replies with `agree`, or `refuse` if the order isn't waiting in queue."""
+
+        async def run(self):
+            msg = await self.receive(timeout=settings.RECEIVE_TIMEOUT)
+            if msg is None:
+                return
+            reply = msg.make_reply()
+            order_id = order_id_of(msg)
+            body = (msg.body or "").strip()
+            if order_id >= 0 and body.isdigit() and self.agent.update_priority(order_id, int(body)):
+                reply.set_metadata("performative", "agree")
+            else:
+                reply.set_metadata("performative", "refuse")
+            await send(self, reply)
 
-    def __init__(self, factory_jid: str, gom_infos, *args, **kwargs):
+    def __init__(self, factory_jid: str, gom_infos, warehouses=('',), *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.gom_infos: Dict[str, GoMInfo] = {}  # all goms
         self.free_goms: Dict[str, GoMInfo] = {}  # goms that can take an order
+        # free goms able to perform an operation
+        self.free_goms_by_op: Dict[Operation, Dict[str, GoMInfo]] = defaultdict(dict)
+        self.operations = set()  # operations some gom can perform
         for gom_jid, operations in gom_infos:
             gom = GoMInfo(jid=gom_jid, machines=[
-                Machine(operation=op) for op in operations])
+                Machine(operation=op, working=True) for op in operations])
             self.gom_infos[gom_jid] = gom
-            self.free_goms[gom_jid] = gom
-        self.orders: List[Order] = []  # all orders accepted from factory
+            self.operations.update(operations)
+            self.release_gom(gom)
+        self.warehouses = list(warehouses)  # names of warehouses orders are taken from
+        self.rng = determinism.rng("manager")
+        # (order_id, gom_jid) dispatches replayed from journal, next one is kept in `replayed_dispatch`
+        self.replayed_dispatches = determinism.replay.dispatches() if determinism.replay is not None else None
+        self.replayed_dispatch = None
+        self.replayed_dispatch_since = None  # time.monotonic() `replayed_dispatch` has been waited for since
+        self.last_order_id = -1  # highest ID of an order queued so far
+        # all orders accepted from factory, waiting for a GoM
+        self.orders = OrderQueue(aging_rate=settings.ORDER_AGING_RATE)
         # orders currently in progress
-        self.active_orders: Dict[str, Order] = {}
+        self.active_orders: Dict[str, ActiveOrder] = {}
+        self.cancelled_orders = set()  # IDs of active orders to be dropped after their current stage
+        self.queued_at: Dict[str, float] = {}  # order ID -> time.monotonic() of entering `orders`
+        self.dispatched_at: Dict[str, float] = {}  # order ID -> time.monotonic() of current stage request
+        self.stage_time = sum(settings.OP_DURATIONS.values()) / len(settings.OP_DURATIONS)  # s, moving average
         self.factory_jid: str = factory_jid
+        # number of free GoMs that only express orders can take
+        self.express_reserved_goms = math.ceil(settings.EXPRESS_RESERVED_GOM_SHARE * len(self.gom_infos))
 
         self.main_loop = self.MainLoop()
         self.req_handler = self.OrderRequestHandler()
@@ -454,13 +838,148 @@ class Manager(Agent):
         self.agr_handler = self.OrderAgreeHandler()
         self.done_handler = self.OrderDoneHandler()
         self.malfunction_handler = self.MalfunctionHandler()
+        self.cancel_handler = self.OrderCancelHandler()
+        self.priority_handler = self.OrderPriorityHandler()
+
+    def enqueue(self, order: Order) -> None:
+        """Puts an order into queue, waiting for its next stage."""
+        self.orders.push(order)
+        self.queued_at[str(order.order_id)] = time.monotonic()
+        self.last_order_id = max(self.last_order_id, order.order_id)
+
+    def update_stage_time(self, oid: str) -> None:
+        """Updates moving average of stage time (GoM request to GoM inform) with a finished stage."""
+        dispatched_at = self.dispatched_at.pop(oid, None)
+        if dispatched_at is not None:
+            alpha = settings.STAGE_TIME_EWMA_ALPHA
+            self.stage_time += alpha * (time.monotonic() - dispatched_at - self.stage_time)
+
+    def status(self) -> ManagerStatus:
+        """Returns current `ManagerStatus`, reported to factory for admission control."""
+        queue_depth = len(self.orders)
+        return ManagerStatus(queue_depth=queue_depth, active_orders=len(self.active_orders),
+                             estimated_wait=queue_depth * self.stage_time / max(len(self.gom_infos), 1))
+
+    def supports(self, order: Order) -> bool:
+        """Predicate that checks if every operation of this order can be performed by some GoM."""
+        return self.operations.issuperset(order.operation_list())
+
+    def next_dispatch(self):
+        """Selects next order and a free GoM for it, marking the GoM as busy. When replaying a journal, dispatches
+        follow the journal until it runs out. A replayed dispatch of an order neither queued nor in progress is
+        dropped once a later order has been queued, or after `settings.REPLAY_DISPATCH_TIMEOUT`, e.g. when the order
+        was refused or cancelled.
+
+        :return: (order, gom) tuple or None if no order can be dispatched now
+        """
+        while self.replayed_dispatches is not None:
+            if self.replayed_dispatch is None:
+                self.replayed_dispatch = next(self.replayed_dispatches, None)
+                self.replayed_dispatch_since = time.monotonic()
+            if self.replayed_dispatch is None:
+                self.replayed_dispatches = None
+                break
+            order_id, gom_jid = self.replayed_dispatch
+            if order_id in self.orders:
+                if gom_jid not in self.free_goms:
+                    return None
+                self.replayed_dispatch = None
+                return self.orders.remove(order_id), self.take_gom(self.free_goms[gom_jid])
+            if str(order_id) in self.active_orders:
+                return None  # waits for the stage in progress
+            waited = time.monotonic() - self.replayed_dispatch_since
+            if order_id > self.last_order_id and waited < settings.REPLAY_DISPATCH_TIMEOUT:
+                return None  # waits for the order to arrive
+            logger.warning('Dropping replayed dispatch of order %s to %s, the order is not queued.', order_id, gom_jid)
+            self.replayed_dispatch = None
+
+        if not self.free_goms:
+            return None
+        # The most urgent order a free GoM can take, one whose operation has no free GoM doesn't block the rest. When
+        # only GoMs reserved for express orders are free, regular orders are passed over, including an aged one at
+        # the head, so express orders behind them still get the reserved GoMs.
+        orders = self.orders
+        if len(self.free_goms) <= self.express_reserved_goms:
+            orders = (order for order in orders if order.is_express())
+        order: Order = next((order for order in orders if self.can_dispatch(order)), None)
+        if order is None:
+            return None
+        self.orders.remove(order.order_id)
+        # select a random free gom able to perform current operation
+        free_goms = self.free_goms_by_op[order.operation_at(order.current_operation)]
+        gom: GoMInfo = self.rng.choice(list(free_goms.values()))
+        return order, self.take_gom(gom)
+
+    def take_gom(self, gom: GoMInfo) -> GoMInfo:
+        """Marks a GoM as busy.
+
+        :return: the GoM
+        """
+        self.free_goms.pop(gom.jid)
+        for machine in gom.machines:
+            self.free_goms_by_op[machine.operation].pop(gom.jid, None)
+        return gom
+
+    def release_gom(self, gom: GoMInfo) -> None:
+        """Marks a GoM as free."""
+        self.free_goms[gom.jid] = gom
+        for machine in gom.machines:
+            self.free_goms_by_op[machine.operation][gom.jid] = gom
+
+    def can_dispatch(self, order: Order) -> bool:
+        """Predicate that checks if there is a free GoM for this order. Regular orders can't take the GoMs reserved
+        for express orders. Orders go back to the queue after every stage, so express orders also overtake regular
+        ones that are already in progress.
+
+        :param order: queued order
+        :return: result
+        """
+        if not self.free_goms_by_op[order.operation_at(order.current_operation)]:
+            return False
+        if order.is_express():
+            return True
+        return len(self.free_goms) > self.express_reserved_goms
+
+    def cancel_order(self, order_id: int) -> bool:
+        """Cancels an order. Queued orders are removed at once, orders being processed by a GoM are dropped after
+        their current stage.
+
+        :param order_id: order ID
+        :return: False if the order is unknown
+        """
+        oid = str(order_id)
+        if order_id in self.orders:
+            self.orders.remove(order_id)
+            self.queued_at.pop(oid, None)
+            self.active_orders.pop(oid, None)
+            return True
+        if oid in self.active_orders:
+            self.cancelled_orders.add(oid)
+            return True
+        return False
+
+    def update_priority(self, order_id: int, priority: int) -> bool:
+        """Changes priority of a queued order, e.g. to let an urgent order jump the queue.
+
+        :param order_id: order ID
+        :param priority: new priority (N, 0 max)
+        :return: False if the order isn't waiting in queue
+        """
+        if order_id not in self.orders:
+            return False
+        self.orders.update_priority(order_id, priority)
+        return True
 
     async def setup(self):
-        def_print("Manager starting . . .")
+        logger.debug("Manager starting . . .")
         fac_temp = Template()
         fac_temp.sender = self.factory_jid
         fac_temp.metadata = {"performative": "request"}
-        self.add_behaviour(self.req_handler, fac_temp)
+        priority_temp = Template()
+        priority_temp.sender = self.factory_jid
+        priority_temp.metadata = {"performative": "request", "ontology": "priority"}
+        self.add_behaviour(self.req_handler, fac_temp & ~priority_temp)
+        self.add_behaviour(self.priority_handler, priority_temp)
         ref_temp = Template()
         ref_temp.metadata = {"performative": "refuse"}
         self.add_behaviour(self.ref_handler, ref_temp)
@@ -473,14 +992,22 @@ class Manager(Agent):
         malfunction_temp = Template()
         malfunction_temp.metadata = {"performative": "failure"}
         self.add_behaviour(self.malfunction_handler, malfunction_temp)
+        cancel_temp = Template()
+        cancel_temp.sender = self.factory_jid
+        cancel_temp.metadata = {"performative": "cancel"}
+        self.add_behaviour(self.cancel_handler, cancel_temp)
         self.add_behaviour(self.main_loop)
 
 
-class GroupOfMachinesAgent(Agent):
-    def __init__(self, manager_jid, tr_jid, machines, *args, **kwargs):
+class GroupOfMachinesAgent(BaseAgent):
+    role = "gom"
+
+    def __init__(self, manager_jid, tr_jid, machines, pool=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.manager_jid = manager_jid
-        self.tr_jid = tr_jid
+        self.tr_jid = tr_jid  # TR taking transport requests, None if pooled
+        self.pool = pool  # RobotPool transports are requested from, None if not pooled
+        self.transport_jid = None  # TR transporting the current order
         self.machines = defaultdict(list)  # GoM's Machines collection
         for operation in machines:
             self.machines[operation].append(
@@ -489,6 +1016,8 @@ class GroupOfMachinesAgent(Agent):
         self.order = None  # current order
         # request message (from Manager) related to self.order
         self.msg_order = None
+        self.busy_time = 0.  # s, total time of finished work
+        self.busy_since = None  # time.monotonic() of the start of current work
 
     class WorkBehaviour(OneShotBehaviour):
         """Perform work on current order."""
@@ -496,8 +1025,18 @@ class GroupOfMachinesAgent(Agent):
         async def run(self):
             assert self.agent.order is not None
 
+            recorder = trace.recorder
+            if recorder is not None:
+                recorder.record(trace.WORK_START, recorder.intern(self.agent.jid), order=self.agent.order.order_id)
             work_duration = settings.OP_DURATIONS[self.agent.order.operation]
+            started_at = self.agent.busy_since = time.monotonic()
             await asyncio.sleep(work_duration)
+            worked = time.monotonic() - started_at
+            self.agent.busy_time += worked
+            self.agent.busy_since = None
+            metrics.record("machining", self.agent.order.priority, worked)
+            if recorder is not None:
+                recorder.record(trace.WORK_END, recorder.intern(self.agent.jid), order=self.agent.order.order_id)
 
             # Reply to Manager with `inform`
             assert self.agent.msg_order is not None
@@ -510,6 +1049,28 @@ class GroupOfMachinesAgent(Agent):
             self.agent.order = None
             self.agent.msg_order = None
 
+    class RequestTransportBehaviour(OneShotBehaviour):
+        """Takes a robot from the shared pool and requests transport of the current order from it."""
+
+        def __init__(self, body):
+            super().__init__()
+            self.body = body
+
+        async def run(self):
+            order = self.agent.order
+            replayed = None
+            if determinism.replay is not None:
+                replayed = determinism.replay.choice("transport", order.order_id)
+            tr_jid = await self.agent.pool.acquire(order.location, replayed["tr"] if replayed is not None else None)
+            determinism.record("transport", gom=str(self.agent.jid), order_id=order.order_id, tr=tr_jid)
+            await self.agent.request_transport(self, tr_jid, self.body)
+
+    def busy(self, now: float) -> float:
+        """Returns total work time (s) until `now`, a `time.monotonic()`, current work included."""
+        if self.busy_since is None:
+            return self.busy_time
+        return self.busy_time + now - self.busy_since
+
     def can_accept_order(self, order):
         """Predicate that checks if TR can accept this order.
 
@@ -533,6 +1094,8 @@ class GroupOfMachinesAgent(Agent):
         """
 
         assert msg is not None
+        if not self.from_transport(msg):
+            return
 
     async def handle_tr_inform(self, msg, recv):
         """On `inform` message from `TR`
@@ -542,8 +1105,22 @@ class GroupOfMachinesAgent(Agent):
         """
 
         assert msg is not None
+        if not self.from_transport(msg):
+            return
+        self.transport_jid = None
         self.add_behaviour(self.WorkBehaviour())
 
+    def from_transport(self, msg) -> bool:
+        """Predicate that checks if `msg` comes from the TR transporting the current order.
+
+        Pooled, TR messages are accepted from any TR, see `setup`.
+        """
+
+        if str(msg.sender) == self.transport_jid:
+            return True
+        logger.debug('gom %s ignores %s from tr_jid=%s', self.jid, msg.get_metadata('performative'), msg.sender)
+        return False
+
     async def handle_manager_request(self, msg, recv):
         """On `request` message from `Manager`
 
@@ -568,12 +1145,27 @@ class GroupOfMachinesAgent(Agent):
         if accepted:
             if str(self.jid) == order.location:
                 self.add_behaviour(self.WorkBehaviour())
+            elif self.pool is not None:
+                self.add_behaviour(self.RequestTransportBehaviour(msg.body))
             else:
-                msg_tr = Message(to=self.tr_jid, body=msg.body)
-                msg_tr.set_metadata('performative', 'request')
-                await send(recv, msg_tr)
+                await self.request_transport(recv, self.tr_jid, msg.body)
+
+    async def request_transport(self, behaviour, tr_jid, body):
+        """Requests transport of the current order from a TR.
+
+        :param behaviour: calling behaviour
+        :param tr_jid: TR
+        :param body: GoMOrder as JSON
+        """
+
+        self.transport_jid = str(tr_jid)
+        msg_tr = Message(to=tr_jid, body=body)
+        msg_tr.set_metadata('performative', 'request')
+        msg_tr.set_metadata('ontology', 'transport')
+        await send(behaviour, msg_tr)
 
     async def setup(self):
+        # Pooled, `tr_jid` is None and TR messages are accepted from any TR
         self.add_behaviour(
             behaviour=RecvBehaviour(self.handle_manager_request),
             template=Template(sender=self.manager_jid, metadata={
@@ -591,7 +1183,7 @@ class GroupOfMachinesAgent(Agent):
         )
 
 
-class HelperBehaviour(FSMBehaviour):
+class HelperBehaviour(TracedFSMBehaviour):
     MOVE_TO_SRC_STATE = 'MOVE_TO_SRC_STATE'
     WAIT_FOR_START_STATE = 'WAIT_FOR_START_STATE'
     MOVE_TO_DST_STATE = 'MOVE_TO_DST_STATE'
@@ -599,13 +1191,15 @@ class HelperBehaviour(FSMBehaviour):
 
     async def on_end(self):
         self.agent.order, self.agent.msg_order = self.agent.old_order
+        self.agent.leader = None
         self.agent.idle = True
+        self.agent.return_to_pool()
 
     @classmethod
     def create(cls, agent):
         helper = cls()
         src = agent.factory_map[agent.order.location]
-        dst = agent.factory_map[agent.leader.replace("tr", "gom")]
+        dst = agent.factory_map[agent.msg_order.get_metadata('gom')]  # leader's GoM
 
         helper.add_state(name=cls.MOVE_TO_SRC_STATE, state=MoveState(name=cls.MOVE_TO_SRC_STATE,
                                                                      next_state=cls.WAIT_FOR_START_STATE,
@@ -644,7 +1238,7 @@ class FinishState(State):
         await send(self, Message(to=self.agent.leader, metadata={'performative': 'inform'}))
 
 
-class LeaderBehaviour(FSMBehaviour):
+class LeaderBehaviour(TracedFSMBehaviour):
     FIND_HELPERS_STATE = 'FIND_HELPERS_STATE'
     MOVE_SRC_STATE = 'MOVE_SRC_STATE'
     WAIT_FOR_HELPERS_SRC_STATE = 'WAIT_FOR_HELPERS_SRC_STATE'
@@ -677,7 +1271,7 @@ class LeaderBehaviour(FSMBehaviour):
                                                    next_state=cls.MOVE_DST_STATE,
                                                    home=False))
 
-        dst = agent.factory_map[agent.gom_jid]
+        dst = agent.factory_map[agent.order_gom()]
         leader.add_state(name=cls.MOVE_DST_STATE,
                          state=MoveState(name=cls.MOVE_DST_STATE,
                                          next_state=cls.WAIT_FOR_HELPERS_DST_STATE,
@@ -709,12 +1303,17 @@ class FindHelpersState(State):
             self.agent.informs_left = self.agent.order.tr_count - 1
             self.agent.inform_received = {}
 
-            for tr_jid in self.agent.tr_jids:
+            # Replaying a journal, only the recorded helpers are asked
+            replayed = None
+            if determinism.replay is not None:
+                replayed = determinism.replay.choice("helpers", self.agent.order.order_id)
+            for tr_jid in replayed["helpers"] if replayed is not None else self.agent.tr_jids:
                 msg = Message(to=tr_jid)
                 msg.set_metadata('performative', 'request')
+                msg.set_metadata('gom', self.agent.order_gom())
                 msg.body = payload
                 await send(self, msg)
-                def_print(msg)
+                logger.debug("%s", msg)
 
             # Mark requests state as sent,
             self.agent.sent_help_requests = True
@@ -723,6 +1322,11 @@ class FindHelpersState(State):
         if len(self.agent.helpers) + 1 < self.agent.order.tr_count:
             self.set_next_state(LeaderBehaviour.FIND_HELPERS_STATE)
         else:
+            determinism.record("helpers", leader=str(self.agent.jid), order_id=self.agent.order.order_id,
+                               helpers=list(self.agent.helpers))
+            now = time.monotonic()
+            metrics.record("recruitment", self.agent.order.priority, now - self.agent.travel_started_at)
+            self.agent.travel_started_at = now
             self.set_next_state(LeaderBehaviour.MOVE_SRC_STATE)
 
 
@@ -753,7 +1357,7 @@ class WaitForHelpersState(State):
                 msg.set_metadata('performative', 'inform')
                 msg.body = self.agent.order.to_json()
                 await send(self, msg)
-                def_print(msg)
+                logger.debug("%s", msg)
 
             self.agent.informs_left = self.agent.order.tr_count - 1
             for k in self.agent.inform_received:
@@ -765,18 +1369,25 @@ class WaitForHelpersState(State):
             self.set_next_state(self.name)
 
 
-class TransportRobotAgent(Agent):
-    def __init__(self, position, gom_jid, factory_jid, factory_map, tr_jids, *args, **kwargs):
+class TransportRobotAgent(BaseAgent):
+    role = "tr"
+
+    def __init__(self, position, gom_jid, factory_jid, factory_map, tr_jids, express_only=False, pool=None, *args,
+                 **kwargs):
         super().__init__(*args, **kwargs)
         self.idle = True
+        self.express_only = express_only  # if True, only helps other TRs with express orders, never enters the pool
         self.position = position
-        self.gom_jid = gom_jid
+        self.gom_jid = gom_jid  # None if pooled
         self.factory_jid = factory_jid
         self.factory_map = factory_map
         self.tr_jids = tr_jids
+        self.pool = pool  # RobotPool the TR returns to when free, None if not pooled
         self.order = None  # from mother gom originally, replaced by current when helping
         self.msg_order = None  # from mother gom, as above
         self.loaded_order = None
+        self.requested_at = None  # time.monotonic() of GoM's request for own order
+        self.travel_started_at = None  # time.monotonic() of starting to fetch own order
 
         # TODO
         self.helping = {}
@@ -791,8 +1402,39 @@ class TransportRobotAgent(Agent):
         self.ready = False  # if able to proceed with the cooperative order
 
     # List of fields used when serializing.
-    serialized_fields = ['factory_jid', 'gom_jid', 'leader',
+    serialized_fields = ['factory_jid', 'gom_jid', 'leader', 'express_only',
                          'helping', 'helpers', 'idle', 'jid', 'loaded_order', 'order']
+    _serialized_fields = frozenset(serialized_fields)
+    state_version = 0  # incremented by `touch`
+
+    def __setattr__(self, name, value):
+        if name in TransportRobotAgent._serialized_fields:
+            self.touch()
+        super().__setattr__(name, value)
+
+    def touch(self) -> None:
+        """Marks serialized state as changed. Assigning a serialized field does it, in-place changes must call it."""
+        self.__dict__['state_version'] = self.state_version + 1
+
+    def activity(self) -> str:
+        """Returns one of `industry2.utilization.ROBOT_STATES`."""
+        if self.leader is not None:
+            return "helping"
+        return "idle" if self.idle else "busy"
+
+    def state(self) -> dict:
+        """Returns `serialized_fields` as an immutable snapshot, safe to hand over to another thread. Lists become
+        tuples, `helping` becomes a tuple of leader JIDs.
+        """
+        state = {}
+        for field in TransportRobotAgent.serialized_fields:
+            value = getattr(self, field)
+            if isinstance(value, (list, dict)):
+                value = tuple(value)
+            elif field == 'jid':
+                value = str(value)
+            state[field] = value
+        return state
 
     def filter(d: dict) -> dict:
         """Filters a given dictionary by `serialized_fields`.
@@ -814,21 +1456,28 @@ class TransportRobotAgent(Agent):
             await asyncio.sleep(self.period.total_seconds())
 
         async def run(self):
-            position = self.agent.position.to_array()
-            vector = self.destination.to_array() - position
-            remaining = np.linalg.norm(vector)
+            position, destination = self.agent.position, self.destination
+            dx, dy = destination.x - position.x, destination.y - position.y
+            remaining = math.hypot(dx, dy)
             if remaining <= self.tick_distance:
-                self.agent.position = self.destination
+                self.agent.position = destination
                 await self.after_tick()  # call after kill (after if)?
                 self.kill()
             else:
-                position += (self.tick_distance / remaining) * vector
-                self.agent.position = Point.create(position)
+                scale = self.tick_distance / remaining
+                self.agent.position = Point(position.x + scale * dx, position.y + scale * dy)
                 await self.after_tick()
 
         async def after_tick(self):
             """Method called after each tick"""
 
+            recorder = trace.recorder
+            if recorder is not None:
+                order = self.agent.order
+                recorder.record(trace.MOVE, recorder.intern(self.agent.jid),
+                                order=order.order_id if order is not None else -1,
+                                x=self.agent.position.x, y=self.agent.position.y)
+
             msg = Message(
                 to=self.agent.factory_jid,
                 body=self.agent.position.to_json()
@@ -896,7 +1545,7 @@ class TransportRobotAgent(Agent):
         assert self.order is not None
 
         self.loaded_order = self.order
-        destination = self.factory_map[self.gom_jid]
+        destination = self.factory_map[self.order_gom()]
         move_behaviour = self.move(destination)
         self.add_after_behaviour(move_behaviour, self.deliver_order)
 
@@ -913,10 +1562,22 @@ class TransportRobotAgent(Agent):
         reply = self.msg_order.make_reply()
         reply.set_metadata('performative', 'inform')
         await send(behaviour, reply)
+        metrics.record("travel", self.order.priority, time.monotonic() - self.travel_started_at)
         self.loaded_order = None
         self.msg_order = None
         self.order = None
         self.idle = True
+        self.return_to_pool()
+
+    def order_gom(self) -> str:
+        """Returns JID of the GoM that requested the own order, its destination."""
+        return str(self.msg_order.sender)
+
+    def return_to_pool(self) -> None:
+        """Returns the TR to the shared pool if pooled and free, i.e. neither transporting nor helping. TRs reserved
+        for express orders stay out of the pool."""
+        if self.pool is not None and not self.express_only and self.order is None and self.leader is None:
+            self.pool.release(str(self.jid), self.position)
 
     def get_order(self):
         """Gets an order (self.order) for GoM."""
@@ -932,12 +1593,18 @@ class TransportRobotAgent(Agent):
         :param recv: calling behaviour
         """
 
-        assert self.msg_order is None
-        assert self.order is None
+        order = GoMOrder.from_json(msg.body)
+        if self.leader is not None:
+            # Helping, the order is taken up once done, see `HelperBehaviour.on_end`
+            self.old_order = order, msg
+        else:
+            assert self.msg_order is None
+            assert self.order is None
 
-        self.msg_order = msg
-        self.order = GoMOrder.from_json(msg.body)
-        reply = self.msg_order.make_reply()
+            self.msg_order = msg
+            self.order = order
+        self.requested_at = time.monotonic()
+        reply = msg.make_reply()
         reply.set_metadata('performative', 'agree')
         await send(recv, reply)
 
@@ -954,16 +1621,23 @@ class TransportRobotAgent(Agent):
         await send(recv, reply)
 
     def help(self, sender, order):
-        return True
+        return not self.express_only or order.is_express()
 
     def decide(self):
         if len(self.helping) > 0:
             self.old_order = self.order, self.msg_order
             self.leader, (self.order, self.msg_order, _) = list(self.helping.items())[0]
             self.helping.pop(self.leader)
+            self.touch()
+            if self.pool is not None:
+                self.pool.reserve(str(self.jid))
             self.add_behaviour(HelperBehaviour.create(self))
             return False
         if self.order is not None:
+            now = time.monotonic()
+            metrics.record("robot_wait", self.order.priority, now - self.requested_at)
+            # Leaders start travelling once they have helpers, recruitment is measured until then
+            self.travel_started_at = now
             if self.order.tr_count > 1:
                 self.add_behaviour(LeaderBehaviour.create(self))
             else:
@@ -977,17 +1651,19 @@ class TransportRobotAgent(Agent):
             if len(self.pending_helping):
                 key = str(msg.sender)
                 self.helping[key] = self.pending_helping.pop(key)
+                self.touch()
                 return
             # Agree only if agent hasn't got enough helpers
             reply = msg.make_reply()
             if len(self.helpers) + 1 < self.order.tr_count:
                 self.helpers.append(str(msg.sender))
+                self.touch()
                 self.inform_received[str(msg.sender)] = False
                 reply.set_metadata('performative', 'agree')
-                def_print(f'{self.jid}: AGREE {msg.sender} -> AGREE')
+                logger.debug('%s: AGREE %s -> AGREE', self.jid, msg.sender)
             else:
                 reply.set_metadata('performative', 'refuse')
-                def_print(f'{self.jid}: AGREE {msg.sender} -> REFUSE')
+                logger.debug('%s: AGREE %s -> REFUSE', self.jid, msg.sender)
             await send(recv, reply)
         else:
             # Message is not related to current requests as leader
@@ -1000,7 +1676,7 @@ class TransportRobotAgent(Agent):
                 self.pending_helping.pop(str(msg.sender))
                 self.current_refuse_temp = None
                 self.current_agree_temp = None
-            def_print(f'{self.jid}: REFUSE {msg.sender}')
+            logger.debug('%s: REFUSE %s', self.jid, msg.sender)
         else:
             return
 
@@ -1014,7 +1690,7 @@ class TransportRobotAgent(Agent):
                 if not self.inform_received[str(msg.sender)]:
                     self.inform_received[str(msg.sender)] = True
                     self.informs_left -= 1
-                    def_print(f'{self.jid} got INFORM from {msg.sender} | left: {self.informs_left}')
+                    logger.debug('%s got INFORM from %s | left: %s', self.jid, msg.sender, self.informs_left)
 
                 if self.informs_left == 0:
                     self.ready = True
@@ -1038,8 +1714,9 @@ class TransportRobotAgent(Agent):
     async def setup(self):
         self.add_behaviour(
             behaviour=RecvBehaviour(self.handle_gom_request),
+            # Pooled, `gom_jid` is None and transport requests are accepted from any GoM
             template=Template(sender=self.gom_jid, metadata={
-                'performative': 'request'})
+                'performative': 'request', 'ontology': 'transport'})
         )
         self.add_behaviour(
             behaviour=self.DecideBehaviour(
@@ -1063,3 +1740,4 @@ class TransportRobotAgent(Agent):
             behaviour=RecvBehaviour(self.handle_tr_inform),
             template=self.tr_template(metadata={'performative': 'inform'})
         )
+        self.return_to_pool()
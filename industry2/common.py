@@ -1,28 +1,60 @@
 from dataclasses import dataclass
-from typing import List
+from typing import TYPE_CHECKING, List, NewType, Sequence
 
-import numpy as np
-from dataclasses_json import dataclass_json
+from dataclasses_json import cfg, dataclass_json
 
+import industry2.settings as settings
 from industry2.enums import Operation
 
+if TYPE_CHECKING:
+    import numpy
+
+# Dataclasses below declare `__slots__` by hand (Python 3.8 has no `dataclass(slots=True)`), so their fields can't have
+# defaults. Frozen ones define `__reduce__`, default pickling and copying of slots would set frozen attributes.
+
+OPERATION_BY_VALUE = {op.value: op for op in Operation}
+
+
+# Compact sequence of small ints (0-255), e.g. `Operation` values, encoded in JSON as a list of ints
+Codes = NewType("Codes", bytes)
+cfg.global_config.encoders[Codes] = list
+cfg.global_config.decoders[Codes] = bytes
+
+MAX_TR_COUNT = 255  # TRs an operation can need, `Order.tr_counts` are `Codes`
+
 
 @dataclass_json
 @dataclass(order=True)
 class Order:
+    __slots__ = ('priority', 'order_id', 'operations', 'tr_counts', 'current_operation')
     priority: int  # N, 0 max
     order_id: int  # unique
-    operations: List[Operation]
-    tr_counts: List[int]
+    operations: Codes  # `Operation` values
+    tr_counts: Codes
     current_operation: int  # index
 
+    @classmethod
+    def create(cls: type, priority: int, order_id: int, operations: Sequence[Operation], tr_counts: Sequence[int],
+               current_operation: int = 0):
+        return cls(priority, order_id, bytes(op.value for op in operations), bytes(tr_counts), current_operation)
+
+    def operation_at(self, index: int) -> Operation:
+        return OPERATION_BY_VALUE[self.operations[index]]
+
+    def operation_list(self) -> List[Operation]:
+        return [OPERATION_BY_VALUE[value] for value in self.operations]
+
     def is_done(self):
         return len(self.operations) <= self.current_operation
 
+    def is_express(self):
+        return self.priority <= settings.EXPRESS_PRIORITY
+
 
 @dataclass_json
-@dataclass
+@dataclass(frozen=True)
 class GoMOrder:
+    __slots__ = ('priority', 'order_id', 'location', 'operation', 'tr_count')
     priority: int  # N, 0 max
     order_id: int  # unique
     location: str  # "" - warehouse, "address@host" - socket_id
@@ -31,22 +63,47 @@ class GoMOrder:
 
     @classmethod
     def create(cls: type, order: Order, last: str):
-        return cls(order.priority, order.order_id, last, order.operations[order.current_operation],
+        return cls(order.priority, order.order_id, last, order.operation_at(order.current_operation),
                    order.tr_counts[order.current_operation])
 
+    def is_express(self):
+        return self.priority <= settings.EXPRESS_PRIORITY
+
+    def __reduce__(self):
+        return type(self), (self.priority, self.order_id, self.location, self.operation, self.tr_count)
+
+    def __deepcopy__(self, memo):
+        return self  # immutable
+
 
 @dataclass_json
 @dataclass
+class ManagerStatus:
+    queue_depth: int = 0  # orders waiting for a GoM
+    active_orders: int = 0  # orders accepted and not finished yet
+    estimated_wait: float = 0.  # s, until a new order gets its first GoM
+
+
+@dataclass_json
+@dataclass(frozen=True)
 class Point:
+    __slots__ = ('x', 'y')
     x: float
     y: float
 
-    def to_array(self) -> np.array:
+    def to_array(self) -> "numpy.ndarray":
+        import numpy as np  # only needed here, keeps importing `common` cheap
         return np.array((self.x, self.y))
 
     @classmethod
-    def create(cls: type, point: np.array):
-        return cls(point[0], point[1])
+    def create(cls: type, point: Sequence[float]):
+        return cls(float(point[0]), float(point[1]))
+
+    def __reduce__(self):
+        return type(self), (self.x, self.y)
+
+    def __deepcopy__(self, memo):
+        return self  # immutable
 
 
 def clip(n, min_n, max_n):
@@ -0,0 +1,135 @@
+"""Seeding of random sources and the run journal.
+
+With `settings.SEED` set, every random source (layout, TR placement, Manager's choices, workload) gets its own stream
+derived from that seed, so adding a draw in one place doesn't shift the others.
+
+The journal is an append-only JSON lines file of external inputs (admitted orders) and scheduling decisions (Manager's
+dispatches, helpers chosen by leaders, robots taken from the pool). Replaying a journal feeds the same orders with the
+same IDs, makes Manager repeat the same dispatches in the same sequence, leaders recruit the same helpers and GoMs take
+the same robots from the pool, with the seed recorded in the journal.
+"""
+import hashlib
+import json
+import random
+import time
+from collections import defaultdict, deque
+from typing import Dict, Iterator, Optional
+
+import industry2.settings as settings
+from industry2.enums import Operation
+
+
+class Journal:
+    """Append-only run journal.
+
+    :param path: Path to the journal file, appended to.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", buffering=1)  # line buffered, so a crashed run keeps its journal
+        self._start = time.monotonic()
+
+    def record(self, kind: str, **fields) -> None:
+        """Appends a record.
+
+        :param kind: Record kind, e.g. "order" or "dispatch".
+        :param fields: JSON serializable record fields.
+        """
+        fields["kind"] = kind
+        fields["t"] = round(time.monotonic() - self._start, 6)
+        self._file.write(json.dumps(fields) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JournalReplay:
+    """Reads a journal lazily, one kind of records at a time.
+
+    :param path: Path to the journal file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.seed = next((record.get("seed") for record in self.records("run")), None)
+        self._choices: Dict[str, Dict[int, deque]] = {}  # kind -> order ID -> records not replayed yet
+
+    def records(self, kind: str) -> Iterator[dict]:
+        with open(self.path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record["kind"] == kind:
+                        yield record
+
+    def orders(self):
+        """Admitted orders as order specs (see `industry2.workload`), with arrival times as recorded."""
+        for record in self.records("order"):
+            yield (record["time"], record["priority"], [Operation[name] for name in record["operations"]],
+                   record["tr_counts"])
+
+    def dispatches(self) -> Iterator[tuple]:
+        """Manager's dispatches, as (order_id, gom_jid) in recorded sequence."""
+        for record in self.records("dispatch"):
+            yield record["order_id"], record["gom"]
+
+    def choice(self, kind: str, order_id: int) -> Optional[dict]:
+        """Takes the next record of a per-stage choice of an order, e.g. "helpers" or "transport". An order makes the
+        same choice once per stage, so its records are taken in recorded sequence.
+
+        :return: the record, None if the order has none left
+        """
+        if kind not in self._choices:
+            choices = self._choices[kind] = defaultdict(deque)
+            for record in self.records(kind):
+                choices[record["order_id"]].append(record)
+        records = self._choices[kind].get(order_id)
+        return records.popleft() if records else None
+
+
+seed: Optional[int] = settings.SEED
+journal: Optional[Journal] = None
+replay: Optional[JournalReplay] = None
+
+
+def setup() -> None:
+    """Opens journal and replay configured in `settings`. Replayed runs use the seed from their journal, others
+    `settings.SEED` as set when called."""
+    global seed, journal, replay
+    seed = settings.SEED
+    if settings.REPLAY_JOURNAL is not None and replay is None:
+        replay = JournalReplay(settings.REPLAY_JOURNAL)
+    if replay is not None and replay.seed is not None:
+        seed = replay.seed
+    if settings.JOURNAL_FILE is not None and journal is None:
+        journal = Journal(settings.JOURNAL_FILE)
+        journal.record("run", seed=seed, replay=settings.REPLAY_JOURNAL, layout=settings.LAYOUT_FILE)
+
+
+def shutdown() -> None:
+    """Closes the journal and drops the replay, see `setup`."""
+    global journal, replay
+    if journal is not None:
+        journal.close()
+        journal = None
+    replay = None
+
+
+def seed_for(name: str) -> Optional[int]:
+    """Returns seed of a named random stream, None if runs aren't seeded."""
+    if seed is None:
+        return None
+    digest = hashlib.sha256(f"{seed}:{name}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def rng(name: str) -> random.Random:
+    """Returns a new random generator for a named stream."""
+    return random.Random(seed_for(name))
+
+
+def record(kind: str, **fields) -> None:
+    """Appends a record to the journal, if enabled."""
+    if journal is not None:
+        journal.record(kind, **fields)
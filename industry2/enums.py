@@ -1,4 +1,4 @@
-from enum import Enum, auto
+from enum import Enum, IntEnum, auto
 
 
 class Operation(Enum):
@@ -16,3 +16,13 @@ class Operation(Enum):
     GRIND = auto()
     CUT_GLASS = auto()
     LASER_MARK = auto()
+
+
+class TraceEvent(IntEnum):
+    MSG_SENT = auto()
+    MSG_RECEIVED = auto()
+    STATE = auto()  # FSM entered a state, state name in label
+    WORK_START = auto()
+    WORK_END = auto()
+    MOVE = auto()  # TR position after a move tick
+    PLACE = auto()  # initial position of a TR, GoM or warehouse, kind ("tr", "gom", "warehouse") in label
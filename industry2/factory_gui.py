@@ -1,16 +1,23 @@
-import re
 import sys
 import time
 import traceback
+from types import MappingProxyType
 
+import numpy as np
 from PyQt5 import QtGui
-from PyQt5.QtCore import *
-from PyQt5.QtWidgets import *
-from spade import quit_spade
+from PyQt5.QtCore import (QLineF, QObject, QPointF, QRect, QRectF, QRunnable, Qt, QThreadPool, QTimer, pyqtSignal,
+                          pyqtSlot)
+from PyQt5.QtWidgets import (QApplication, QCheckBox, QComboBox, QFileDialog, QHBoxLayout, QLabel, QMainWindow,
+                             QMessageBox, QPushButton, QSizePolicy, QSlider, QVBoxLayout, QWidget)
 
 import industry2.settings as settings
-from industry2.agents import FactoryAgent
+from industry2 import determinism, log, message_flow, profiling, trace
 from industry2.common import Point, clip
+from industry2.positions import PositionStore
+from industry2.spatial import GridIndex
+
+# The agent system (spade), playback and streaming are imported where they are first used, a viewer or a playback
+# session doesn't load the agents.
 
 COLORS = [
     # 17 undertones https://lospec.com/palette-list/17undertones
@@ -26,9 +33,18 @@ class ViewModel:
 
         :param set_description_text_callback: Callback to be used after setting description text.
         """
-        self.tr_list = {}  # Deepcopy before sending
-        self.tr_map = {}  # Deepcopy before sending
+        self.tr_list = {}  # TR JID -> read-only state, replaced (never changed) by each patch
+        self.tr_map = {}
         self.factory_map = {}  # it don't matter but copy
+        self.version = 0  # incremented on every change, the canvas redraws only when it changes
+        self.factory_version = 0  # incremented when `factory_map` changes
+        self.tr_index = GridIndex(settings.SPATIAL_CELL_SIZE)  # positions of `tr_map`
+        self.factory_index = GridIndex(settings.SPATIAL_CELL_SIZE)  # positions of `factory_map`
+        self.positions_generation = None  # of the last positions read from a `PositionStore`
+        self._positions_store = None  # store the positions were read from
+        self._positions = None  # last positions read, by store slot
+        self._positions_back = None  # array the next read goes to
+        self._pending = None  # (TR patch, tr_map, factory_map) received since the last frame
 
         self._selected_tr_jid = None
 
@@ -39,6 +55,82 @@ class ViewModel:
         """Sets text content of description widget."""
         self._set_description_text_callback(text)
 
+    def set_tr_position(self, jid: str, position: Point) -> None:
+        self.tr_map[jid] = position
+        self.tr_index.move(jid, position)
+        self.version += 1
+
+    def sync_positions(self, store: PositionStore) -> bool:
+        """Reads TR positions published to `store`, if there are new ones. Only TRs that moved are updated.
+
+        :return: whether positions changed
+        """
+        if store is not self._positions_store:
+            self._positions_store, self._positions, self.positions_generation = store, None, None
+        if store.generation == self.positions_generation:
+            return False
+        if self._positions is None or len(self._positions) != len(store):
+            self._positions = np.full((len(store), 2), np.nan)
+            self._positions_back = np.empty_like(self._positions)
+        self.positions_generation, positions = store.read(self._positions_back)
+
+        moved = np.flatnonzero((positions != self._positions).any(axis=1))
+        keys = store.keys
+        for slot, (x, y) in zip(moved.tolist(), positions[moved].tolist()):
+            jid = keys[slot]
+            pt = Point(x, y)
+            self.tr_map[jid] = pt
+            self.tr_index.move(jid, pt)
+        self._positions, self._positions_back = positions, self._positions
+        if moved.size:
+            self.version += 1
+        return moved.size > 0
+
+    def update(self, tr_list=None, tr_map=None, factory_map=None) -> None:
+        """Updates given parts of the model, None parts are kept.
+
+        :param tr_list: Patch of TR states, TR JID -> changed fields, see `FactoryAgent.tr_list_patch`.
+        :param tr_map: TR positions, replace current ones.
+        :param factory_map: Warehouse and GoM positions, replace current ones.
+        """
+        if tr_list:
+            states = dict(self.tr_list)
+            for jid, fields in tr_list.items():
+                states[jid] = MappingProxyType({**states.get(jid, {}), **fields})
+            self.tr_list = states
+        if tr_map:
+            self.tr_map = tr_map
+            self.tr_index.update(tr_map)
+            self._positions = None  # next `sync_positions` rereads all
+        if factory_map:
+            self.factory_map = factory_map
+            self.factory_index.update(factory_map)
+            self.factory_version += 1
+        self.version += 1
+
+    def queue_update(self, tr_list=None, tr_map=None, factory_map=None) -> None:
+        """Queues an update to be applied by `apply_queued`. TR patches are merged, maps replace queued ones."""
+        if self._pending is None:
+            self._pending = ({}, None, None)
+        patch, queued_tr_map, queued_factory_map = self._pending
+        for jid, fields in (tr_list or {}).items():
+            patch[jid] = {**patch.get(jid, {}), **fields}
+        self._pending = (patch, tr_map or queued_tr_map, factory_map or queued_factory_map)
+
+    def apply_queued(self) -> bool:
+        """Applies updates queued since the last call as one.
+
+        :return: whether there were any
+        """
+        if self._pending is None:
+            return False
+        tr_list, tr_map, factory_map = self._pending
+        self._pending = None
+        self.update(tr_list, tr_map, factory_map)
+        if self._selected_tr_jid in tr_list:
+            self.select_tr(self._selected_tr_jid)  # Update description when it changes.
+        return True
+
     def select_tr(self, jid) -> None:
         """Handles selection of TR with given JID."""
         if jid is None:
@@ -129,6 +221,54 @@ class Worker(QRunnable):
             self.signals.finished.emit()  # Done
 
 
+class Chart(QLabel):
+    """Line chart of time series, redrawn when plotted.
+
+    :param title: Title, drawn with current values.
+    :param colors: Line color of each series.
+    """
+
+    def __init__(self, title: str, colors, width: int = 300, height: int = 90):
+        super().__init__()
+        self.title = title
+        self.pens = []
+        for color in colors:
+            pen = QtGui.QPen(QtGui.QColor(color))
+            pen.setWidthF(1.5)
+            self.pens.append(pen)
+        self.bg_color = QtGui.QColor(COLORS[-2])
+        self.font_color = QtGui.QColor(COLORS[0])
+        self.setFixedSize(width, height)
+        self.setPixmap(QtGui.QPixmap(width, height))
+
+    def plot(self, series, y_max: float = None, text: str = "") -> None:
+        """Draws series, scaled to `y_max` or to their maximum.
+
+        :param series: 1-D arrays, one per color.
+        :param y_max: Top of the chart.
+        :param text: Text drawn after the title, e.g. current values.
+        """
+        width, height = self.width(), self.height()
+        top = 16  # px, space for the title
+        if y_max is None:
+            y_max = max((float(s.max()) for s in series if len(s)), default=0.) or 1.
+        pixmap = self.pixmap()
+        pixmap.fill(self.bg_color)
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        for pen, values in zip(self.pens, series):
+            if len(values) < 2:
+                continue
+            xs = np.linspace(0, width - 1, len(values))
+            ys = height - 1 - np.clip(values / y_max, 0., 1.) * (height - 1 - top)
+            painter.setPen(pen)
+            painter.drawPolyline(QtGui.QPolygonF([QPointF(x, y) for x, y in zip(xs.tolist(), ys.tolist())]))
+        painter.setPen(self.font_color)
+        painter.drawText(2, 12, f"{self.title} {text}")
+        painter.end()
+        self.update()
+
+
 class Canvas(QLabel):
     """Canvas representing factory map."""
 
@@ -166,6 +306,18 @@ class Canvas(QLabel):
 
         self.factory_view_model = view_model
 
+        # Rendering state
+        self.update_pens()
+        self.labels = {}  # JID -> label
+        self._static_layer = None  # warehouses and GoMs
+        self._static_key = None  # view the static layer was drawn for
+        self.frame_key = None  # view and view model version of the last frame
+        self.heatmap_image = None  # QImage over the floor, None - hidden
+        self.heatmap_bounds = None  # (min x, min y, max x, max y) of the image on map
+        self._heatmap_data = None  # pixels of the image, QImage doesn't copy them
+        self.heatmap_version = 0
+        self.frame_time = 0.  # s, moving average
+
         # Mouse events
         self.last_x, self.last_y = None, None
         self.select_radius = settings.SELECT_RADIUS
@@ -179,91 +331,184 @@ class Canvas(QLabel):
         pixmap.fill(self.bg_color)
         pixmap = pixmap.scaled(self.width(), self.height(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
         self.setPixmap(pixmap)
+        self.draw_scene(force=True)
+
+    def update_pens(self) -> None:
+        """Creates pens for current zoom, they are reused by every frame."""
+        def pen(color, width):
+            p = QtGui.QPen(color)
+            p.setWidthF(round(width * self.zoom))
+            return p
+
+        self.aside_pen = pen(self.aside_color, 12)
+        self.gom_pen = pen(self.gom_color, 12)
+        self.tr_pen = pen(self.tr_color, 4)
+        self.font_pen = pen(self.font_color, 4)
+        self.connection_pen = pen(self.connection_color, 0.75)
+        self.connection_selected_pen = pen(self.connection_selected_color, 1.25)
+
+    def label(self, jid: str) -> str:
+        """Returns cached label of an agent, its upper-cased JID local part."""
+        text = self.labels.get(jid)
+        if text is None:
+            text = self.labels[jid] = jid.split("@", 1)[0].upper()
+        return text
+
+    def draw_scene(self, force: bool = False) -> None:
+        """Draws the scene if anything changed since the last frame.
+
+        :param force: Draw even if nothing changed.
+        """
+        view_model = self.factory_view_model
+        frame_key = (view_model.version, view_model.get_selected_tr_jid(), self.zoom, self.offset_x, self.offset_y,
+                     self.width(), self.height(), self.heatmap_version)
+        if frame_key == self.frame_key and not force:
+            return
+        self.frame_key = frame_key
+        started_at = time.perf_counter()
 
-    def draw_scene(self) -> None:
-        # TODO remove first position in gom_positions and tr_positions, use factory_map
-        self.clear_scene()
-        painter = QtGui.QPainter(self.pixmap())
-        p = painter.pen()
-
-        # Draw set-aside
-        p.setWidthF(round(12 * self.zoom))
-        p.setColor(self.aside_color)
-        painter.setPen(p)
-        if "" in self.factory_view_model.factory_map:
-            self.draw_point(self.factory_view_model.factory_map[""], painter)
-
-        # Draw GoMs
-        for jid in self.factory_view_model.factory_map:
-            if jid != "":  # set-aside already drawn
-                p.setColor(self.gom_color)
-                painter.setPen(p)
-
-                pt = self.factory_view_model.factory_map[jid]
-                self.draw_point(pt, painter)
-
-                p.setColor(self.font_color)  # TODO: optimize color swapping
-                painter.setPen(p)
-
-                name = ""
-                try:
-                    name = re.split("@", jid)[0]
-                except Exception as e:
-                    print(f"JID Error. Bad JID: {jid}")
-                    print(repr(e))
-                finally:
-                    self.draw_text(pt, 12, painter, f"{name.upper()}")
-
-        # Draw TR connections
-        for jid in self.factory_view_model.tr_list:
-            master = self.factory_view_model.tr_list[jid]
-
-            if self.factory_view_model.get_selected_tr_jid() == jid:
-                p.setWidthF(round(1.25 * self.zoom))
-                p.setColor(self.connection_selected_color)
-            else:
-                p.setWidthF(round(0.75 * self.zoom))
-                p.setColor(self.connection_color)
-            painter.setPen(p)
-
-            # Get coordinates for master-TR
-            pt = self.factory_view_model.tr_map[jid]
-
-            # TODO: Make sure `master.coworkers` doesn't change while drawing,
-            #       aka enable copying tr_list.
-            # Get coordinates for helpers
-            try:
-                for helper_jid in master['helpers']:
-                    helper_pt = self.factory_view_model.tr_map[helper_jid]
-                    # Draw connection
-                    self.draw_line(pt, helper_pt, painter)
-            except Exception as e:
-                print(repr(e))
+        pixmap = self.pixmap()
+        painter = QtGui.QPainter(pixmap)
+        painter.drawPixmap(0, 0, self.static_layer())
+        if self.heatmap_image is not None:
+            min_x, min_y, max_x, max_y = self.heatmap_bounds
+            painter.drawImage(QRectF(QPointF(*self.translate_map_to_window(Point(min_x, max_y))),
+                                     QPointF(*self.translate_map_to_window(Point(max_x, min_y)))),
+                              self.heatmap_image)
+
+        to_window = self.translate_map_to_window
+        tr_map = view_model.tr_map
+        selected_jid = view_model.get_selected_tr_jid()
+        visible = self.visible_items(view_model.tr_index)
+        clustered = self.zoom < settings.CLUSTER_MAX_ZOOM or len(visible) > settings.CLUSTER_MAX_POINTS
+
+        # Draw TR connections, one batch per pen. Clustered, only these of the selected TR.
+        lines, selected_lines = [], []
+        sources = [] if clustered else visible
+        if clustered and selected_jid in tr_map:
+            sources = [(selected_jid, tr_map[selected_jid])]
+        for jid, pt in sources:
+            tr = view_model.tr_list.get(jid)
+            if tr is None:
+                continue
+            batch = selected_lines if jid == selected_jid else lines
+            for helper_jid in tr.get('helpers', ()):
+                helper_pt = tr_map.get(helper_jid)
+                if helper_pt is not None:
+                    batch.append(QLineF(*to_window(pt), *to_window(helper_pt)))
+        painter.setPen(self.connection_pen)
+        painter.drawLines(lines)
+        painter.setPen(self.connection_selected_pen)
+        painter.drawLines(selected_lines)
 
         # Draw TRs
-        p.setWidthF(round(4 * self.zoom))
+        if clustered:
+            self.draw_clusters(painter, visible)
+        else:
+            painter.setPen(self.tr_pen)
+            painter.drawPoints(QtGui.QPolygonF([QPointF(*to_window(pt)) for _, pt in visible]))
+        painter.setPen(self.font_pen)
+        if self.zoom >= settings.LABEL_MIN_ZOOM and not clustered:
+            for jid, pt in visible:
+                self.draw_text(pt, 4, painter, self.label(jid))
+        elif selected_jid in tr_map:
+            self.draw_text(tr_map[selected_jid], 4, painter, self.label(selected_jid))
 
-        for jid in self.factory_view_model.tr_map:
-            p.setColor(self.tr_color)
-            painter.setPen(p)
+        painter.end()
+        self.update()
 
-            pt = self.factory_view_model.tr_map[jid]
-            self.draw_point(pt, painter)
+        frame_time = time.perf_counter() - started_at
+        self.frame_time += 0.1 * (frame_time - self.frame_time)
+
+    def static_layer(self) -> QtGui.QPixmap:
+        """Returns background with warehouses and GoMs, redrawn only when they or the view change."""
+        view_model = self.factory_view_model
+        key = (view_model.factory_version, self.zoom, self.offset_x, self.offset_y, self.width(), self.height())
+        if self._static_layer is not None and key == self._static_key:
+            return self._static_layer
+
+        layer = QtGui.QPixmap(self.width(), self.height())
+        layer.fill(self.bg_color)
+        painter = QtGui.QPainter(layer)
+        to_window = self.translate_map_to_window
+        visible = self.visible_items(view_model.factory_index)
+
+        # Warehouses (their names aren't JIDs), then GoMs
+        painter.setPen(self.aside_pen)
+        painter.drawPoints(QtGui.QPolygonF([QPointF(*to_window(pt)) for jid, pt in visible if "@" not in jid]))
+        painter.setPen(self.gom_pen)
+        painter.drawPoints(QtGui.QPolygonF([QPointF(*to_window(pt)) for jid, pt in visible if "@" in jid]))
+        if self.zoom >= settings.LABEL_MIN_ZOOM:
+            painter.setPen(self.font_pen)
+            for jid, pt in visible:
+                if "@" in jid:
+                    self.draw_text(pt, 12, painter, self.label(jid))
+        painter.end()
 
-            p.setColor(self.font_color)  # TODO: optimize color swapping
-            painter.setPen(p)
+        self._static_layer, self._static_key = layer, key
+        return layer
 
-            name = ""
-            try:
-                name = re.split("@", jid)[0]
-            except Exception as e:
-                print(f"JID Error. Bad JID: {jid}")
-                print(repr(e))
-            finally:
-                self.draw_text(pt, 4, painter, f"{name.upper()}")
+    def set_heatmap(self, grid, bounds) -> None:
+        """Shows a heatmap over the floor, or hides it if `grid` is None.
 
-        painter.end()
-        self.update()
+        :param grid: 2-D array, rows from the lowest y, see `industry2.utilization.Heatmap`.
+        :param bounds: (min x, min y, max x, max y) of the grid on map.
+        """
+        self.heatmap_version += 1
+        if grid is None:
+            self.heatmap_image = self._heatmap_data = None
+            return
+        peak = grid.max()
+        heat = np.sqrt(grid / peak) if peak > 0 else grid
+        data = np.empty(grid.shape + (4,), dtype=np.uint8)
+        data[..., :3] = (self.tr_color.red(), self.tr_color.green(), self.tr_color.blue())
+        data[..., 3] = (heat * 200).astype(np.uint8)
+        self._heatmap_data = np.ascontiguousarray(data[::-1])  # window rows go down
+        rows, columns = grid.shape
+        self.heatmap_image = QtGui.QImage(self._heatmap_data.data, columns, rows, columns * 4,
+                                          QtGui.QImage.Format_RGBA8888)
+        self.heatmap_bounds = bounds
+
+    def draw_clusters(self, painter: QtGui.QPainter, items: list) -> None:
+        """Draws items as tiles of `settings.CLUSTER_TILE_SIZE` pixels, opacity by item count, labelled with it.
+
+        :param painter: Painter.
+        :param items: (JID, position) pairs.
+        """
+        tile = settings.CLUSTER_TILE_SIZE
+        to_window = self.translate_map_to_window
+        counts = {}
+        for _, pt in items:
+            x, y = to_window(pt)
+            key = (x // tile, y // tile)
+            counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return
+
+        max_count = max(counts.values())
+        color = QtGui.QColor(self.tr_color)
+        painter.setPen(self.font_color)
+        for (tile_x, tile_y), count in counts.items():
+            color.setAlphaF(0.25 + 0.75 * count / max_count)
+            rect = QRect(tile_x * tile, tile_y * tile, tile, tile)
+            painter.fillRect(rect, color)
+            painter.drawText(rect, Qt.AlignCenter, str(count))
+
+    def map_viewport(self, margin: float = None) -> (float, float, float, float):
+        """Returns map area shown in the window, as (min x, min y, max x, max y) in absolute units.
+
+        :param margin: Margin around the window in pixels, `settings.CULL_MARGIN` by default.
+        """
+        if margin is None:
+            margin = settings.CULL_MARGIN
+        half_width = (self.width() / 2 + margin) / self.zoom
+        half_height = (self.height() / 2 + margin) / self.zoom
+        return (self.offset_x - half_width, self.offset_y - half_height,
+                self.offset_x + half_width, self.offset_y + half_height)
+
+    def visible_items(self, index: GridIndex) -> list:
+        """Returns (JID, position) pairs of `index` within the viewport."""
+        return index.query_rect(*self.map_viewport())
 
     def clear_scene(self) -> None:
         """Clears scene."""
@@ -308,18 +553,15 @@ class Canvas(QLabel):
     def wheelEvent(self, e) -> None:
         nz = self.zoom + e.angleDelta().y() / 1200
         self.zoom = clip(nz, self.min_zoom, self.max_zoom)
+        self.update_pens()
         self.draw_scene()
 
     def attempt_select(self, x, y) -> bool:
+        """Selects the TR nearest to pixel (x, y) within `select_radius`, or deselects if there is none."""
         abs_pos = self.translate_window_to_map(x, y)
-
-        for jid in self.factory_view_model.tr_map:
-            if self.in_radius(self.factory_view_model.tr_map[jid], abs_pos, self.select_radius):
-                self.factory_view_model.select_tr(jid)
-                return True
-
-        self.factory_view_model.select_tr(None)
-        return False
+        jid = self.factory_view_model.tr_index.nearest(abs_pos, self.select_radius)
+        self.factory_view_model.select_tr(jid)
+        return jid is not None
 
     def draw_point(self, point: Point, painter: QtGui.QPainter) -> None:
         """Draws point with painter. (0, 0) is centered."""
@@ -378,16 +620,34 @@ class Canvas(QLabel):
 
 class MainWindow(QMainWindow):
     """Starts up a FactoryWorker, which in turn starts a FactoryAgent and then all other agents. FactoryWorker updates
-    ViewModel from which MainWindow (Canvas) then reads data."""
+    ViewModel from which MainWindow (Canvas) then reads data.
 
-    def __init__(self, *args, **kwargs):
+    With `stream_path` no agents are created, the worker receives a simulation streamed by another process instead,
+    see `industry2.stream`.
+    """
+
+    def __init__(self, *args, stream_path=None, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
 
-        # Agent
-        self.factory_agent = FactoryAgent(f"{settings.AGENT_NAMES['factory']}@{settings.HOST}", settings.PASSWORD)
+        # Agent, or client of a streamed simulation
+        self.stream_path = stream_path
+        self.stream_client = None
+        self.factory_agent = None
+        if stream_path is None:
+            from industry2.agents import FactoryAgent
+            self.factory_agent = FactoryAgent(f"{settings.AGENT_NAMES['factory']}@{settings.HOST}", settings.PASSWORD)
         self.factory_worker = None
         self.view_model = ViewModel(self.set_description_text)
 
+        # Trace playback
+        self.playback = None
+        self.playing = False
+        self.playback_speed = 1.
+        self._played_at = None  # perf_counter() of the last played frame
+
+        # Utilization panels
+        self._utilization = None  # snapshot shown
+
         # UI
         self.canvas = None
         self._description = None
@@ -398,9 +658,9 @@ class MainWindow(QMainWindow):
         self.thread_pool = QThreadPool()
         print("Multithreading with maximum %d threads" % self.thread_pool.maxThreadCount())
 
-        # Redraw scene every 100ms
+        # Apply updates and redraw scene once per frame
         self.timer = QTimer()
-        self.timer.setInterval(100)
+        self.timer.setInterval(round(settings.FRAME_PERIOD * 1000))
         self.timer.timeout.connect(self.recurring_timer)
 
         # Start
@@ -418,11 +678,46 @@ class MainWindow(QMainWindow):
         self.canvas = Canvas(self.view_model)
         main_layout.addWidget(self.canvas)
 
-        self._start_btn = QPushButton("Start worker")
-        self._start_btn.pressed.connect(self.start_agent_worker)
+        self._start_btn = QPushButton("Start worker" if self.stream_path is None else "Attach")
+        self._start_btn.pressed.connect(self.toggle_agent_worker)
         self._start_btn.setFixedWidth(300)
         side_layout.addWidget(self._start_btn)
 
+        # Playback
+        self._open_btn = QPushButton("Open trace...")
+        self._open_btn.pressed.connect(self.open_trace)
+        self._open_btn.setFixedWidth(300)
+        side_layout.addWidget(self._open_btn)
+        playback_layout = QHBoxLayout()
+        self._play_btn = QPushButton("Play")
+        self._play_btn.pressed.connect(self.toggle_playing)
+        playback_layout.addWidget(self._play_btn)
+        self._speed_box = QComboBox()
+        self._speed_box.addItems([f"{speed:g}x" for speed in settings.PLAYBACK_SPEEDS])
+        self._speed_box.setCurrentIndex(settings.PLAYBACK_SPEEDS.index(1))
+        self._speed_box.currentIndexChanged.connect(self.set_playback_speed)
+        playback_layout.addWidget(self._speed_box)
+        self._time_label = QLabel()
+        playback_layout.addWidget(self._time_label)
+        side_layout.addLayout(playback_layout)
+        self._seek_slider = QSlider(Qt.Horizontal)
+        self._seek_slider.setRange(0, 1000)
+        self._seek_slider.setFixedWidth(300)
+        self._seek_slider.valueChanged.connect(self.seek_slider_moved)
+        side_layout.addWidget(self._seek_slider)
+        self.set_playback_enabled(False)
+
+        # Utilization
+        self._queue_chart = Chart("Queue length", [COLORS[3]])
+        self._throughput_chart = Chart("Throughput [orders/h]", [COLORS[6]])
+        self._robots_chart = Chart("Robots busy/idle/helping [%]", [COLORS[13], COLORS[17], COLORS[10]])
+        self._gom_chart = Chart("GoM utilization, sorted [%]", [COLORS[3]])
+        for chart in (self._queue_chart, self._throughput_chart, self._robots_chart, self._gom_chart):
+            side_layout.addWidget(chart)
+        self._heatmap_box = QCheckBox("Robot heatmap")
+        self._heatmap_box.stateChanged.connect(lambda _: self.show_utilization(self._utilization, force=True))
+        side_layout.addWidget(self._heatmap_box)
+
         self._description = QLabel()
         self._description.setFixedWidth(300)
         self._description.setAlignment(Qt.AlignTop)
@@ -438,28 +733,93 @@ class MainWindow(QMainWindow):
     def set_description_text(self, text: str) -> None:
         self._description.setText(text)
 
+    def show_utilization(self, snapshot, force: bool = False) -> None:
+        """Plots a snapshot of `industry2.utilization.UtilizationMonitor`, if it's not shown yet."""
+        if snapshot is None or (snapshot is self._utilization and not force):
+            return
+        self._utilization = snapshot
+        queue_length, throughput = snapshot["queue_length"], snapshot["throughput"]
+        robots, gom_utilization = snapshot["robots"], snapshot["gom_utilization"]
+        self._queue_chart.plot([queue_length], text=f"{queue_length[-1]:.0f}")
+        self._throughput_chart.plot([throughput], text=f"{throughput[-1]:.1f}")
+        self._robots_chart.plot([robots[:, i] for i in range(robots.shape[1])], y_max=1.,
+                                text="/".join(f"{100 * share:.0f}" for share in robots[-1]))
+        self._gom_chart.plot([np.sort(gom_utilization)[::-1]], y_max=1.,
+                             text=f"mean {100 * gom_utilization.mean():.0f}" if len(gom_utilization) else "")
+        if self._heatmap_box.isChecked():
+            self.canvas.set_heatmap(snapshot["heatmap"], snapshot["heatmap_bounds"])
+        elif self.canvas.heatmap_image is not None:
+            self.canvas.set_heatmap(None, None)
+
+    def set_playback_enabled(self, enabled: bool) -> None:
+        for widget in (self._play_btn, self._speed_box, self._seek_slider):
+            widget.setEnabled(enabled)
+
+    def open_trace(self) -> None:
+        """Opens a trace file for playback, see `industry2.playback`. Live runs can't be started afterwards."""
+        path, _ = QFileDialog.getOpenFileName(self, "Open trace")
+        if not path:
+            return
+        from industry2.playback import Playback
+        try:
+            self.playback = Playback(trace.read_trace(path), settings.PLAYBACK_KEYFRAME_EVENTS)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Open trace", f"Can't read {path}: {e}")
+            return
+        self._start_btn.setEnabled(False)
+        self.view_model.queue_update(None, self.playback.tr_map(), self.playback.factory_map)
+        self.set_playback_enabled(True)
+        self.seek(0.)
+
+    def toggle_playing(self) -> None:
+        self.playing = not self.playing
+        if self.playing and self.playback.time >= self.playback.duration:
+            self.seek(0.)
+        self._played_at = time.perf_counter()
+        self._play_btn.setText("Pause" if self.playing else "Play")
+
+    def set_playback_speed(self, index: int) -> None:
+        self.playback_speed = settings.PLAYBACK_SPEEDS[index]
+
+    def seek_slider_moved(self, value: int) -> None:
+        if self.playback is not None:
+            self.seek(value / self._seek_slider.maximum() * self.playback.duration)
+
+    def seek(self, at: float) -> None:
+        """Moves playback to time `at` (s)."""
+        patch = self.playback.seek(at)
+        if patch:
+            self.view_model.queue_update(patch)
+        duration = self.playback.duration
+        self._time_label.setText(f"{self.playback.time:.1f} / {duration:.1f} s")
+        self._seek_slider.blockSignals(True)
+        self._seek_slider.setValue(round(self.playback.time / duration * self._seek_slider.maximum()) if duration else 0)
+        self._seek_slider.blockSignals(False)
+
+    def play(self) -> None:
+        """Advances playback by wall time since the last frame, times speed."""
+        now = time.perf_counter()
+        self.seek(self.playback.time + (now - self._played_at) * self.playback_speed)
+        self._played_at = now
+        if self.playback.time >= self.playback.duration:
+            self.toggle_playing()
+
     def update_tr_position_fn(self, tr_jid: str, pos) -> None:
         """
 
         :param tr_jid:
         :param pos:
         """
-        self.view_model.tr_map[tr_jid] = pos
+        self.view_model.set_tr_position(tr_jid, pos)
 
     def update_view_model_fn(self, tr_list, tr_map, factory_map):
-        """
+        """Queues an update, applied with others on the next frame.
 
         :param tr_list:
         :param tr_map:
         :param factory_map:
         """
-        if tr_list:
-            self.view_model.tr_list = tr_list
-            self.view_model.select_tr(self.view_model.get_selected_tr_jid())  # Update description when model updates.
-        if tr_map:
-            self.view_model.tr_map = tr_map
-        if factory_map:
-            self.view_model.factory_map = factory_map
+        self.view_model.queue_update(tr_list, tr_map, factory_map)
 
     def execute_agent(self, update_tr_position_callback, update_view_model_callback):
         agent = self.factory_agent
@@ -467,32 +827,74 @@ class MainWindow(QMainWindow):
         future = agent.start()
         future.result()
 
-        while agent.is_alive():
-            try:
-                time.sleep(1)
-            except KeyboardInterrupt:
-                agent.stop()
-                break
+        # Sleeps until the agent is stopped, no polling
+        agent.stopped.wait()
 
         print("Agent finished")
-        future = agent.stop()
-        future.result()
+        from spade import quit_spade
         quit_spade()
+        trace.stop()
+        determinism.shutdown()
+        profiling.stop()
+        message_flow.dump(settings.MESSAGE_FLOW_FILE)
+        log.shutdown()
 
         return "Successful result"
 
+    def execute_viewer(self, update_tr_position_callback, update_view_model_callback):
+        """Receives the streamed simulation until detached."""
+        def on_layout(factory_map, tr_jids):
+            update_view_model_callback.emit(None, {jid: Point(0., 0.) for jid in tr_jids}, factory_map)
+
+        def on_state(patch):
+            update_view_model_callback.emit(patch, None, None)
+
+        from industry2.stream import StreamClient
+        self.stream_client = StreamClient(self.stream_path, settings.STREAM_FPS, on_layout, on_state,
+                                          settings.STREAM_RECONNECT_PERIOD)
+        self.stream_client.run()
+        return "Detached"
+
     def process_result(self, result) -> None:
         print(f"Worker result:\n{result}")
 
     def thread_complete(self) -> None:
         print("THREAD COMPLETE!")
-        self._start_btn.setEnabled(True)
+        self.factory_worker = None
+        self._open_btn.setEnabled(True)
+        if self.stream_path is None:
+            self._start_btn.setText("Finished")  # spade can't be started again in this process
+            self._start_btn.setEnabled(False)
+        else:
+            self._start_btn.setText("Attach")
+            self._start_btn.setEnabled(True)
+
+    def toggle_agent_worker(self) -> None:
+        if self.factory_worker is None:
+            self.start_agent_worker()
+        else:
+            self.stop_agent_worker()
+
+    def stop_agent_worker(self) -> None:
+        """Stops factory agent, or detaches from the stream. The worker thread then finishes right away."""
+        self._start_btn.setEnabled(False)
+        if self.factory_agent is not None:
+            self.factory_agent.stop()
+        elif self.stream_client is not None:
+            self.stream_client.stop()
+
+    def closeEvent(self, event) -> None:
+        if self.factory_worker is not None:
+            self.stop_agent_worker()
+            self.thread_pool.waitForDone()
+        super().closeEvent(event)
 
     def start_agent_worker(self) -> None:
         """Binds defined signals, then starts factory agent in separate thread."""
         try:
             # Pass the function to execute
-            self.factory_worker = Worker(self.execute_agent)  # Any other args, kwargs are passed to the run function
+            # Any other args, kwargs are passed to the run function
+            self.factory_worker = Worker(self.execute_agent if self.factory_agent is not None else self.execute_viewer)
             self.factory_worker.signals.result.connect(self.process_result)
             self.factory_worker.signals.finished.connect(self.thread_complete)
             self.factory_worker.signals.update_tr_position.connect(self.update_tr_position_fn)
@@ -500,12 +902,30 @@ class MainWindow(QMainWindow):
 
             # Execute
             self.thread_pool.start(self.factory_worker)
-            self._start_btn.setEnabled(False)
+            self._start_btn.setText("Stop worker" if self.stream_path is None else "Detach")
+            self._open_btn.setEnabled(False)
         except Exception as e:
             print(repr(e))
 
+    def positions(self):
+        """Returns store of TR positions, None until a streamed layout is received."""
+        if self.playback is not None:
+            return self.playback.positions
+        if self.factory_agent is not None:
+            return self.factory_agent.positions
+        return self.stream_client.positions if self.stream_client is not None else None
+
     def recurring_timer(self) -> None:
+        if self.playing:
+            self.play()
+        self.view_model.apply_queued()
+        positions = self.positions()
+        if positions is not None:
+            self.view_model.sync_positions(positions)
+        if self.factory_agent is not None and self.factory_agent.utilization is not None:
+            self.show_utilization(self.factory_agent.utilization.latest)
         self.canvas.draw_scene()
+        self.statusBar().showMessage(f"frame {1e3 * self.canvas.frame_time:.1f} ms")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,233 @@
+"""Factory layouts: floor size, warehouses, GoM positions and capabilities, and robot counts.
+
+Layout files are JSON lines, so very large floors can be streamed instead of parsed as a whole. The first line is a
+header, every following line describes one GoM::
+
+    {"floor": {"width": 512, "height": 256}, "warehouses": [{"name": "", "x": -128, "y": 0}]}
+    {"name": "gom-1", "x": -32, "y": -96, "operations": ["DRILL", "MILL"], "robots": 1}
+    {"x": -32, "y": -48}
+
+Floor is centered at (0, 0). The first warehouse must be named "" (default order source), GoM names default to
+``gom-{n}``, operations default to all operations and robots default to 1.
+
+Usage: python -m industry2.layout GOM_COUNT PATH [--robots N] [--ops N] [--warehouses N] [--seed SEED]
+"""
+import argparse
+import json
+import math
+import random
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Iterator, List, Optional
+
+import industry2.settings as settings
+from industry2.common import Point
+from industry2.enums import Operation
+
+GOM_SPACING_X = 64
+GOM_SPACING_Y = 48
+
+
+@dataclass
+class Floor:
+    width: float
+    height: float
+
+    def contains(self, point: Point) -> bool:
+        return abs(point.x) <= self.width / 2 and abs(point.y) <= self.height / 2
+
+
+@dataclass
+class Warehouse:
+    name: str  # "" - default warehouse
+    position: Point
+
+
+@dataclass
+class GoMSpec:
+    name: str  # JID without host
+    position: Point
+    operations: List[Operation]
+    robots: int  # TRs belonging to this GoM
+
+
+class Layout:
+    """Factory layout. GoMs are not kept in memory, `goms` streams them from their source every time.
+
+    :param floor: Floor dimensions.
+    :param warehouses: Warehouses, first one is the default.
+    :param gom_source: Callable returning a fresh iterator of GoMs.
+    """
+
+    def __init__(self, floor: Floor, warehouses: List[Warehouse], gom_source: Callable[[], Iterator[GoMSpec]]):
+        self.floor = floor
+        self.warehouses = warehouses
+        self._gom_source = gom_source
+        self.gom_count = None  # set by `validate`
+        self.robot_count = None  # set by `validate`
+
+    def goms(self) -> Iterator[GoMSpec]:
+        return self._gom_source()
+
+    def validate(self) -> 'Layout':
+        """Checks the whole layout in a single pass and counts GoMs and robots.
+
+        :return: self
+        :raises ValueError: if layout is invalid
+        """
+        if not self.warehouses or self.warehouses[0].name != "":
+            raise ValueError("First warehouse must be named \"\"")
+        names = set()
+        for warehouse in self.warehouses:
+            if "@" in warehouse.name or warehouse.name in names:
+                raise ValueError(f"Bad or duplicate warehouse name: {warehouse.name!r}")
+            if not self.floor.contains(warehouse.position):
+                raise ValueError(f"Warehouse {warehouse.name!r} is outside of the floor")
+            names.add(warehouse.name)
+
+        gom_count = robot_count = 0
+        for gom in self.goms():
+            if "@" in gom.name or gom.name in names:
+                raise ValueError(f"Bad or duplicate GoM name: {gom.name!r}")
+            if not self.floor.contains(gom.position):
+                raise ValueError(f"GoM {gom.name} is outside of the floor")
+            if not gom.operations:
+                raise ValueError(f"GoM {gom.name} has no operations")
+            if gom.robots < 1:
+                raise ValueError(f"GoM {gom.name} needs at least 1 robot")
+            names.add(gom.name)
+            gom_count += 1
+            robot_count += gom.robots
+
+        if gom_count == 0:
+            raise ValueError("Layout has no GoMs")
+        self.gom_count, self.robot_count = gom_count, robot_count
+        return self
+
+    def save(self, path: str) -> None:
+        """Writes layout to a layout file, streaming GoMs."""
+        with open(path, "w") as f:
+            header = {
+                "floor": {"width": self.floor.width, "height": self.floor.height},
+                "warehouses": [{"name": w.name, "x": w.position.x, "y": w.position.y} for w in self.warehouses],
+            }
+            f.write(json.dumps(header) + "\n")
+            for gom in self.goms():
+                record = {"name": gom.name, "x": gom.position.x, "y": gom.position.y,
+                          "operations": [op.name for op in gom.operations], "robots": gom.robots}
+                f.write(json.dumps(record) + "\n")
+
+
+def _parse_gom(record: dict, n: int) -> GoMSpec:
+    operations = record.get("operations")
+    return GoMSpec(
+        name=record.get("name", f"{settings.AGENT_NAMES['gom_base']}{n}"),
+        position=Point(x=float(record["x"]), y=float(record["y"])),
+        operations=list(Operation) if operations is None else [Operation[name] for name in operations],
+        robots=int(record.get("robots", 1)),
+    )
+
+
+def load_layout(path: str) -> Layout:
+    """Loads and validates a layout file. Only the header is kept in memory.
+
+    :param path: Path to the layout file.
+    :raises ValueError: if layout is invalid
+    """
+    with open(path) as f:
+        try:
+            header = json.loads(f.readline())
+            floor = Floor(width=float(header["floor"]["width"]), height=float(header["floor"]["height"]))
+            warehouses = [Warehouse(name=w["name"], position=Point(x=float(w["x"]), y=float(w["y"])))
+                          for w in header["warehouses"]]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path}:1: bad layout header: {e!r}") from e
+
+    def gom_source():
+        with open(path) as gom_file:
+            gom_file.readline()  # header
+            n = 0
+            for line_no, line in enumerate(gom_file, start=2):
+                if not line.strip():
+                    continue
+                n += 1
+                try:
+                    yield _parse_gom(json.loads(line), n)
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"{path}:{line_no}: bad GoM record: {e!r}") from e
+
+    return Layout(floor, warehouses, gom_source).validate()
+
+
+def generate_layout(gom_count: int, per_col: Optional[int] = 5, robots_per_gom: int = 1,
+                    ops_per_gom: Optional[int] = None, warehouse_count: int = 1, seed: Optional[int] = None) -> Layout:
+    """Generates a grid layout. GoMs are placed in columns of `per_col`, left to right, warehouses in a column left of
+    them. Default arguments give the original hard-coded factory.
+
+    :param gom_count: Number of GoMs.
+    :param per_col: GoMs per column, square-ish grid if None.
+    :param robots_per_gom: Robots belonging to each GoM.
+    :param ops_per_gom: Number of random operations each GoM can perform, all operations if None.
+    :param warehouse_count: Number of warehouses.
+    :param seed: Seed used to choose GoM operations.
+    """
+    if per_col is None:
+        per_col = max(1, math.ceil(math.sqrt(gom_count * GOM_SPACING_X / GOM_SPACING_Y)))
+    cols = math.ceil(gom_count / per_col)
+    # Original layout: first GoM at (-32, -96), warehouse at (-128, 0)
+    x0, y0 = -32, -96
+    warehouse_x = x0 - 96
+    # Warehouses are spread over the GoM column, at least GOM_SPACING_Y apart, centered on it
+    gom_span_y = (per_col - 1) * GOM_SPACING_Y
+    span_y = max(gom_span_y, (warehouse_count + 1) * GOM_SPACING_Y)
+    warehouse_ys = [y0 + gom_span_y / 2 + span_y * ((i + 1) / (warehouse_count + 1) - 0.5)
+                    for i in range(warehouse_count)]
+    warehouses = [Warehouse(name="" if i == 0 else f"warehouse-{i + 1}", position=Point(x=float(warehouse_x), y=y))
+                  for i, y in enumerate(warehouse_ys)]
+
+    max_x = max(abs(warehouse_x), abs(x0 + (cols - 1) * GOM_SPACING_X))
+    max_y = max(abs(y0), abs(y0 + (per_col - 1) * GOM_SPACING_Y), *(abs(y) for y in warehouse_ys))
+    floor = Floor(width=2 * max_x + GOM_SPACING_X, height=2 * max_y + GOM_SPACING_Y)
+
+    def gom_source():
+        rng = random.Random(seed)
+        all_ops = list(Operation)
+        for i in range(gom_count):
+            operations = all_ops if ops_per_gom is None else rng.sample(all_ops, ops_per_gom)
+            yield GoMSpec(
+                name=f"{settings.AGENT_NAMES['gom_base']}{i + 1}",
+                position=Point(x=float(x0 + (i // per_col) * GOM_SPACING_X),
+                               y=float(y0 + (i % per_col) * GOM_SPACING_Y)),
+                operations=operations,
+                robots=robots_per_gom,
+            )
+
+    return Layout(floor, warehouses, gom_source).validate()
+
+
+def from_settings() -> Layout:
+    """Returns the layout configured in `settings`."""
+    if settings.LAYOUT_FILE is not None:
+        return load_layout(settings.LAYOUT_FILE)
+    return generate_layout(settings.GOM_COUNT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic grid layout file.")
+    parser.add_argument("gom_count", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--robots", type=int, default=1, help="robots per GoM")
+    parser.add_argument("--ops", type=int, default=None, help="random operations per GoM, all if not set")
+    parser.add_argument("--warehouses", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    layout = generate_layout(args.gom_count, per_col=None, robots_per_gom=args.robots, ops_per_gom=args.ops,
+                             warehouse_count=args.warehouses, seed=args.seed)
+    layout.save(args.path)
+    preview = ", ".join(gom.name for gom in islice(layout.goms(), 3))
+    print(f"{args.path}: {layout.gom_count} GoMs ({preview}, ...), {layout.robot_count} robots")
+
+
+if __name__ == '__main__':
+    main()
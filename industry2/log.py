@@ -0,0 +1,129 @@
+"""Logging setup: per-category levels, sampling and a background writer.
+
+Categories are loggers under ``industry2``, e.g. ``industry2.messages`` (every message sent) or ``industry2.agents``
+(agent internals). Records below a category's level are dropped before a `LogRecord` is even created. Records that
+pass are put into a bounded ring buffer and a background thread formats and writes them, so the event loop never
+waits for the output. Messages are formatted only when written, so log with ``%`` arguments, not f-strings.
+"""
+import atexit
+import logging
+import sys
+import threading
+from collections import deque
+
+import industry2.settings as settings
+
+ROOT = "industry2"
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Returns logger of a category, e.g. "messages"."""
+    return logging.getLogger(f"{ROOT}.{category}")
+
+
+class SamplingFilter(logging.Filter):
+    """Passes given share of records, evenly spaced.
+
+    :param rate: Share of records passed, between 0 and 1.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._credit = 0.
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        self._credit += self.rate
+        if self._credit >= 1.:
+            self._credit -= 1.
+            return True
+        return False
+
+
+class RingBufferHandler(logging.Handler):
+    """Queues records in a ring buffer, the oldest ones are dropped when it's full. A daemon thread passes them to
+    `target`, which formats and writes them.
+
+    :param target: Handler doing the actual output.
+    :param capacity: Ring buffer size.
+    """
+
+    def __init__(self, target: logging.Handler, capacity: int = 10000):
+        super().__init__()
+        self.target = target
+        self.dropped = 0
+        self._buffer = deque(maxlen=capacity)
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name="industry2-log", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(record)
+        self._wakeup.set()
+
+    def _write_loop(self) -> None:
+        while not self._closed:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._drain()
+
+    def _drain(self) -> None:
+        buffer = self._buffer
+        while buffer:
+            try:
+                record = buffer.popleft()
+            except IndexError:
+                break
+            self.target.handle(record)
+        self.target.flush()
+
+    def close(self) -> None:
+        """Writes out queued records and stops the writer thread."""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self._drain()
+        if self.dropped:
+            self.target.handle(logging.makeLogRecord({
+                "name": ROOT, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "%d log records dropped, log buffer was full", "args": (self.dropped,),
+            }))
+        self.target.close()
+        super().close()
+
+
+_handler = None
+
+
+def setup() -> None:
+    """Configures `industry2` loggers from `settings`. Safe to call more than once."""
+    global _handler
+    if _handler is not None:
+        return
+
+    target = logging.FileHandler(settings.LOG_FILE) if settings.LOG_FILE else logging.StreamHandler(sys.stdout)
+    target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _handler = RingBufferHandler(target, settings.LOG_BUFFER_SIZE)
+
+    root = logging.getLogger(ROOT)
+    root.setLevel(settings.LOG_LEVEL)
+    root.addHandler(_handler)
+    root.propagate = False
+    for category, level in settings.LOG_LEVELS.items():
+        get_logger(category).setLevel(level)
+    for category, rate in settings.LOG_SAMPLING.items():
+        get_logger(category).addFilter(SamplingFilter(rate))
+
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Writes out queued records."""
+    global _handler
+    if _handler is not None:
+        logging.getLogger(ROOT).removeHandler(_handler)
+        _handler.close()
+        _handler = None
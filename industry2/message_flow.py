@@ -0,0 +1,97 @@
+"""Message flow accounting.
+
+Counts messages and body bytes delivered to agents, per (sender role, receiver role, performative), and completed
+orders, so protocol changes can be compared by messages per order. Roles are "factory", "manager", "gom" and "tr",
+agents register theirs when created. Counting is a couple of dict lookups per message, so it is always on.
+"""
+import json
+from typing import Dict, List, Tuple
+
+from industry2 import log
+
+logger = log.get_logger("metrics")
+
+
+class MessageFlow:
+    """Message counters by sender role, receiver role and performative."""
+
+    def __init__(self):
+        self.counts: Dict[Tuple[str, str, str], List[int]] = {}  # key -> [messages, bytes]
+        self.completed_orders = 0
+        self._roles = {}  # JID (str or JID object) -> role
+
+    def register(self, jid: str, role: str) -> None:
+        self._roles[jid] = role
+
+    def role_of(self, jid) -> str:
+        role = self._roles.get(jid)
+        if role is None:
+            role = self._roles[jid] = self._roles.get(str(jid), "other")
+        return role
+
+    def record(self, sender, receiver_role: str, performative: str, body: str) -> None:
+        """Counts a delivered message.
+
+        :param sender: Sender JID.
+        :param receiver_role: Role of the receiving agent.
+        :param performative: Message performative.
+        :param body: Message body, JSON bodies are ASCII so their length is their size in bytes.
+        """
+        key = (self.role_of(sender), receiver_role, performative)
+        counter = self.counts.get(key)
+        if counter is None:
+            counter = self.counts[key] = [0, 0]
+        counter[0] += 1
+        if body:
+            counter[1] += len(body)
+
+    def order_completed(self) -> None:
+        self.completed_orders += 1
+
+    def to_dict(self) -> dict:
+        """Returns counters as a JSON serializable dict."""
+        messages = sum(counter[0] for counter in self.counts.values())
+        # Performative may be None, keys are compared as strings
+        flows = sorted(self.counts.items(), key=lambda item: tuple(map(str, item[0])))
+        return {
+            "completed_orders": self.completed_orders,
+            "messages": messages,
+            "bytes": sum(counter[1] for counter in self.counts.values()),
+            "messages_per_order": messages / self.completed_orders if self.completed_orders else None,
+            "flows": [{"sender": sender, "receiver": receiver, "performative": performative,
+                       "messages": counter[0], "bytes": counter[1]}
+                      for (sender, receiver, performative), counter in flows],
+        }
+
+    def report(self) -> str:
+        """Returns a table of flows, biggest first."""
+        total = sum(counter[0] for counter in self.counts.values()) or 1
+        orders = self.completed_orders
+        lines = [f"Message flow ({orders} completed orders):",
+                 f"  {'sender':<8} {'receiver':<8} {'performative':<12} {'messages':>10} {'share':>6} "
+                 f"{'bytes':>12} {'per order':>10}"]
+        for (sender, receiver, performative), (messages, size) in sorted(self.counts.items(),
+                                                                         key=lambda item: -item[1][0]):
+            per_order = f"{messages / orders:.1f}" if orders else "-"
+            lines.append(f"  {sender:<8} {receiver:<8} {str(performative):<12} {messages:>10} "
+                         f"{100 * messages / total:>5.1f}% {size:>12} {per_order:>10}")
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> None:
+        """Writes counters to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def reset(self) -> None:
+        self.counts.clear()
+        self.completed_orders = 0
+
+
+flow = MessageFlow()
+
+
+def dump(path=None) -> None:
+    """Logs the flow report and writes counters to `path`, if given."""
+    logger.info("%s", flow.report())
+    if path is not None:
+        flow.dump(path)
@@ -0,0 +1,182 @@
+"""Order lifecycle metrics.
+
+Each agent measures the stages it sees and records their durations into fixed-memory streaming histograms, one per
+stage and priority. Stages:
+
+* ``queue`` - waiting in `Manager.orders`, once per operation,
+* ``robot_wait`` - GoM's request waiting for its TR to take it,
+* ``recruitment`` - leader TR finding helpers in `FindHelpersState`,
+* ``travel`` - TRs moving the order to the GoM,
+* ``machining`` - `WorkBehaviour` of a GoM,
+* ``total`` - order creation to completion, seen by the factory.
+
+All agents run in one process, they record into the process-wide `lifecycle`.
+"""
+import math
+from array import array
+from typing import Dict, Optional, Tuple
+
+import industry2.settings as settings
+
+STAGES = ("queue", "robot_wait", "recruitment", "travel", "machining", "total")
+
+
+class Histogram:
+    """HDR-style histogram with log-linear buckets. Values are counted in units of `lowest`, every power of 2 range is
+    split into linear sub-buckets fine enough to keep `significant_figures`. Memory is fixed, values above `highest`
+    are counted in the last bucket.
+
+    :param lowest: Smallest distinguishable value.
+    :param highest: Highest trackable value.
+    :param significant_figures: Decimal digits of precision kept.
+    """
+
+    __slots__ = ('lowest', 'highest', '_sub_bits', '_half', '_counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, lowest: float = 1e-3, highest: float = 24 * 60 * 60, significant_figures: int = 2):
+        self.lowest = lowest
+        self.highest = highest
+        sub_bucket_count = 2 ** math.ceil(math.log2(2 * 10 ** significant_figures))
+        self._sub_bits = sub_bucket_count.bit_length() - 1
+        self._half = sub_bucket_count // 2
+        max_shift = max(0, math.ceil(highest / lowest).bit_length() - self._sub_bits)
+        self._counts = array("q", bytes(8 * (max_shift + 2) * self._half))
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, units: int) -> int:
+        shift = units.bit_length() - self._sub_bits
+        if shift <= 0:
+            return units
+        return min(shift * self._half + (units >> shift), len(self._counts) - 1)
+
+    def _upper(self, index: int) -> float:
+        """Returns highest value counted in a bucket."""
+        if index < 2 * self._half:
+            return (index + 1) * self.lowest
+        shift = index // self._half - 1
+        return (((index - shift * self._half) + 1) << shift) * self.lowest
+
+    def record(self, value: float) -> None:
+        """Counts a value, negative values are counted as 0."""
+        value = max(value, 0.)
+        self._counts[self._index(int(value / self.lowest))] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram') -> None:
+        """Adds counts of a histogram with the same parameters."""
+        if len(other._counts) != len(self._counts) or other.lowest != self.lowest:
+            raise ValueError("Histograms have different parameters")
+        counts = self._counts
+        for i, n in enumerate(other._counts):
+            if n:
+                counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """Returns q-th percentile (0-100), accurate to the bucket width, or NaN if empty."""
+        if not self.count:
+            return math.nan
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                return min(self._upper(i), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    def reset(self) -> None:
+        self._counts = array("q", bytes(8 * len(self._counts)))
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = -math.inf
+
+
+class LifecycleMetrics:
+    """Histograms of order lifecycle stage durations, per stage and priority.
+
+    :param lowest: Histogram resolution (s).
+    :param highest: Highest tracked duration (s).
+    :param significant_figures: Histogram precision.
+    """
+
+    def __init__(self, lowest: float = 1e-3, highest: float = 24 * 60 * 60, significant_figures: int = 2):
+        self.lowest = lowest
+        self.highest = highest
+        self.significant_figures = significant_figures
+        self.histograms: Dict[Tuple[str, int], Histogram] = {}  # (stage, priority) -> histogram
+
+    def record(self, stage: str, priority: int, seconds: float) -> None:
+        """Records duration of a stage.
+
+        :param stage: One of `STAGES`.
+        :param priority: Order priority.
+        :param seconds: Duration (s).
+        """
+        histogram = self.histograms.get((stage, priority))
+        if histogram is None:
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage: {stage}")
+            histogram = self.histograms[stage, priority] = Histogram(self.lowest, self.highest,
+                                                                     self.significant_figures)
+        histogram.record(seconds)
+
+    def histogram(self, stage: str, priority: Optional[int] = None) -> Histogram:
+        """Returns histogram of a stage for a priority, or of all priorities merged if `priority` is None."""
+        if priority is not None:
+            return self.histograms.get((stage, priority)) or Histogram(self.lowest, self.highest,
+                                                                       self.significant_figures)
+        merged = Histogram(self.lowest, self.highest, self.significant_figures)
+        for (s, _), histogram in self.histograms.items():
+            if s == stage:
+                merged.merge(histogram)
+        return merged
+
+    def priorities(self):
+        return sorted({priority for _, priority in self.histograms})
+
+    def snapshot(self) -> dict:
+        """Returns summary statistics, ``{stage: {priority: {"count", "mean", "p50", "p90", "p99", "max"}}}``."""
+        result = {}
+        for (stage, priority), histogram in sorted(self.histograms.items(),
+                                                   key=lambda item: (STAGES.index(item[0][0]), item[0][1])):
+            result.setdefault(stage, {})[priority] = {
+                "count": histogram.count, "mean": histogram.mean(), "p50": histogram.percentile(50),
+                "p90": histogram.percentile(90), "p99": histogram.percentile(99), "max": histogram.max,
+            }
+        return result
+
+    def summary(self) -> str:
+        """Returns human readable summary of `snapshot`."""
+        lines = ["Order lifecycle [s]:"]
+        for stage, by_priority in self.snapshot().items():
+            for priority, s in by_priority.items():
+                lines.append(f"  {stage:<12} priority {priority}: n={s['count']} mean={s['mean']:.2f} "
+                             f"p50={s['p50']:.2f} p90={s['p90']:.2f} p99={s['p99']:.2f} max={s['max']:.2f}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        self.histograms.clear()
+
+
+lifecycle = LifecycleMetrics(settings.HISTOGRAM_LOWEST, settings.HISTOGRAM_HIGHEST,
+                             settings.HISTOGRAM_SIGNIFICANT_FIGURES)
+
+
+def record(stage: str, priority: int, seconds: float) -> None:
+    """Records duration of a stage into the process-wide `lifecycle`."""
+    lifecycle.record(stage, priority, seconds)
@@ -0,0 +1,154 @@
+import heapq
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from industry2.common import Order
+
+
+class OrderQueue:
+    """Indexed binary min-heap of `Orders` keyed by `order_id`.
+
+    Orders are served by effective priority (lower is more urgent), ties are broken in FIFO order. With aging enabled,
+    the effective priority of a waiting order drops by `aging_rate` levels per second, so low priority orders can't
+    starve. Since every waiting order ages at the same rate, the heap key ``priority + aging_rate * enqueued_at`` never
+    changes relative order and aging costs nothing on top of a regular heap.
+
+    :param aging_rate: Priority levels gained per second of waiting (0 disables aging).
+    :param clock: Time source used for aging, in seconds.
+    """
+
+    def __init__(self, aging_rate: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        self.aging_rate = aging_rate
+        self.clock = clock
+        # [key, seq, order_id, order, enqueued_at], seq is unique so nothing after it is ever compared
+        self._heap: List[list] = []
+        self._index: Dict[int, int] = {}  # order_id -> position in `_heap`
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._index
+
+    def _key(self, priority: int, enqueued_at: float) -> float:
+        return priority + self.aging_rate * enqueued_at
+
+    def push(self, order: Order) -> None:
+        """Adds an order to the queue.
+
+        :param order: Order to add. Its `order_id` must not be queued already.
+        """
+        oid = order.order_id
+        if oid in self._index:
+            raise KeyError(f"Order {oid} is already queued")
+
+        now = self.clock()
+        self._heap.append([self._key(order.priority, now), self._seq, oid, order, now])
+        self._seq += 1
+        self._index[oid] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def peek(self) -> Order:
+        """Returns the most urgent order without removing it."""
+        if not self._heap:
+            raise IndexError("peek from an empty OrderQueue")
+        return self._heap[0][3]
+
+    def pop(self) -> Order:
+        """Removes and returns the most urgent order."""
+        if not self._heap:
+            raise IndexError("pop from an empty OrderQueue")
+        return self._remove_at(0)
+
+    def __iter__(self) -> Iterator[Order]:
+        """Yields queued orders from the most urgent one. Lazy, the first k orders cost O(k log k). The queue must not
+        change while iterating."""
+        heap = self._heap
+        frontier = [(heap[0][:2], 0)] if heap else []  # (key, seq) and position of heap entries not yielded yet
+        while frontier:
+            _, pos = heapq.heappop(frontier)
+            yield heap[pos][3]
+            for child_pos in (2 * pos + 1, 2 * pos + 2):
+                if child_pos < len(heap):
+                    heapq.heappush(frontier, (heap[child_pos][:2], child_pos))
+
+    def get(self, order_id: int) -> Optional[Order]:
+        """Returns a queued order with given ID or None."""
+        pos = self._index.get(order_id)
+        return self._heap[pos][3] if pos is not None else None
+
+    def remove(self, order_id: int) -> Order:
+        """Removes an order with given ID (e.g. cancellation) in O(log n).
+
+        :param order_id: ID of a queued order.
+        :return: Removed order.
+        """
+        return self._remove_at(self._index[order_id])
+
+    def update_priority(self, order_id: int, priority: int) -> None:
+        """Changes priority of a queued order in O(log n). Time already spent waiting still counts for aging.
+
+        :param order_id: ID of a queued order.
+        :param priority: New priority (N, 0 max).
+        """
+        pos = self._index[order_id]
+        entry = self._heap[pos]
+        entry[3].priority = priority
+        old_key = entry[0]
+        entry[0] = self._key(priority, entry[4])
+        if entry[0] < old_key:
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def effective_priority(self, order_id: int) -> float:
+        """Returns priority of a queued order with aging applied."""
+        return self._heap[self._index[order_id]][0] - self.aging_rate * self.clock()
+
+    def _remove_at(self, pos: int) -> Order:
+        heap = self._heap
+        entry = heap[pos]
+        last = heap.pop()
+        if pos < len(heap):
+            heap[pos] = last
+            self._index[last[2]] = pos
+            self._sift_down(pos)
+            self._sift_up(pos)
+
+        del self._index[entry[2]]
+        return entry[3]
+
+    def _sift_up(self, pos: int) -> None:
+        heap, index = self._heap, self._index
+        entry = heap[pos]
+        while pos > 0:
+            parent_pos = (pos - 1) >> 1
+            parent = heap[parent_pos]
+            if entry >= parent:
+                break
+            heap[pos] = parent
+            index[parent[2]] = pos
+            pos = parent_pos
+        heap[pos] = entry
+        index[entry[2]] = pos
+
+    def _sift_down(self, pos: int) -> None:
+        heap, index = self._heap, self._index
+        size = len(heap)
+        entry = heap[pos]
+        while True:
+            child_pos = 2 * pos + 1
+            if child_pos >= size:
+                break
+            right_pos = child_pos + 1
+            if right_pos < size and heap[right_pos] < heap[child_pos]:
+                child_pos = right_pos
+            child = heap[child_pos]
+            if entry <= child:
+                break
+            heap[pos] = child
+            index[child[2]] = pos
+            pos = child_pos
+        heap[pos] = entry
+        index[entry[2]] = pos
@@ -0,0 +1,142 @@
+"""Playback of recorded runs, see `industry2.trace`.
+
+TR positions come from `MOVE` events, TR states from `STATE` events (FSM state names) and orders carried by moves,
+warehouse and GoM positions from `PLACE` events. Traces recorded before `PLACE` existed have no factory map and TRs start
+where they first moved.
+
+Every `keyframe_events` move events the positions, states and orders of all TRs are stored. Seeking restores the last
+keyframe before the target time and applies the remaining events, playing forward applies only events since the last
+call, both vectorized with NumPy. Events are expected in time order, as a recorder writes them.
+"""
+from typing import Dict
+
+import numpy as np
+
+from industry2 import trace
+from industry2.common import Point
+from industry2.positions import PositionStore
+
+
+def _last_per_slot(slots: np.ndarray) -> (np.ndarray, np.ndarray):
+    """Returns unique slots and the index of the last occurrence of each."""
+    unique, first_reversed = np.unique(slots[::-1], return_index=True)
+    return unique, len(slots) - 1 - first_reversed
+
+
+class Playback:
+    """Recorded run, positioned at `time`.
+
+    :param recorded: Trace as returned by `industry2.trace.read_trace`.
+    :param keyframe_events: Move events between keyframes.
+    """
+
+    def __init__(self, recorded: dict, keyframe_events: int = 200000):
+        names = recorded["names"]
+        event, agent, label = recorded["event"], recorded["agent"], recorded["label"]
+        time, x, y = recorded["time"], recorded["x"], recorded["y"]
+
+        # Initial positions
+        self.factory_map: Dict[str, Point] = {}
+        initial: Dict[str, Point] = {}
+        for i in np.flatnonzero(event == trace.PLACE).tolist():
+            position = Point(float(x[i]), float(y[i]))
+            if names[label[i]] == "tr":
+                initial[names[agent[i]]] = position
+            else:
+                self.factory_map[names[agent[i]]] = position
+
+        # TR slots, names may have more IDs
+        moves = np.flatnonzero(event == trace.MOVE)
+        for name_id in np.unique(agent[moves]).tolist():
+            initial.setdefault(names[name_id], None)
+        self.keys = tuple(initial)
+        slots = {key: slot for slot, key in enumerate(self.keys)}
+        slot_of = np.array([slots.get(name, -1) for name in names], dtype=np.int64)
+
+        self._move_time = time[moves]
+        self._move_slot = slot_of[agent[moves]]
+        self._move_xy = np.column_stack((x[moves], y[moves])).astype(np.float64)
+        self._move_order = recorded["order"][moves]
+        states = np.flatnonzero(event == trace.STATE)
+        states = states[slot_of[agent[states]] >= 0]
+        self._state_time = time[states]
+        self._state_slot = slot_of[agent[states]]
+        self._state_label = label[states].astype(np.int64)
+        self._names = names
+        self.duration = float(time[-1]) if len(time) else 0.
+
+        # Current state
+        n = len(self.keys)
+        self._positions = np.zeros((n, 2))
+        for slot, position in enumerate(initial.values()):
+            if position is not None:
+                self._positions[slot] = position.x, position.y
+        unplaced, first = np.unique(self._move_slot, return_index=True)
+        unplaced_mask = np.array([initial[self.keys[slot]] is None for slot in unplaced.tolist()], dtype=bool)
+        self._positions[unplaced[unplaced_mask]] = self._move_xy[first[unplaced_mask]]
+        self._labels = np.zeros(n, dtype=np.int64)  # name ID of FSM state, 0 - none
+        self._orders = np.full(n, -1, dtype=np.int64)
+        self._move_index = 0
+        self._state_index = 0
+        self.time = 0.
+        self.positions = PositionStore({key: Point(*xy) for key, xy in zip(self.keys, self._positions.tolist())})
+        self._sent_labels = np.full(n, -1, dtype=np.int64)
+        self._sent_orders = np.full(n, -2, dtype=np.int64)
+
+        # Keyframes: (time, move index, state index, positions, labels, orders)
+        self._keyframes = [(-np.inf, 0, 0, self._positions.copy(), self._labels.copy(), self._orders.copy())]
+        for move_index in range(keyframe_events, len(moves), keyframe_events):
+            keyframe_time = self._move_time[move_index]
+            self._advance(keyframe_time, side="left")
+            self._keyframes.append((keyframe_time, self._move_index, self._state_index, self._positions.copy(),
+                                    self._labels.copy(), self._orders.copy()))
+        self._keyframe_times = np.array([keyframe[0] for keyframe in self._keyframes])
+        self._restore(self._keyframes[0])
+
+    def _restore(self, keyframe) -> None:
+        self.time, self._move_index, self._state_index, positions, labels, orders = keyframe
+        np.copyto(self._positions, positions)
+        np.copyto(self._labels, labels)
+        np.copyto(self._orders, orders)
+
+    def _advance(self, time: float, side: str = "right") -> None:
+        """Applies events until `time`, included if `side` is "right"."""
+        start, end = self._move_index, int(np.searchsorted(self._move_time, time, side=side))
+        if end > start:
+            slots, last = _last_per_slot(self._move_slot[start:end])
+            self._positions[slots] = self._move_xy[start:end][last]
+            self._orders[slots] = self._move_order[start:end][last]
+            self._move_index = end
+        start, end = self._state_index, int(np.searchsorted(self._state_time, time, side=side))
+        if end > start:
+            slots, last = _last_per_slot(self._state_slot[start:end])
+            self._labels[slots] = self._state_label[start:end][last]
+            self._state_index = end
+        self.time = time
+
+    def seek(self, time: float) -> dict:
+        """Moves to `time` and publishes TR positions to `positions`.
+
+        :return: patch of TR states changed since the last call, like `FactoryAgent.tr_list_patch`
+        """
+        time = min(max(time, 0.), self.duration)
+        k = int(np.searchsorted(self._keyframe_times, time, side="right")) - 1
+        keyframe = self._keyframes[k]
+        # Play forward from the current time, unless restoring the keyframe is closer
+        if time < self.time or self._move_index < keyframe[1]:
+            self._restore(keyframe)
+        self._advance(time)
+        self.positions.write(self._positions)
+        self.positions.publish()
+
+        changed = np.flatnonzero((self._labels != self._sent_labels) | (self._orders != self._sent_orders))
+        np.copyto(self._sent_labels, self._labels)
+        np.copyto(self._sent_orders, self._orders)
+        names, keys = self._names, self.keys
+        return {keys[slot]: {"state": names[label], "order": order if order >= 0 else None}
+                for slot, label, order in zip(changed.tolist(), self._labels[changed].tolist(),
+                                              self._orders[changed].tolist())}
+
+    def tr_map(self) -> Dict[str, Point]:
+        """Returns current TR positions as Points."""
+        return {key: Point(*xy) for key, xy in zip(self.keys, self._positions.tolist())}
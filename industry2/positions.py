@@ -0,0 +1,81 @@
+"""Double-buffered TR positions shared between the agent thread and the GUI.
+
+Each TR has a fixed slot, a row of (x, y) in NumPy arrays. The agent side writes positions into a staging array as they
+arrive and periodically publishes it: the staging array is copied into the back buffer and the generation counter is
+incremented, which makes the back buffer the front one. Readers copy the front buffer into their own array and retry
+if the writer started overwriting it meanwhile (seqlock style), so they always get a consistent snapshot.
+
+Publishing and reading are a single array copy, no Python objects are created or pickled.
+"""
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from industry2.common import Point
+
+
+class PositionStore:
+    """Positions of a fixed set of TRs.
+
+    :param positions: Initial position of every TR, by JID. Slots follow the order of the keys.
+    """
+
+    def __init__(self, positions: Dict[str, Point]):
+        self.keys = tuple(positions)
+        self.slots = {key: slot for slot, key in enumerate(self.keys)}
+        self._staging = np.array([(pt.x, pt.y) for pt in positions.values()], dtype=np.float64).reshape(-1, 2)
+        self._buffers = np.stack([self._staging, self._staging])
+        self.generation = 0  # published generation, its positions are in buffer `generation % 2`
+        self._writing = 0  # generation being written
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def set(self, key: str, x: float, y: float) -> bool:
+        """Stages position of a TR, visible to readers after `publish`.
+
+        :return: False if `key` has no slot
+        """
+        slot = self.slots.get(key)
+        if slot is None:
+            return False
+        row = self._staging[slot]
+        row[0] = x
+        row[1] = y
+        return True
+
+    def write(self, positions: np.ndarray) -> None:
+        """Stages positions of all TRs, an array of shape (len(self), 2)."""
+        np.copyto(self._staging, positions)
+
+    def publish(self) -> int:
+        """Makes staged positions visible to readers. Only one thread may publish.
+
+        :return: new generation
+        """
+        generation = self.generation + 1
+        self._writing = generation
+        np.copyto(self._buffers[generation & 1], self._staging)
+        self.generation = generation
+        return generation
+
+    def read(self, out: Optional[np.ndarray] = None) -> (int, np.ndarray):
+        """Copies the latest published positions.
+
+        :param out: Array of shape (len(self), 2) to copy into, allocated if None.
+        :return: (generation, positions)
+        """
+        if out is None:
+            out = np.empty_like(self._staging)
+        while True:
+            generation = self.generation
+            np.copyto(out, self._buffers[generation & 1])
+            # The buffer read is overwritten from generation + 2 on
+            if self._writing <= generation + 1:
+                return generation, out
+
+    def points(self, jids: Iterable[str] = None) -> Dict[str, Point]:
+        """Returns latest published positions as Points, of all TRs or of `jids`."""
+        _, positions = self.read()
+        jids = self.keys if jids is None else jids
+        return {jid: Point(*positions[self.slots[jid]].tolist()) for jid in jids}
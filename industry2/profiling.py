@@ -0,0 +1,170 @@
+"""Opt-in behaviour profiling.
+
+With `settings.PROFILE` on, every behaviour added to a `BaseAgent` (and every state of an FSM behaviour) gets its `run`
+wrapped. Stats are kept per behaviour class, keyed by a stack like ``TransportRobotAgent;MoveBehaviour``:
+
+* runs, cumulative and max busy time - time spent on the event loop, awaits excluded,
+* cumulative wall time - including awaits,
+* mailbox depth seen at the start of a run,
+* lateness of periodic behaviours, i.e. start of a run minus its scheduled activation.
+
+An event loop lag probe measures how late a plain `asyncio.sleep` wakes up. Busy times are exported as collapsed stacks
+(``stack microseconds`` per line), readable by flamegraph.pl, speedscope and similar tools.
+"""
+import asyncio
+import types
+from time import perf_counter
+from typing import Dict, Optional
+
+import industry2.settings as settings
+from industry2 import log
+from industry2.metrics import Histogram
+
+logger = log.get_logger("profile")
+
+
+class BehaviourStats:
+    """Stats of one behaviour class."""
+
+    __slots__ = ('runs', 'busy', 'busy_max', 'wall', 'mailbox_total', 'mailbox_max', 'lateness')
+
+    def __init__(self, periodic: bool):
+        self.runs = 0
+        self.busy = 0.  # s
+        self.busy_max = 0.  # s
+        self.wall = 0.  # s
+        self.mailbox_total = 0
+        self.mailbox_max = 0
+        self.lateness = Histogram(1e-4, 60 * 60) if periodic else None  # s
+
+
+@types.coroutine
+def _timed(coro, stats: BehaviourStats):
+    """Drives a coroutine, measuring time spent in its steps."""
+    busy = 0.
+    started_at = perf_counter()
+    value, error = None, None
+    try:
+        while True:
+            step_start = perf_counter()
+            try:
+                future = coro.send(value) if error is None else coro.throw(error)
+            except StopIteration as e:
+                return e.value
+            finally:
+                busy += perf_counter() - step_start
+            try:
+                value, error = (yield future), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+    finally:
+        stats.runs += 1
+        stats.busy += busy
+        stats.wall += perf_counter() - started_at
+        if busy > stats.busy_max:
+            stats.busy_max = busy
+
+
+class Profiler:
+    """Collects behaviour stats and event loop lag.
+
+    :param lag_interval: Sleep of the lag probe (s).
+    """
+
+    def __init__(self, lag_interval: float = 0.1):
+        self.stats: Dict[str, BehaviourStats] = {}  # stack -> stats
+        self.lag = Histogram(1e-5, 60)  # s
+        self.lag_interval = lag_interval
+        self.running = False
+
+    def instrument(self, agent, behaviour) -> None:
+        """Wraps `run` of a behaviour, or of all states of an FSM behaviour."""
+        from spade.behaviour import FSMBehaviour  # loaded by then, `profiling.stop` is used without agents too
+        name = type(behaviour).__name__
+        handler = getattr(behaviour, "handler", None)
+        if handler is not None:
+            name = f"{name};{handler.__name__}"
+        stack = f"{type(agent).__name__};{name}"
+        if isinstance(behaviour, FSMBehaviour):
+            for state in behaviour.get_states().values():
+                self._wrap(state, f"{stack};{type(state).__name__}", behaviour)
+        else:
+            self._wrap(behaviour, stack, behaviour)
+
+    def _wrap(self, behaviour, stack: str, mailbox_owner) -> None:
+        from spade.behaviour import PeriodicBehaviour, now as spade_now
+        stats = self.stats.get(stack)
+        if stats is None:
+            stats = self.stats[stack] = BehaviourStats(isinstance(behaviour, PeriodicBehaviour))
+        run = behaviour.run
+
+        async def profiled_run():
+            if stats.lateness is not None:
+                stats.lateness.record((spade_now() - behaviour._next_activation).total_seconds())
+            if mailbox_owner.queue is not None:
+                depth = mailbox_owner.mailbox_size()
+                stats.mailbox_total += depth
+                if depth > stats.mailbox_max:
+                    stats.mailbox_max = depth
+            return await _timed(run(), stats)
+
+        behaviour.run = profiled_run
+
+    async def probe_lag(self) -> None:
+        """Measures event loop lag until `stop`."""
+        interval = self.lag_interval
+        self.running = True
+        while self.running:
+            start = perf_counter()
+            await asyncio.sleep(interval)
+            self.lag.record(perf_counter() - start - interval)
+
+    def summary(self) -> str:
+        """Returns behaviour stats sorted by busy time, and event loop lag."""
+        lines = ["Behaviours (busy/wall time [ms], lateness [ms]):"]
+        for stack, s in sorted(self.stats.items(), key=lambda item: -item[1].busy):
+            if not s.runs:
+                continue
+            line = (f"  {stack}: runs={s.runs} busy={1e3 * s.busy:.1f} mean={1e3 * s.busy / s.runs:.3f} "
+                    f"max={1e3 * s.busy_max:.3f} wall={1e3 * s.wall:.1f} "
+                    f"mailbox mean={s.mailbox_total / s.runs:.1f} max={s.mailbox_max}")
+            if s.lateness is not None and s.lateness.count:
+                line += (f" lateness p50={1e3 * s.lateness.percentile(50):.1f} "
+                         f"p99={1e3 * s.lateness.percentile(99):.1f} max={1e3 * s.lateness.max:.1f}")
+            lines.append(line)
+        if self.lag.count:
+            lines.append(f"Event loop lag [ms]: n={self.lag.count} p50={1e3 * self.lag.percentile(50):.2f} "
+                         f"p99={1e3 * self.lag.percentile(99):.2f} max={1e3 * self.lag.max:.2f}")
+        return "\n".join(lines)
+
+    def export_collapsed(self, path: str) -> None:
+        """Writes busy times as collapsed stacks, in microseconds."""
+        with open(path, "w") as f:
+            for stack, s in sorted(self.stats.items()):
+                if s.busy > 0:
+                    f.write(f"{stack} {round(s.busy * 1e6)}\n")
+
+
+profiler: Optional[Profiler] = None
+
+
+def start() -> Profiler:
+    """Starts the process-wide profiler used by agents."""
+    global profiler
+    if profiler is None:
+        profiler = Profiler(settings.LAG_PROBE_INTERVAL)
+    return profiler
+
+
+def stop() -> None:
+    """Stops the lag probe, logs the summary and writes `settings.PROFILE_FILE`."""
+    global profiler
+    if profiler is not None:
+        profiler.running = False
+        logger.info("%s", profiler.summary())
+        if settings.PROFILE_FILE is not None:
+            profiler.export_collapsed(settings.PROFILE_FILE)
+        profiler = None
@@ -0,0 +1,76 @@
+"""Shared robot pool, the dispatcher of the pooled fleet mode (`settings.ROBOT_POOL`).
+
+In this mode robots belong to no GoM. A GoM that needs an order transported acquires a robot from the pool, which
+hands out the free robot nearest to the pickup location. Robots leave the pool while they transport or help and return
+when they are done. When no robot is free GoMs wait, first come first served, and a returning robot goes straight to
+the GoM waiting longest.
+
+All agents run on one event loop, so the pool is a plain object shared by GoMs and robots instead of an agent.
+"""
+import asyncio
+from collections import deque
+from typing import Dict, Optional
+
+from industry2.common import Point
+from industry2.spatial import GridIndex
+
+
+class RobotPool:
+    """Free robots of the fleet, indexed by position.
+
+    :param factory_map: Positions of warehouses and GoMs, by name or JID.
+    :param cell_size: Cell side of the spatial index, see `industry2.spatial.GridIndex`.
+    """
+
+    def __init__(self, factory_map: Dict[str, Point], cell_size: float = 32.0):
+        self.factory_map = factory_map
+        self.free = GridIndex(cell_size)
+        # (future, robot JID or None for any) of GoMs waiting for a robot, oldest first
+        self.waiting = deque()
+
+    def __len__(self) -> int:
+        return len(self.free)
+
+    def release(self, jid: str, position: Point) -> None:
+        """Returns a robot to the pool, or hands it over to the GoM waiting longest for it."""
+        self.waiting = deque(entry for entry in self.waiting if not entry[0].done())  # drops GoMs that stopped waiting
+        for entry in self.waiting:
+            future, wanted = entry
+            if wanted is None or wanted == jid:
+                self.waiting.remove(entry)
+                self.free.remove(jid)
+                future.set_result(jid)
+                return
+        self.free.move(jid, position)
+
+    def reserve(self, jid: str) -> None:
+        """Takes a robot out of the pool, e.g. when it starts helping another robot."""
+        self.free.remove(jid)
+
+    def nearest(self, point: Point) -> Optional[str]:
+        """Returns the free robot nearest to `point`, None if there is none."""
+        if not len(self.free):
+            return None
+        radius = self.free.cell_size
+        while True:
+            # Nothing within `radius` is farther than what lies outside, so the first hit is the nearest one
+            jid = self.free.nearest(point, radius)
+            if jid is not None:
+                return jid
+            radius *= 2
+
+    async def acquire(self, location: str, jid: Optional[str] = None) -> str:
+        """Takes the free robot nearest to `location`, waiting for one if none is free.
+
+        :param location: Warehouse name or GoM JID the robot picks the order up at.
+        :param jid: Robot to take instead of the nearest one, waited for if not free, e.g. when replaying a journal.
+        :return: robot JID
+        """
+        if jid is None:
+            jid = self.nearest(self.factory_map[location])
+        if jid is not None and jid in self.free:
+            self.free.remove(jid)
+            return jid
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append((future, jid))
+        return await future
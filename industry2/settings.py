@@ -27,17 +27,99 @@ OP_DURATIONS = {  # s
     Operation.CUT_GLASS: 1.3,
     Operation.LASER_MARK: 1.4,
 }
-GOM_COUNT = 4
+GOM_COUNT = 4  # used when LAYOUT_FILE is None
+LAYOUT_FILE = None  # path to a factory layout file, see industry2.layout
+EXPRESS_PRIORITY = 0  # orders with priority <= EXPRESS_PRIORITY are express orders
+EXPRESS_ORDER_SHARE = 0.0  # share of generated orders that are express orders
+EXPRESS_RESERVED_GOM_SHARE = 0.0  # share of GoMs kept free for express orders
+EXPRESS_RESERVED_TR_SHARE = 0.0  # share of TRs that only help with express orders, taken from TRs leading no transports
 RECEIVE_TIMEOUT = 15 * 60  # s
 MANAGER_LOOP_TIMEOUT = 0.1  # s
+ORDER_AGING_RATE = 0.0  # priority levels per s spent in Manager's queue, 0 - no aging
+MANAGER_QUEUE_LIMIT = 200  # orders, Manager refuses new orders when its queue is this long
+STAGE_TIME_EWMA_ALPHA = 0.1  # smoothing of mean stage time used to estimate wait
+ADMISSION_LOW_WATERMARK = 20  # queued orders, factory slows order generation down above
+ADMISSION_HIGH_WATERMARK = 50  # queued orders, factory sheds new orders above
+ADMISSION_MAX_WAIT = 5 * 60  # s, factory sheds new orders if Manager's estimated wait is longer
 AGENT_CREATION_SLEEP = 0.1  # s
 TR_TICK_DURATION = 0.1  # s
 TR_DECIDE_TIMEOUT = 1  # s
 
+# Pooled fleet, see industry2.robot_pool
+ROBOT_POOL = False  # if True, robots serve any GoM, each transport gets the nearest free robot
+POOL_ROBOTS = None  # robots in the pool, None - as many as the layout assigns to GoMs
+
 TR_POSITION_UPDATE_PERIOD = 0.25  # s
 TR_LIST_UPDATE_PERIOD = 1.0  # s
 
+# Utilization panels and heatmap, see industry2.utilization
+UTILIZATION_SAMPLE_PERIOD = 1.0  # s
+UTILIZATION_HISTORY = 300  # samples kept in time series
+UTILIZATION_WINDOW = 30  # samples, rolling window of rates and utilizations
+HEATMAP_CELL_SIZE = 8  # absolute units
+HEATMAP_HALF_LIFE = 300.0  # s
+
+# Workload, see industry2.workload
+ORDER_PERIOD = 8.0  # s, mean time between orders
+ARRIVAL_PROCESS = 'periodic'  # 'periodic', 'poisson', 'mmpp' or 'diurnal'
+MMPP_RATES = (0.5, 4.0)  # x 1 / ORDER_PERIOD, arrival rate in each state
+MMPP_DWELL = (10 * 60, 60)  # s, mean time spent in each state
+DIURNAL_AMPLITUDE = 0.8  # relative arrival rate swing
+DIURNAL_PERIOD = 24 * 60 * 60  # s
+OPERATION_WEIGHTS = None  # Operation -> relative frequency, None - uniform
+OPS_PER_ORDER = (3, 10)  # min, max
+TR_COUNT_WEIGHTS = {3: 1.}  # TRs needed for an operation -> relative frequency
+WORKLOAD_TRACE = None  # path to an order trace (JSON lines) replayed instead of generating orders
+WORKLOAD_SEED = None  # overrides the seed derived from SEED
+WORKLOAD_CHUNK = 1024  # orders generated at a time
+
+# Determinism, see industry2.determinism
+SEED = None  # seeds every random source, None - random runs
+JOURNAL_FILE = None  # path of run journal, None - no journal
+REPLAY_JOURNAL = None  # path of a journal to replay
+REPLAY_DISPATCH_TIMEOUT = 60  # s, replayed dispatches of orders that don't arrive in time are dropped
+
+TRACE_FILE = None  # path of binary event trace, see industry2.trace
+
+# Behaviour profiling, see industry2.profiling
+PROFILE = False
+PROFILE_FILE = None  # path of collapsed stacks written at the end, for flamegraph.pl or speedscope
+PROFILE_REPORT_PERIOD = 60.0  # s, period of logged summary
+LAG_PROBE_INTERVAL = 0.1  # s
+
+MESSAGE_FLOW_FILE = None  # path of JSON message flow counters written at the end, see industry2.message_flow
+
+# Streaming to viewers in other processes, see industry2.stream
+STREAM_FPS = 10.0  # frames per second requested by viewers
+STREAM_RECONNECT_PERIOD = 1.0  # s, between attempts of a viewer to connect
+
+# Playback of traces in the GUI, see industry2.playback
+PLAYBACK_KEYFRAME_EVENTS = 200000  # move events between keyframes, bounds the work of a seek
+PLAYBACK_SPEEDS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100)
+
+# Logging, see industry2.log
+LOG_LEVEL = 'INFO'
+LOG_LEVELS = {'messages': 'WARNING', 'agents': 'INFO'}  # category -> level, e.g. {'messages': 'DEBUG'}
+LOG_SAMPLING = {}  # category -> share of records kept, e.g. {'messages': 0.01}
+LOG_BUFFER_SIZE = 10000  # records, oldest are dropped when the writer falls behind
+LOG_FILE = None  # stdout if None
+
+# Order lifecycle histograms, see industry2.metrics
+LATENCY_REPORT_PERIOD = 30.0  # s, period of logged summary
+HISTOGRAM_LOWEST = 1e-3  # s, resolution
+HISTOGRAM_HIGHEST = 24 * 60 * 60  # s, longer durations are counted as this
+HISTOGRAM_SIGNIFICANT_FIGURES = 2
+
+FRAME_PERIOD = 0.1  # s, GUI applies updates and redraws at most this often
 ZOOM_MIN = 0.5
 ZOOM_MAX = 5.0
 ZOOM_DEFAULT = 2.5
 SELECT_RADIUS = 10  # px with zoom=1.0
+
+# Level of detail of the canvas
+LABEL_MIN_ZOOM = 1.5  # labels are hidden below this zoom
+CLUSTER_MAX_ZOOM = 1.0  # TRs are drawn as density tiles below this zoom...
+CLUSTER_MAX_POINTS = 2000  # ...or when more TRs than this are visible
+CLUSTER_TILE_SIZE = 32  # px
+CULL_MARGIN = 50  # px, items this far outside the window are still drawn
+SPATIAL_CELL_SIZE = 32  # absolute units, cell of the grid indexing positions for selection and culling
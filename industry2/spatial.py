@@ -0,0 +1,107 @@
+"""Uniform grid index of positions on the factory map.
+
+Keys (JIDs) are bucketed into square cells, so moving a key is O(1) and a query visits only the cells it overlaps.
+Used by the GUI view model for hit-testing and viewport culling.
+"""
+import math
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from industry2.common import Point
+
+Cell = Tuple[int, int]
+
+
+class GridIndex:
+    """Spatial index of keyed points.
+
+    :param cell_size: Cell side in absolute units, about the typical query radius works well.
+    """
+
+    def __init__(self, cell_size: float = 32.0):
+        self.cell_size = cell_size
+        self._cells: Dict[Cell, Set[Hashable]] = {}
+        self._entries: Dict[Hashable, Tuple[Cell, Point]] = {}  # key -> (cell, position)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def cell_of(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def move(self, key, position: Point) -> None:
+        """Inserts `key` at `position`, or moves it there."""
+        cell = self.cell_of(position.x, position.y)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] != cell:
+            self._discard(key, entry[0])
+        if entry is None or entry[0] != cell:
+            self._cells.setdefault(cell, set()).add(key)
+        self._entries[key] = (cell, position)
+
+    def remove(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._discard(key, entry[0])
+
+    def _discard(self, key, cell: Cell) -> None:
+        keys = self._cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self._cells[cell]
+
+    def update(self, positions: dict) -> None:
+        """Makes the index hold exactly `positions` (key -> Point), touching only keys that moved or changed."""
+        for key in [key for key in self._entries if key not in positions]:
+            self.remove(key)
+        entries = self._entries
+        for key, position in positions.items():
+            entry = entries.get(key)
+            if entry is None or entry[1] != position:
+                self.move(key, position)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._entries.clear()
+
+    def _cells_in(self, min_x: float, min_y: float, max_x: float, max_y: float):
+        """Yields occupied cells overlapping the rectangle."""
+        (min_cx, min_cy), (max_cx, max_cy) = self.cell_of(min_x, min_y), self.cell_of(max_x, max_y)
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self._cells):
+            # The rectangle spans more cells than are occupied, filter these instead
+            for cell, keys in self._cells.items():
+                if min_cx <= cell[0] <= max_cx and min_cy <= cell[1] <= max_cy:
+                    yield keys
+            return
+        cells = self._cells
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                keys = cells.get((cx, cy))
+                if keys is not None:
+                    yield keys
+
+    def query_rect(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[Tuple[Hashable, Point]]:
+        """Returns (key, position) pairs within the rectangle, bounds included."""
+        entries = self._entries
+        result = []
+        for keys in self._cells_in(min_x, min_y, max_x, max_y):
+            for key in keys:
+                position = entries[key][1]
+                if min_x <= position.x <= max_x and min_y <= position.y <= max_y:
+                    result.append((key, position))
+        return result
+
+    def nearest(self, point: Point, radius: float) -> Optional[Hashable]:
+        """Returns the key nearest to `point` within `radius`, None if there is none."""
+        entries = self._entries
+        best, best_distance = None, radius * radius
+        for keys in self._cells_in(point.x - radius, point.y - radius, point.x + radius, point.y + radius):
+            for key in keys:
+                position = entries[key][1]
+                dx, dy = position.x - point.x, position.y - point.y
+                distance = dx * dx + dy * dy
+                if distance <= best_distance:
+                    best, best_distance = key, distance
+        return best
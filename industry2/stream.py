@@ -0,0 +1,255 @@
+"""Streaming of the simulation to viewers in other processes, over a Unix socket.
+
+The simulation side runs a `StreamServer` on the agents' event loop, a viewer connects with a `StreamClient`. Viewers
+may attach, detach and reconnect at any time. After connecting a viewer sends a JSON line ``{"fps": N}``, it can send
+more to change its frame rate. The server then sends frames, each a header - ``uint8`` kind and ``uint32`` payload
+length, little endian - and a payload:
+
+* `LAYOUT` - JSON ``{"factory_map": {name: [x, y]}, "tr_jids": [...]}``, TR slots follow `tr_jids`,
+* `STATE` - JSON TR state patch, TR JID -> changed fields, see `FactoryAgent.tr_list_patch`,
+* `POSITIONS` - ``uint64`` generation, then ``float64`` (x, y) of each TR slot.
+
+A viewer gets the layout and full TR states on attach, then at most `fps` frames per second. Positions are read from
+the `PositionStore` when a frame is sent, so only the latest ones are sent, and state patches are merged while a viewer
+is busy. The simulation never waits for a viewer, and costs nothing when none is attached.
+"""
+import asyncio
+import json
+import os
+import socket
+import struct
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from industry2 import log
+from industry2.common import Point
+from industry2.positions import PositionStore
+
+logger = log.get_logger("stream")
+
+LAYOUT = 1
+STATE = 2
+POSITIONS = 3
+
+HEADER = struct.Struct("<BI")
+GENERATION = struct.Struct("<Q")
+
+
+def frame(kind: int, payload: bytes) -> bytes:
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def _jsonable(value):
+    """JSON fallback for TR state values, e.g. orders."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict(encode_json=True)
+    return str(value)
+
+
+class Signal:
+    """Stands in for a Qt signal outside the GUI, `emit` calls `callback`, if given."""
+
+    def __init__(self, callback: Optional[Callable] = None):
+        self.callback = callback
+
+    def emit(self, *args) -> None:
+        if self.callback is not None:
+            self.callback(*args)
+
+
+class _Viewer:
+    """Attached viewer and what it hasn't been sent yet."""
+
+    __slots__ = ('fps', 'layout', 'patch', 'generation')
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self.layout = None  # LAYOUT frame
+        self.patch = {}  # merged TR state patches
+        self.generation = None  # of last positions sent
+
+
+class StreamServer:
+    """Streams layout, TR states and positions to viewers. Apart from `start` and `stop` (thread safe), use from the
+    agents' event loop only.
+
+    :param path: Unix socket path, a stale socket file is replaced.
+    :param positions: Store TR positions are read from.
+    :param fps: Frame rate of viewers that didn't ask for one.
+    """
+
+    def __init__(self, path: str, positions: PositionStore, fps: float = 10.):
+        self.path = path
+        self.positions = positions
+        self.fps = fps
+        self.layout = None  # LAYOUT frame
+        self.states: Dict[str, dict] = {}  # TR JID -> state, JSON compatible
+        self.viewers = set()
+        self._server = None
+        self._tasks = set()  # `_serve` tasks of attached viewers
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Starts listening on `loop`, from another thread."""
+        asyncio.run_coroutine_threadsafe(self._start(), loop).result()
+
+    async def _start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+        logger.info("streaming to %s", self.path)
+
+    def stop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Disconnects viewers and stops listening, from another thread."""
+        if self._server is not None:
+            asyncio.run_coroutine_threadsafe(self._stop(), loop).result()
+
+    async def _stop(self):
+        self._server.close()
+        # Since Python 3.12 `wait_closed` also waits for connections, viewers are disconnected first
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def update_view_model(self, tr_list=None, tr_map=None, factory_map=None) -> None:
+        """Takes arguments of the GUI's `update_view_model` signal. Positions in `tr_map` are ignored, they are read
+        from `positions`.
+        """
+        if factory_map:
+            layout = {"factory_map": {name: [pt.x, pt.y] for name, pt in factory_map.items()},
+                      "tr_jids": list(self.positions.keys)}
+            self.layout = frame(LAYOUT, json.dumps(layout).encode())
+            for viewer in self.viewers:
+                viewer.layout = self.layout
+        if tr_list:
+            patch = json.loads(json.dumps(tr_list, default=_jsonable))
+            for jid, fields in patch.items():
+                self.states.setdefault(jid, {}).update(fields)
+            for viewer in self.viewers:
+                for jid, fields in patch.items():
+                    viewer.patch.setdefault(jid, {}).update(fields)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        viewer = _Viewer(self.fps)
+        viewer.layout = self.layout
+        viewer.patch = {jid: dict(state) for jid, state in self.states.items()}
+        self.viewers.add(viewer)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        requests = asyncio.ensure_future(self._read_requests(reader, viewer))
+        logger.info("viewer attached, %d attached", len(self.viewers))
+        positions = None
+        try:
+            while not requests.done():
+                frames = []
+                if viewer.layout is not None:
+                    frames.append(viewer.layout)
+                    viewer.layout = None
+                if viewer.patch:
+                    frames.append(frame(STATE, json.dumps(viewer.patch).encode()))
+                    viewer.patch = {}
+                if viewer.generation != self.positions.generation:
+                    viewer.generation, positions = self.positions.read(positions)
+                    frames.append(frame(POSITIONS, GENERATION.pack(viewer.generation) + positions.tobytes()))
+                if frames:
+                    writer.write(b"".join(frames))
+                    await writer.drain()
+                await asyncio.sleep(1 / viewer.fps)
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.CancelledError:
+            pass  # by `stop`, ending normally keeps asyncio from reporting the cancelled connection task
+        finally:
+            self.viewers.discard(viewer)
+            self._tasks.discard(task)
+            requests.cancel()
+            writer.close()
+            logger.info("viewer detached, %d attached", len(self.viewers))
+
+    async def _read_requests(self, reader: asyncio.StreamReader, viewer: _Viewer) -> None:
+        """Reads viewer's requests until it disconnects."""
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            try:
+                viewer.fps = max(0.1, float(json.loads(line)["fps"]))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("invalid viewer request %r", line)
+
+
+class StreamClient:
+    """Viewer side, receives frames of a `StreamServer` in a blocking loop, reconnecting when disconnected. Positions
+    are published to `positions`, a new store is created for every layout.
+
+    :param path: Unix socket path.
+    :param fps: Requested frame rate.
+    :param on_layout: Called with factory map (name -> Point) and TR JIDs on every layout frame.
+    :param on_state: Called with TR state patches.
+    :param reconnect_period: Time between connection attempts (s).
+    """
+
+    def __init__(self, path: str, fps: float, on_layout: Callable, on_state: Callable, reconnect_period: float = 1.):
+        self.path = path
+        self.fps = fps
+        self.on_layout = on_layout
+        self.on_state = on_state
+        self.reconnect_period = reconnect_period
+        self.positions: Optional[PositionStore] = None
+        self.running = False
+        self._socket = None
+
+    def run(self) -> None:
+        """Receives frames until `stop`."""
+        self.running = True
+        while self.running:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    self._socket = sock
+                    sock.sendall(json.dumps({"fps": self.fps}).encode() + b"\n")
+                    self._receive(sock.makefile("rb"))
+            except OSError:
+                pass
+            finally:
+                self._socket = None
+            if self.running:
+                time.sleep(self.reconnect_period)
+
+    def stop(self) -> None:
+        """Disconnects and makes `run` return, from any thread."""
+        self.running = False
+        sock = self._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _receive(self, stream) -> None:
+        while self.running:
+            header = stream.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            kind, length = HEADER.unpack(header)
+            payload = stream.read(length)
+            if len(payload) < length:
+                return
+            if kind == LAYOUT:
+                layout = json.loads(payload)
+                tr_jids = layout["tr_jids"]
+                self.positions = PositionStore({jid: Point(0., 0.) for jid in tr_jids})
+                self.on_layout({name: Point(x, y) for name, (x, y) in layout["factory_map"].items()}, tr_jids)
+            elif kind == STATE:
+                self.on_state(json.loads(payload))
+            elif kind == POSITIONS and self.positions is not None:
+                positions = np.frombuffer(payload, dtype="<f8", offset=GENERATION.size).reshape(-1, 2)
+                if len(positions) == len(self.positions):
+                    self.positions.write(positions)
+                    self.positions.publish()
@@ -0,0 +1,195 @@
+"""High-volume event trace recorder.
+
+Events are written into preallocated column buffers (one `array.array` per column) and flushed, when full, to a
+compact binary file. Recording an event is a handful of array stores, cheap enough to leave tracing on in large runs.
+
+File format (little endian): magic ``I2TRACE1``, then chunks, each starting with a one byte tag:
+
+* ``H`` - header: ``float64`` `perf_counter` at start, ``float64`` UNIX time at start,
+* ``S`` - new names: ``uint32`` count, then for each ``uint32`` ID, ``uint16`` length and UTF-8 bytes,
+* ``E`` - events: ``uint32`` count, then each column as raw values, in `COLUMNS` order.
+
+Names (agent JIDs, performatives, state names) are interned to IDs, 0 is "no name".
+"""
+import math
+import struct
+import sys
+from array import array
+from time import perf_counter, time
+from typing import Dict, Optional
+
+from industry2.enums import TraceEvent
+
+MAGIC = b"I2TRACE1"
+
+# Event types as plain ints, storing them is faster than storing `TraceEvent` members
+MSG_SENT = TraceEvent.MSG_SENT.value
+MSG_RECEIVED = TraceEvent.MSG_RECEIVED.value
+STATE = TraceEvent.STATE.value
+WORK_START = TraceEvent.WORK_START.value
+WORK_END = TraceEvent.WORK_END.value
+MOVE = TraceEvent.MOVE.value
+PLACE = TraceEvent.PLACE.value
+
+# (name, array typecode)
+COLUMNS = (
+    ("time", "d"),  # s, perf_counter
+    ("event", "B"),  # TraceEvent
+    ("agent", "I"),  # name ID
+    ("peer", "I"),  # name ID of other agent (messages)
+    ("label", "I"),  # name ID of performative (messages) or state
+    ("order", "q"),  # order ID, -1 - none
+    ("x", "f"),
+    ("y", "f"),
+)
+
+
+class TraceRecorder:
+    """Records typed events into preallocated column buffers.
+
+    :param path: Path to the trace file, overwritten.
+    :param capacity: Events buffered before a flush.
+    """
+
+    __slots__ = ('path', 'capacity', '_columns', '_time', '_event', '_agent', '_peer', '_label', '_order', '_x', '_y',
+                 '_n', '_names', '_new_names', '_file')
+
+    def __init__(self, path: str, capacity: int = 65536):
+        self.path = path
+        self.capacity = capacity
+        self._columns = [array(code, bytes(array(code).itemsize * capacity)) for _, code in COLUMNS]
+        (self._time, self._event, self._agent, self._peer, self._label, self._order,
+         self._x, self._y) = self._columns
+        self._n = 0
+        self._names: Dict[object, int] = {None: 0}
+        self._new_names = []  # (ID, name) not written yet
+
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._file.write(b"H" + struct.pack("<dd", perf_counter(), time()))
+
+    def intern(self, name) -> int:
+        """Returns ID of a name. Any hashable object can be used, its `str` is written to the file."""
+        name_id = self._names.get(name)
+        if name_id is None:
+            name_id = self._names[name] = len(self._names)
+            self._new_names.append((name_id, str(name)))
+        return name_id
+
+    def record(self, event: int, agent: int, peer: int = 0, label: int = 0, order: int = -1,
+               x: float = math.nan, y: float = math.nan) -> None:
+        """Records an event. Names must be interned first.
+
+        :param event: Event type, one of the module's `TraceEvent` values.
+        :param agent: Name ID of the agent.
+        :param peer: Name ID of the other agent.
+        :param label: Name ID of performative or state.
+        :param order: Order ID.
+        :param x: Position.
+        :param y: Position.
+        """
+        i = self._n
+        self._time[i] = perf_counter()
+        self._event[i] = event
+        self._agent[i] = agent
+        self._peer[i] = peer
+        self._label[i] = label
+        self._order[i] = order
+        self._x[i] = x
+        self._y[i] = y
+        self._n = i + 1
+        if self._n == self.capacity:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes buffered events to the file."""
+        f = self._file
+        if self._new_names:
+            f.write(b"S" + struct.pack("<I", len(self._new_names)))
+            for name_id, name in self._new_names:
+                encoded = name.encode()[:0xFFFF]
+                f.write(struct.pack("<IH", name_id, len(encoded)) + encoded)
+            self._new_names = []
+
+        n = self._n
+        if n:
+            f.write(b"E" + struct.pack("<I", n))
+            for column in self._columns:
+                values = column[:n]
+                if sys.byteorder != "little":
+                    values.byteswap()
+                values.tofile(f)
+            self._n = 0
+        f.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+def read_trace(path: str) -> dict:
+    """Reads a trace file.
+
+    :param path: Path to the trace file.
+    :return: dict with a NumPy array per column (`time` in seconds since start), ``names`` (list indexed by name ID)
+        and ``start`` (UNIX time).
+    :raises ValueError: if the file is not a trace or is truncated, e.g. by a crash before `stop`
+    """
+    import numpy as np
+
+    columns = {name: [] for name, _ in COLUMNS}
+    names = {0: ""}
+    base, start = 0., 0.
+    with open(path, "rb") as f:
+        def read(size: int) -> bytes:
+            data = f.read(size)
+            if len(data) < size:
+                raise ValueError(f"{path}: truncated trace")
+            return data
+
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a trace file")
+        while True:
+            tag = f.read(1)
+            if not tag:
+                break
+            if tag == b"H":
+                base, start = struct.unpack("<dd", read(16))
+            elif tag == b"S":
+                (count,) = struct.unpack("<I", read(4))
+                for _ in range(count):
+                    name_id, length = struct.unpack("<IH", read(6))
+                    names[name_id] = read(length).decode()
+            elif tag == b"E":
+                (n,) = struct.unpack("<I", read(4))
+                for name, code in COLUMNS:
+                    dtype = np.dtype(code).newbyteorder("<")
+                    columns[name].append(np.frombuffer(read(n * dtype.itemsize), dtype=dtype))
+            else:
+                raise ValueError(f"{path}: bad chunk tag {tag!r}")
+
+    result = {name: np.concatenate(chunks) if chunks else np.empty(0, dtype=code)
+              for (name, code), chunks in zip(COLUMNS, columns.values())}
+    result["time"] = result["time"] - base
+    result["names"] = [names.get(i, "") for i in range(max(names) + 1)]
+    result["start"] = start
+    return result
+
+
+recorder: Optional[TraceRecorder] = None
+
+
+def start(path: str) -> TraceRecorder:
+    """Starts the process-wide recorder used by agents."""
+    global recorder
+    if recorder is None:
+        recorder = TraceRecorder(path)
+    return recorder
+
+
+def stop() -> None:
+    """Flushes and closes the process-wide recorder."""
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
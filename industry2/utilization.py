@@ -0,0 +1,143 @@
+"""Live utilization time series and robot occupancy heatmap.
+
+`UtilizationMonitor.sample` is called periodically with counters of the running system. Everything it keeps is of fixed
+size - ring buffers of the last `capacity` samples and a grid over the floor - so a sample costs the same after a minute
+and after a day. Rates and utilizations are computed over a rolling window of the last `window` samples, as differences
+of cumulative counters.
+
+Each sample replaces `latest`, an immutable snapshot another thread (the GUI) can read at any time.
+"""
+from types import MappingProxyType
+from typing import Optional, Sequence
+
+import numpy as np
+
+ROBOT_STATES = ("busy", "idle", "helping")
+
+
+class RingBuffer:
+    """Last `capacity` values of a time series, in a preallocated array.
+
+    :param capacity: Values kept.
+    :param width: Length of vector values, None for scalars.
+    """
+
+    __slots__ = ('_values', '_n', '_i')
+
+    def __init__(self, capacity: int, width: Optional[int] = None):
+        self._values = np.zeros((capacity,) if width is None else (capacity, width))
+        self._n = 0  # values stored
+        self._i = 0  # index of the next value
+
+    def __len__(self) -> int:
+        return self._n
+
+    def append(self, value) -> None:
+        self._values[self._i] = value
+        self._i = (self._i + 1) % len(self._values)
+        self._n = min(self._n + 1, len(self._values))
+
+    def ago(self, k: int):
+        """Returns value appended `k` appends ago, 0 is the last one. `k` is clipped to the oldest value."""
+        k = min(k, self._n - 1)
+        return self._values[(self._i - 1 - k) % len(self._values)]
+
+    def values(self) -> np.ndarray:
+        """Returns a copy of the stored values, oldest first."""
+        if self._n < len(self._values):
+            return self._values[:self._n].copy()
+        return np.roll(self._values, -self._i, axis=0)
+
+
+class Heatmap:
+    """Time spent at each cell of a grid over the floor, decaying exponentially so recent activity dominates.
+
+    :param bounds: (min x, min y, max x, max y) of the floor in absolute units, positions outside count to edge cells.
+    :param cell_size: Cell side in absolute units.
+    :param half_life: Time after which past occupancy counts half (s).
+    """
+
+    def __init__(self, bounds: Sequence[float], cell_size: float, half_life: float):
+        self.bounds = tuple(bounds)
+        self.cell_size = cell_size
+        self.half_life = half_life
+        min_x, min_y, max_x, max_y = self.bounds
+        self.grid = np.zeros((max(1, int(np.ceil((max_y - min_y) / cell_size))),
+                              max(1, int(np.ceil((max_x - min_x) / cell_size)))))  # [row (y), column (x)] -> s
+
+    def add(self, positions: np.ndarray, dt: float) -> None:
+        """Adds `dt` seconds spent at each of `positions`, an array of (x, y) rows."""
+        self.grid *= 0.5 ** (dt / self.half_life)
+        rows, columns = self.grid.shape
+        min_x, min_y = self.bounds[0], self.bounds[1]
+        x = np.clip(((positions[:, 0] - min_x) / self.cell_size).astype(np.int64), 0, columns - 1)
+        y = np.clip(((positions[:, 1] - min_y) / self.cell_size).astype(np.int64), 0, rows - 1)
+        self.grid += np.bincount(y * columns + x, minlength=rows * columns).reshape(rows, columns) * dt
+
+
+class UtilizationMonitor:
+    """Rolling utilization of GoMs and robots, queue length, throughput and robot heatmap.
+
+    :param gom_jids: GoMs, in the order of `sample`'s `gom_busy`.
+    :param bounds: Floor bounds for the heatmap, see `Heatmap`.
+    :param capacity: Samples kept in time series.
+    :param window: Samples of the rolling window of rates and utilizations.
+    :param cell_size: Heatmap cell size.
+    :param half_life: Heatmap half life (s).
+    """
+
+    def __init__(self, gom_jids: Sequence[str], bounds: Sequence[float], capacity: int = 300, window: int = 30,
+                 cell_size: float = 8., half_life: float = 300.):
+        self.gom_jids = tuple(gom_jids)
+        self.window = window
+        self.times = RingBuffer(capacity)
+        self.queue_length = RingBuffer(capacity)
+        self.throughput = RingBuffer(capacity)  # orders per hour over the window
+        self.robots = RingBuffer(capacity, len(ROBOT_STATES))  # share of robots in each of `ROBOT_STATES`
+        self._completed = RingBuffer(window + 1)  # cumulative completed orders
+        self._gom_busy = RingBuffer(window + 1, len(self.gom_jids))  # cumulative busy time of each GoM (s)
+        self._window_times = RingBuffer(window + 1)
+        self.heatmap = Heatmap(bounds, cell_size, half_life)
+        self.latest: Optional[MappingProxyType] = None
+
+    def sample(self, now: float, gom_busy: Sequence[float], robot_counts: Sequence[int], queue_length: int,
+               completed_orders: int, positions: np.ndarray) -> MappingProxyType:
+        """Records a sample and publishes a new snapshot in `latest`.
+
+        :param now: Time of the sample (s), monotonic.
+        :param gom_busy: Cumulative busy time of each GoM (s).
+        :param robot_counts: Robots in each of `ROBOT_STATES`.
+        :param queue_length: Orders waiting for a GoM.
+        :param completed_orders: Cumulative completed orders.
+        :param positions: Robot positions, (x, y) rows.
+        :return: the snapshot
+        """
+        gom_busy = np.asarray(gom_busy, dtype=float)
+        if len(self._window_times):
+            self.heatmap.add(positions, now - self._window_times.ago(0))
+        self._window_times.append(now)
+        self._completed.append(completed_orders)
+        self._gom_busy.append(gom_busy)
+
+        span = now - self._window_times.ago(self.window)
+        if span > 0:
+            throughput = (completed_orders - self._completed.ago(self.window)) / span * 60 * 60
+            gom_utilization = np.clip((gom_busy - self._gom_busy.ago(self.window)) / span, 0., 1.)
+        else:
+            throughput, gom_utilization = 0., np.zeros(len(self.gom_jids))
+        robots = sum(robot_counts)
+
+        self.times.append(now)
+        self.queue_length.append(queue_length)
+        self.throughput.append(throughput)
+        self.robots.append([count / robots if robots else 0. for count in robot_counts])
+        self.latest = MappingProxyType({
+            "times": self.times.values(),
+            "queue_length": self.queue_length.values(),
+            "throughput": self.throughput.values(),
+            "robots": self.robots.values(),
+            "gom_utilization": gom_utilization,
+            "heatmap": self.heatmap.grid.copy(),
+            "heatmap_bounds": self.heatmap.bounds,
+        })
+        return self.latest
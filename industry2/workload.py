@@ -0,0 +1,314 @@
+"""Order workloads: arrival processes, order content distributions and trace replay.
+
+A workload is an iterable of order specs ``(time, priority, operations, tr_counts)``, where `time` is the arrival time
+in seconds since the start of generation. Orders are pre-generated in vectorized chunks with a seeded NumPy RNG, so a
+workload with a given seed is always the same.
+"""
+import json
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import industry2.settings as settings
+from industry2 import determinism
+from industry2.common import MAX_TR_COUNT
+from industry2.enums import Operation
+
+OrderSpec = Tuple[float, int, List[Operation], List[int]]
+
+OPERATIONS = list(Operation)
+
+
+class ArrivalProcess:
+    """Base arrival process. Generates consecutive arrival times, continuing from the last generated one."""
+
+    def __init__(self):
+        self.time = 0.  # s, last arrival
+
+    def next_times(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """Returns next `n` arrival times (s), sorted."""
+        raise NotImplementedError
+
+
+class PeriodicArrivals(ArrivalProcess):
+    """Orders arrive every `period` seconds, first one at 0.
+
+    :param period: Time between arrivals (s).
+    """
+
+    def __init__(self, period: float):
+        super().__init__()
+        self.period = period
+        self.time = -period
+
+    def next_times(self, rng, n):
+        times = self.time + self.period * np.arange(1, n + 1)
+        self.time = times[-1]
+        return times
+
+
+class PoissonArrivals(ArrivalProcess):
+    """Poisson process, i.e. exponentially distributed times between arrivals.
+
+    :param rate: Mean arrival rate (1/s).
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def next_times(self, rng, n):
+        times = self.time + np.cumsum(rng.exponential(1 / self.rate, n))
+        self.time = times[-1]
+        return times
+
+
+class MMPPArrivals(ArrivalProcess):
+    """Markov-modulated Poisson process, used for bursty load. The process stays in each state for an exponentially
+    distributed time and then moves to another state, chosen uniformly. In each state orders arrive as a Poisson process
+    with that state's rate.
+
+    :param rates: Arrival rate (1/s) in each state.
+    :param dwell: Mean time (s) spent in each state.
+    """
+
+    def __init__(self, rates: Sequence[float], dwell: Sequence[float]):
+        super().__init__()
+        if len(rates) != len(dwell) or len(rates) < 2:
+            raise ValueError("MMPP needs at least 2 states with a rate and dwell time each")
+        self.rates = np.asarray(rates, dtype=float)
+        self.dwell = np.asarray(dwell, dtype=float)
+        self.state = 0
+        self.state_end = None  # s, end of current state
+
+    def next_times(self, rng, n):
+        chunks = []
+        count = 0
+        start = self.time
+        if self.state_end is None:
+            self.state_end = rng.exponential(self.dwell[self.state])
+        while count < n:
+            # Number of arrivals in a state given its length is Poisson, their times are uniform
+            k = rng.poisson(self.rates[self.state] * (self.state_end - start))
+            if k:
+                chunks.append(np.sort(rng.uniform(start, self.state_end, k)))
+                count += k
+            if count >= n:
+                break
+            start = self.state_end
+            self.state = (self.state + rng.integers(1, len(self.rates))) % len(self.rates)
+            self.state_end = start + rng.exponential(self.dwell[self.state])
+
+        times = np.concatenate(chunks)[:n]
+        # Arrivals past the returned ones are dropped, so the current state resumes right after the last one
+        self.time = times[-1]
+        return times
+
+
+class DiurnalArrivals(ArrivalProcess):
+    """Non-homogeneous Poisson process with a sinusoidal daily rate, generated by thinning.
+
+    :param rate: Mean arrival rate (1/s).
+    :param amplitude: Relative rate swing, between 0 and 1.
+    :param period: Length of a day (s).
+    :param phase: Time of the rate peak within a period (s).
+    """
+
+    def __init__(self, rate: float, amplitude: float = 0.8, period: float = 24 * 60 * 60, phase: float = 0.):
+        super().__init__()
+        if not 0 <= amplitude <= 1:
+            raise ValueError("amplitude must be between 0 and 1")
+        self.rate = rate
+        self.amplitude = amplitude
+        self.period = period
+        self.phase = phase
+
+    def rate_at(self, times: np.ndarray) -> np.ndarray:
+        return self.rate * (1 + self.amplitude * np.cos(2 * math.pi * (times - self.phase) / self.period))
+
+    def next_times(self, rng, n):
+        max_rate = self.rate * (1 + self.amplitude)
+        chunks = []
+        count = 0
+        start = self.time
+        while count < n:
+            # Mean acceptance is 1 / (1 + amplitude), draw enough candidates for the remaining arrivals at once
+            size = int((n - count) * (1 + self.amplitude) * 1.1) + 16
+            candidates = start + np.cumsum(rng.exponential(1 / max_rate, size))
+            accepted = candidates[rng.random(size) * max_rate < self.rate_at(candidates)]
+            chunks.append(accepted)
+            count += len(accepted)
+            start = candidates[-1]
+
+        times = np.concatenate(chunks)[:n]
+        self.time = times[-1]
+        return times
+
+
+@dataclass
+class OrderBatch:
+    """Columnar batch of generated orders. Operations and TR counts of order `i` are
+    ``operations[offsets[i]:offsets[i + 1]]`` and ``tr_counts[offsets[i]:offsets[i + 1]]``.
+    """
+    times: np.ndarray  # float64, s
+    priorities: np.ndarray  # int8
+    offsets: np.ndarray  # int64, len(times) + 1
+    operations: np.ndarray  # uint8, `Operation.value`
+    tr_counts: np.ndarray  # uint8
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self) -> Iterator[OrderSpec]:
+        times, priorities, offsets = self.times.tolist(), self.priorities.tolist(), self.offsets.tolist()
+        operations, tr_counts = self.operations.tolist(), self.tr_counts.tolist()
+        for i, time in enumerate(times):
+            begin, end = offsets[i], offsets[i + 1]
+            yield (time, priorities[i], [OPERATIONS[value - 1] for value in operations[begin:end]],
+                   tr_counts[begin:end])
+
+
+class Workload:
+    """Generates orders: arrival times from an `ArrivalProcess`, contents from configured distributions.
+
+    :param arrivals: Arrival process.
+    :param operation_weights: Relative frequency of each `Operation`, uniform if None.
+    :param ops_per_order: Minimum and maximum number of operations in an order (uniform).
+    :param tr_count_weights: Relative frequency of each TR count needed for an operation.
+    :param express_share: Share of express orders.
+    :param seed: RNG seed, None for a random one.
+    :param chunk: Number of orders generated at a time when iterating.
+    """
+
+    def __init__(self, arrivals: ArrivalProcess, operation_weights: Optional[Dict[Operation, float]] = None,
+                 ops_per_order: Tuple[int, int] = (3, 10), tr_count_weights: Optional[Dict[int, float]] = None,
+                 express_share: float = 0., seed: Optional[int] = None, chunk: int = 1024):
+        self.arrivals = arrivals
+        self.rng = np.random.default_rng(seed)
+        self.chunk = chunk
+
+        weights = operation_weights or {}
+        self.op_values = np.array([op.value for op in OPERATIONS], dtype=np.uint8)
+        self.op_p = self._normalize([weights.get(op, 1. if operation_weights is None else 0.) for op in OPERATIONS])
+
+        self.ops_min, self.ops_max = ops_per_order
+        if not 1 <= self.ops_min <= self.ops_max:
+            raise ValueError(f"Bad ops_per_order: {ops_per_order}")
+
+        tr_count_weights = tr_count_weights or {3: 1.}
+        if min(tr_count_weights) < 1 or max(tr_count_weights) > MAX_TR_COUNT:
+            raise ValueError(f"TR count must be between 1 and {MAX_TR_COUNT}")
+        self.tr_values = np.array(list(tr_count_weights), dtype=np.uint8)
+        self.tr_p = self._normalize(list(tr_count_weights.values()))
+
+        self.express_share = express_share
+
+    @staticmethod
+    def _normalize(weights: List[float]) -> np.ndarray:
+        p = np.asarray(weights, dtype=float)
+        if (p < 0).any() or p.sum() <= 0:
+            raise ValueError(f"Bad weights: {weights}")
+        return p / p.sum()
+
+    def generate(self, n: int) -> OrderBatch:
+        """Generates next `n` orders.
+
+        :param n: Number of orders.
+        :return: Generated orders.
+        """
+        rng = self.rng
+        times = self.arrivals.next_times(rng, n)
+        counts = rng.integers(self.ops_min, self.ops_max + 1, size=n)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        total = int(offsets[-1])
+
+        operations = self.op_values[rng.choice(len(self.op_values), size=total, p=self.op_p)]
+        tr_counts = self.tr_values[rng.choice(len(self.tr_values), size=total, p=self.tr_p)]
+        priorities = np.where(rng.random(n) < self.express_share,
+                              settings.EXPRESS_PRIORITY, settings.EXPRESS_PRIORITY + 1).astype(np.int8)
+
+        return OrderBatch(times=times, priorities=priorities, offsets=offsets, operations=operations,
+                          tr_counts=tr_counts)
+
+    def __iter__(self) -> Iterator[OrderSpec]:
+        while True:
+            yield from self.generate(self.chunk)
+
+
+class TraceReplay:
+    """Replays orders from a trace file, read lazily.
+
+    Trace is a JSON lines file, one order per line:
+    ``{"time": 12.5, "priority": 1, "operations": ["DRILL", "MILL"], "tr_counts": [3, 1]}``.
+
+    :param path: Path to the trace file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def validate(self) -> 'TraceReplay':
+        """Checks the whole trace in a single pass, so a bad record fails the run at start instead of mid-run.
+
+        :return: self
+        :raises ValueError: if a record is invalid, with its line
+        """
+        for _ in self:
+            pass
+        return self
+
+    def __iter__(self) -> Iterator[OrderSpec]:
+        with open(self.path) as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    operations = [Operation[name] for name in record["operations"]]
+                    tr_counts = [int(count) for count in record["tr_counts"]]
+                    if len(operations) != len(tr_counts) or not operations:
+                        raise ValueError("operations and tr_counts must be non-empty and of equal length")
+                    if not all(1 <= count <= MAX_TR_COUNT for count in tr_counts):
+                        raise ValueError(f"tr_counts must be between 1 and {MAX_TR_COUNT}")
+                    yield float(record["time"]), int(record["priority"]), operations, tr_counts
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"{self.path}:{line_no}: bad order record: {e!r}") from e
+
+
+def save_trace(path: str, orders) -> None:
+    """Writes orders (e.g. an `OrderBatch` or `Workload` slice) to a trace file readable by `TraceReplay`.
+
+    :param path: Path to the trace file.
+    :param orders: Iterable of order specs.
+    """
+    with open(path, "w") as f:
+        for time, priority, operations, tr_counts in orders:
+            record = {"time": time, "priority": priority, "operations": [op.name for op in operations],
+                      "tr_counts": list(tr_counts)}
+            f.write(json.dumps(record) + "\n")
+
+
+def from_settings():
+    """Creates the workload configured in `settings`."""
+    if settings.WORKLOAD_TRACE is not None:
+        return TraceReplay(settings.WORKLOAD_TRACE).validate()
+
+    rate = 1 / settings.ORDER_PERIOD
+    if settings.ARRIVAL_PROCESS == 'periodic':
+        arrivals = PeriodicArrivals(settings.ORDER_PERIOD)
+    elif settings.ARRIVAL_PROCESS == 'poisson':
+        arrivals = PoissonArrivals(rate)
+    elif settings.ARRIVAL_PROCESS == 'mmpp':
+        arrivals = MMPPArrivals([rate * r for r in settings.MMPP_RATES], settings.MMPP_DWELL)
+    elif settings.ARRIVAL_PROCESS == 'diurnal':
+        arrivals = DiurnalArrivals(rate, settings.DIURNAL_AMPLITUDE, settings.DIURNAL_PERIOD)
+    else:
+        raise ValueError(f"Unknown arrival process: {settings.ARRIVAL_PROCESS}")
+
+    seed = settings.WORKLOAD_SEED if settings.WORKLOAD_SEED is not None else determinism.seed_for("workload")
+    return Workload(arrivals, operation_weights=settings.OPERATION_WEIGHTS, ops_per_order=settings.OPS_PER_ORDER,
+                    tr_count_weights=settings.TR_COUNT_WEIGHTS, express_share=settings.EXPRESS_ORDER_SHARE,
+                    seed=seed, chunk=settings.WORKLOAD_CHUNK)